@@ -1,13 +1,25 @@
 import hashlib
+import time
 import jwt
 from datetime import datetime, timedelta
+from typing import NamedTuple
 from fastapi import Depends, HTTPException
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from app.config.settings import SECRET_KEY, ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES
+from app.database.connection import db_connection
+from app.utils.cache import LRUCache
+from app.config.settings import SECRET_KEY, ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES, TOKEN_CACHE_SIZE
 
 
 security = HTTPBearer()
 
+# Decoded tokens, each kept until the token itself expires
+_token_cache = LRUCache(maxsize=TOKEN_CACHE_SIZE)
+
+
+class CurrentUser(NamedTuple):
+    id: int
+    username: str
+
 
 def hash_password(password: str) -> str:
     """Hash password using SHA256"""
@@ -23,15 +35,54 @@ def create_access_token(data: dict):
     return encoded_jwt
 
 
-def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
-    """Get current user from JWT token"""
+def _lookup_user_id(username: str) -> int:
+    """Resolve the user id for tokens issued before they carried a `uid` claim"""
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT id FROM users WHERE username = ?", (username,))
+        user = cursor.fetchone()
+    if not user:
+        raise HTTPException(status_code=401, detail="Invalid authentication credentials")
+    return user["id"]
+
+
+def decode_current_user(token: str) -> CurrentUser:
+    """Decode a JWT access token into the user it was issued to, cached until it expires"""
+    current_user = _token_cache.get(token)
+    if current_user is not None:
+        return current_user
+
     try:
-        payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise HTTPException(status_code=401, detail="Invalid authentication credentials")
-        return username
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token expired")
     except jwt.PyJWTError:
         raise HTTPException(status_code=401, detail="Invalid authentication credentials")
+
+    username = payload.get("sub")
+    if username is None:
+        raise HTTPException(status_code=401, detail="Invalid authentication credentials")
+    user_id = payload.get("uid")
+    if user_id is None:
+        user_id = _lookup_user_id(username)
+
+    current_user = CurrentUser(id=user_id, username=username)
+    ttl = payload["exp"] - time.time() if "exp" in payload else None
+    if ttl is None or ttl > 0:
+        _token_cache.set(token, current_user, ttl=ttl)
+    return current_user
+
+
+def decode_access_token(token: str) -> str:
+    """Decode a JWT access token and return the username it was issued to"""
+    return decode_current_user(token).username
+
+
+def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    """Get current user from JWT token"""
+    return decode_current_user(credentials.credentials).username
+
+
+def get_current_identity(credentials: HTTPAuthorizationCredentials = Depends(security)) -> CurrentUser:
+    """Get the id and username of the current user from the JWT token, without a database lookup"""
+    return decode_current_user(credentials.credentials)
@@ -7,6 +7,7 @@ load_dotenv()
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-change-this")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))  # Decoded access tokens kept per worker
 
 # Database settings
 DATABASE_URL = os.getenv("DATABASE_URL", "postgresql://localhost/ai_escape_room")
@@ -16,3 +17,110 @@ DATABASE_PATH = "game.db"  # Keep for backward compatibility during migration
 API_TITLE = "Prompt Injection Escape Game API"
 API_DESCRIPTION = "Social engineering game with AI characters"
 API_VERSION = "1.0.0"
+
+# LLM settings
+OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+LLM_TEMPERATURE = 0.8
+LLM_MAX_TOKENS = 150
+LLM_MAX_RETRIES = 2
+LLM_REQUEST_TIMEOUT = float(os.getenv("LLM_REQUEST_TIMEOUT", "30"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "32"))  # In-flight completions per worker
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "64"))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "32"))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "60"))
+
+# LLM backend: "openai" for the real API, "stub" for the offline stand-in used in load tests
+LLM_BACKEND = os.getenv("LLM_BACKEND", "openai").lower()
+STUB_LLM_LATENCY = os.getenv("STUB_LLM_LATENCY", "lognormal:600:0.5")  # fixed:MS | uniform:LO:HI | lognormal:MEDIAN:SIGMA | replay:FILE
+STUB_LLM_LEAK_RATE = float(os.getenv("STUB_LLM_LEAK_RATE", "0.3"))  # Share of replies that reveal a stage key
+STUB_LLM_SEED = int(os.getenv("STUB_LLM_SEED", "0"))
+
+# Exploitation profile cache (per worker)
+EXPLOITATION_PROFILE_CACHE_SIZE = int(os.getenv("EXPLOITATION_PROFILE_CACHE_SIZE", "1024"))
+EXPLOITATION_PROFILE_CACHE_TTL = float(os.getenv("EXPLOITATION_PROFILE_CACHE_TTL", "300"))  # seconds
+
+# Character completion cache: in-process LRU plus an optional SQLite file shared by the workers on a host
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "false").lower() == "true"
+LLM_CACHE_MEMORY_SIZE = int(os.getenv("LLM_CACHE_MEMORY_SIZE", "2048"))  # Keys kept in memory per worker
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "86400"))  # seconds
+LLM_CACHE_VARIANTS = int(os.getenv("LLM_CACHE_VARIANTS", "3"))  # Replies stored per key before serving from cache
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "llm_cache.db")  # Empty for memory only
+
+# Idempotency-Key responses kept for replay (per worker)
+IDEMPOTENCY_KEY_TTL = float(os.getenv("IDEMPOTENCY_KEY_TTL", "600"))  # seconds
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "10000"))
+
+# Compare-and-swap session saves: how often a turn that lost a race is replayed before answering 409
+SESSION_SAVE_RETRIES = int(os.getenv("SESSION_SAVE_RETRIES", "3"))
+
+# Hot session store: active game sessions kept in memory and checkpointed to game_sessions in batches.
+# Off by default: turns already answered are only in memory until the next checkpoint, and a checkpoint
+# that loses its compare-and-swap to another worker discards them. Enable it only with a single worker,
+# or when a load balancer routes each session's requests to the same worker (sticky sessions).
+SESSION_STORE_ENABLED = os.getenv("SESSION_STORE_ENABLED", "false").lower() == "true"
+SESSION_STORE_SIZE = int(os.getenv("SESSION_STORE_SIZE", "2048"))  # sessions per worker
+SESSION_STORE_CHECKPOINT_INTERVAL = float(os.getenv("SESSION_STORE_CHECKPOINT_INTERVAL", "5"))  # seconds
+SESSION_STORE_IDLE_TTL = float(os.getenv("SESSION_STORE_IDLE_TTL", "900"))  # seconds without a turn before write-back
+
+# Stage catalog and per-session snapshots for the 'hint'/'keys' commands
+STAGE_CATALOG_MAX_AGE = int(os.getenv("STAGE_CATALOG_MAX_AGE", "3600"))  # Cache-Control max-age, seconds
+SESSION_SNAPSHOT_CACHE_SIZE = int(os.getenv("SESSION_SNAPSHOT_CACHE_SIZE", "4096"))
+SESSION_SNAPSHOT_CACHE_TTL = float(os.getenv("SESSION_SNAPSHOT_CACHE_TTL", "600"))  # seconds
+
+# Public /leaderboard and /stats/global cache (per worker, stale-while-revalidate)
+PUBLIC_STATS_TTL = float(os.getenv("PUBLIC_STATS_TTL", "10"))  # seconds before a reload is triggered
+PUBLIC_STATS_MAX_STALE = float(os.getenv("PUBLIC_STATS_MAX_STALE", "300"))  # oldest value served while reloading
+LEADERBOARD_CACHE_MAX_LIMIT = int(os.getenv("LEADERBOARD_CACHE_MAX_LIMIT", "100"))  # larger pages skip the cache
+
+# Sampled structured logs (fraction of hot-path events written; 1 logs every event)
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "0.01"))
+
+# Tournament WebSocket fan-out
+WS_SEND_QUEUE_SIZE = int(os.getenv("WS_SEND_QUEUE_SIZE", "64"))  # Frames queued per connection
+WS_SLOW_CONSUMER_POLICY = os.getenv("WS_SLOW_CONSUMER_POLICY", "coalesce").lower()  # coalesce | drop_oldest | disconnect
+WS_SEND_TIMEOUT = float(os.getenv("WS_SEND_TIMEOUT", "5"))  # seconds a single frame may take to send
+WS_HEARTBEAT_INTERVAL = float(os.getenv("WS_HEARTBEAT_INTERVAL", "15"))  # seconds
+WS_HEARTBEAT_TIMEOUT = float(os.getenv("WS_HEARTBEAT_TIMEOUT", "45"))  # evict after this long without traffic
+
+# Cross-worker tournament broadcasts
+BROADCAST_BACKEND = os.getenv("BROADCAST_BACKEND", "memory").lower()  # memory | postgres | socket
+BROADCAST_CHANNEL = os.getenv("BROADCAST_CHANNEL", "tournament_events")  # NOTIFY channel (postgres)
+BROADCAST_SOCKET_DIR = os.getenv("BROADCAST_SOCKET_DIR", "/tmp/ai-escape-room-bus")  # one socket per worker (socket)
+
+# Tournament deadlines
+TOURNAMENT_WAITING_TTL = float(os.getenv("TOURNAMENT_WAITING_TTL", "1800"))  # seconds a room may wait to start
+TOURNAMENT_CLOSE_GRACE = float(os.getenv("TOURNAMENT_CLOSE_GRACE", "30"))  # seconds before a finished room's sockets close
+
+# SQLite connection pool
+SQLITE_POOL_SIZE = int(os.getenv("SQLITE_POOL_SIZE", "16"))
+SQLITE_POOL_MAX_OVERFLOW = int(os.getenv("SQLITE_POOL_MAX_OVERFLOW", "16"))
+SQLITE_POOL_TIMEOUT = float(os.getenv("SQLITE_POOL_TIMEOUT", "30"))  # seconds to wait for a free connection
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", str(16 * 1024)))
+
+# PostgreSQL connection pool (SQLAlchemy QueuePool)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # seconds
+
+# Write-behind queue for audit inserts (exploitation history, tournament events)
+WRITE_BEHIND_BATCH_SIZE = int(os.getenv("WRITE_BEHIND_BATCH_SIZE", "100"))
+WRITE_BEHIND_FLUSH_INTERVAL = float(os.getenv("WRITE_BEHIND_FLUSH_INTERVAL", "1.0"))  # seconds
+WRITE_BEHIND_MAX_DEPTH = int(os.getenv("WRITE_BEHIND_MAX_DEPTH", "5000"))  # writers flush inline beyond this
+
+# Admission control: token buckets per user (JWT sub) and per client IP
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory").lower()  # "memory" or "database" (shared by workers)
+RATE_LIMIT_TRUST_PROXY = os.getenv("RATE_LIMIT_TRUST_PROXY", "false").lower() == "true"  # key IPs by X-Forwarded-For
+RATE_LIMIT_USER_RPS = float(os.getenv("RATE_LIMIT_USER_RPS", "10"))
+RATE_LIMIT_USER_BURST = float(os.getenv("RATE_LIMIT_USER_BURST", "40"))
+RATE_LIMIT_IP_RPS = float(os.getenv("RATE_LIMIT_IP_RPS", "50"))
+RATE_LIMIT_IP_BURST = float(os.getenv("RATE_LIMIT_IP_BURST", "200"))
+# Routes that call the LLM (game messages, tournament answers) have their own, tighter buckets
+RATE_LIMIT_LLM_USER_RPS = float(os.getenv("RATE_LIMIT_LLM_USER_RPS", "0.5"))
+RATE_LIMIT_LLM_USER_BURST = float(os.getenv("RATE_LIMIT_LLM_USER_BURST", "10"))
+RATE_LIMIT_LLM_IP_RPS = float(os.getenv("RATE_LIMIT_LLM_IP_RPS", "5"))
+RATE_LIMIT_LLM_IP_BURST = float(os.getenv("RATE_LIMIT_LLM_IP_BURST", "50"))
+LLM_SATURATED_RETRY_AFTER = int(os.getenv("LLM_SATURATED_RETRY_AFTER", "2"))  # seconds
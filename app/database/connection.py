@@ -1,30 +1,242 @@
+import queue
 import sqlite3
 import os
+import threading
+import time
+from contextlib import contextmanager
+
+from app.database.migrations import run_migrations
+from app.utils.metrics import observe_query
+from app.config.settings import (
+    DATABASE_PATH, SQLITE_POOL_SIZE, SQLITE_POOL_MAX_OVERFLOW, SQLITE_POOL_TIMEOUT,
+    SQLITE_BUSY_TIMEOUT_MS, SQLITE_MMAP_SIZE, SQLITE_CACHE_SIZE_KB
+)
+
+
+class TimedCursor:
+    """sqlite3 cursor whose execute/executemany are recorded in the db_query_duration_seconds histogram"""
+
+    def __init__(self, cursor: sqlite3.Cursor):
+        self._cursor = cursor
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def execute(self, query, params=()):
+        started = time.perf_counter()
+        try:
+            self._cursor.execute(query, params)
+        finally:
+            observe_query(query, started)
+        return self
+
+    def executemany(self, query, seq_of_params):
+        started = time.perf_counter()
+        try:
+            self._cursor.executemany(query, seq_of_params)
+        finally:
+            observe_query(query, started)
+        return self
+
+
+class PooledConnection:
+    """A pooled sqlite3 connection; close() hands it back to the pool instead of closing it"""
+
+    def __init__(self, pool: "SQLitePool", conn: sqlite3.Connection, overflow: bool = False):
+        self._pool = pool
+        self._conn = conn
+        self._overflow = overflow
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            raise sqlite3.ProgrammingError("Cannot operate on a connection returned to the pool")
+        return self._conn
+
+    def __getattr__(self, name):
+        return getattr(self._connection(), name)
+
+    def cursor(self) -> TimedCursor:
+        return TimedCursor(self._connection().cursor())
+
+    def execute(self, query, params=()) -> TimedCursor:
+        return self.cursor().execute(query, params)
+
+    def executemany(self, query, seq_of_params) -> TimedCursor:
+        return self.cursor().executemany(query, seq_of_params)
+
+    def close(self):
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            self._pool.release(conn, self._overflow)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+class SQLitePool:
+    """Bounded, thread-safe pool of SQLite connections tuned for concurrent readers.
+
+    Up to `size` connections are kept open; when they are all checked out, up to
+    `max_overflow` extra connections are opened and closed again on return.
+    Beyond that, callers wait up to `timeout` seconds for a connection.
+    """
+
+    def __init__(self, path: str, size: int, max_overflow: int = 0, timeout: float = 30.0):
+        self.path = path
+        self.size = size
+        self.max_overflow = max_overflow
+        self.timeout = timeout
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._opened = 0
+        self._overflow = 0
+
+    def _create_connection(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=SQLITE_BUSY_TIMEOUT_MS / 1000, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode = WAL")  # Readers no longer block on writers
+        conn.execute("PRAGMA synchronous = NORMAL")  # Safe with WAL, far fewer fsyncs
+        conn.execute(f"PRAGMA busy_timeout = {SQLITE_BUSY_TIMEOUT_MS}")
+        conn.execute(f"PRAGMA mmap_size = {SQLITE_MMAP_SIZE}")
+        conn.execute(f"PRAGMA cache_size = -{SQLITE_CACHE_SIZE_KB}")  # Negative value = KiB
+        conn.execute("PRAGMA temp_store = MEMORY")
+        return conn
+
+    def acquire(self) -> PooledConnection:
+        """Check out a connection, opening a new one if the pool has room"""
+        try:
+            return PooledConnection(self, self._idle.get_nowait())
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            if self._opened < self.size:
+                self._opened += 1
+                overflow = False
+            elif self._overflow < self.max_overflow:
+                self._overflow += 1
+                overflow = True
+            else:
+                overflow = None
+
+        if overflow is None:
+            try:
+                return PooledConnection(self, self._idle.get(timeout=self.timeout))
+            except queue.Empty:
+                raise RuntimeError(f"SQLite connection pool exhausted after waiting {self.timeout}s")
+
+        try:
+            return PooledConnection(self, self._create_connection(), overflow)
+        except Exception:
+            with self._lock:
+                if overflow:
+                    self._overflow -= 1
+                else:
+                    self._opened -= 1
+            raise
+
+    def release(self, conn: sqlite3.Connection, overflow: bool = False):
+        """Return a connection, discarding any transaction the caller left open"""
+        healthy = True
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            healthy = False
+
+        if overflow or not healthy:
+            conn.close()
+            with self._lock:
+                if overflow:
+                    self._overflow -= 1
+                else:
+                    self._opened -= 1
+        else:
+            self._idle.put(conn)
+
+    def close_all(self):
+        """Close idle connections (called on application shutdown)"""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._opened -= 1
+
+
+_sqlite_pool = None
+_sqlite_pool_lock = threading.Lock()
+
+
+def get_sqlite_pool() -> SQLitePool:
+    """Get the process-wide SQLite pool, creating it on first use"""
+    global _sqlite_pool
+
+    if _sqlite_pool is None:
+        with _sqlite_pool_lock:
+            if _sqlite_pool is None:
+                _sqlite_pool = SQLitePool(
+                    DATABASE_PATH, SQLITE_POOL_SIZE, SQLITE_POOL_MAX_OVERFLOW, SQLITE_POOL_TIMEOUT
+                )
+    return _sqlite_pool
+
+
+def is_postgresql() -> bool:
+    """Whether the PostgreSQL backend is selected"""
+    return os.getenv("USE_POSTGRESQL", "false").lower() == "true"
+
+
+def close_db_pool():
+    """Close pooled database connections"""
+    if is_postgresql():
+        from app.database.postgresql import dispose_engine
+        dispose_engine()
+    elif _sqlite_pool is not None:
+        _sqlite_pool.close_all()
 
 
 def get_db():
-    """Get database connection with row factory"""
+    """Get database connection with row factory; close() returns it to the pool"""
     # Check if we should use PostgreSQL
-    if os.getenv("USE_POSTGRESQL", "false").lower() == "true":
-        from database.postgresql import get_db_raw
-        return get_db_raw()
+    if is_postgresql():
+        from app.database.postgresql import get_pg_connection
+        return get_pg_connection()
 
     # Default to SQLite for backward compatibility
-    conn = sqlite3.connect("game.db")
-    conn.row_factory = sqlite3.Row
-    return conn
+    return get_sqlite_pool().acquire()
+
+
+@contextmanager
+def db_connection():
+    """Check out a database connection for the duration of a with-block"""
+    conn = get_db()
+    try:
+        yield conn
+    finally:
+        conn.close()
 
 
 def init_db():
     """Initialize database tables"""
     # Check if we should use PostgreSQL
-    if os.getenv("USE_POSTGRESQL", "false").lower() == "true":
-        from database.postgresql import init_postgresql_db
+    if is_postgresql():
+        from app.database.postgresql import init_postgresql_db
         init_postgresql_db()
+        with get_db() as conn:
+            run_migrations(conn, "postgresql")
         return
 
     # Default to SQLite for backward compatibility
-    conn = sqlite3.connect("game.db")
+    conn = get_db()
     cursor = conn.cursor()
 
     # Users table
@@ -50,7 +262,6 @@ def init_db():
             score INTEGER DEFAULT 0,
             attempts INTEGER DEFAULT 0,
             extracted_keys TEXT DEFAULT '[]',
-            conversation_history TEXT DEFAULT '[]',
             character_mood TEXT DEFAULT 'helpful',
             resistance_level INTEGER DEFAULT 1,
             failed_attempts INTEGER DEFAULT 0,
@@ -172,10 +383,21 @@ def init_db():
             keys_extracted TEXT, -- JSON array of extracted keys
             conversation_context TEXT, -- JSON of full conversation leading to success
             exploitation_technique TEXT, -- categorized technique used
+            minhash_signature TEXT, -- MinHash of the normalized prompt for near-duplicate lookups
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             FOREIGN KEY (user_id) REFERENCES users (id)
         )
     """)
 
+    # Add minhash_signature column if it doesn't exist (for existing databases)
+    try:
+        cursor.execute("ALTER TABLE prompt_exploitation_history ADD COLUMN minhash_signature TEXT")
+    except sqlite3.OperationalError:
+        # Column already exists
+        pass
+
     conn.commit()
+
+    # Apply versioned migrations (indexes and later schema changes)
+    run_migrations(conn, "sqlite")
     conn.close()
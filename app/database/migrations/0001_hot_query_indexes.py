@@ -0,0 +1,23 @@
+"""Indexes for the predicates hit on every game, stats and tournament request"""
+
+_INDEXES = [
+    # Resume lookup: WHERE user_id = ? AND game_over = FALSE ORDER BY updated_at DESC
+    "CREATE INDEX IF NOT EXISTS idx_game_sessions_user_active ON game_sessions (user_id, game_over, updated_at)",
+    # Latest session per user (leaderboard) and /user/games: WHERE user_id = ? ORDER BY updated_at DESC
+    "CREATE INDEX IF NOT EXISTS idx_game_sessions_user_updated ON game_sessions (user_id, updated_at)",
+    # Exploitation history per stage: WHERE user_id = ? AND stage = ? ORDER BY created_at DESC
+    "CREATE INDEX IF NOT EXISTS idx_exploitation_user_stage ON prompt_exploitation_history (user_id, stage, created_at)",
+    # Exploitation profile: WHERE user_id = ? ORDER BY created_at DESC
+    "CREATE INDEX IF NOT EXISTS idx_exploitation_user_created ON prompt_exploitation_history (user_id, created_at)",
+    # Tournament sessions by tournament (leaderboards, submit-answer) and by participant (joins)
+    "CREATE INDEX IF NOT EXISTS idx_tgs_tournament ON tournament_game_sessions (tournament_id, status)",
+    "CREATE INDEX IF NOT EXISTS idx_tgs_participant ON tournament_game_sessions (participant_id)",
+    # Tournament event log: WHERE tournament_id = ? ORDER BY created_at
+    "CREATE INDEX IF NOT EXISTS idx_tournament_events_tournament ON tournament_events (tournament_id, created_at)",
+    # Per-user results
+    "CREATE INDEX IF NOT EXISTS idx_game_results_user ON game_results (user_id)",
+]
+
+SQLITE = _INDEXES + ["ANALYZE"]
+
+POSTGRESQL = _INDEXES + ["ANALYZE"]
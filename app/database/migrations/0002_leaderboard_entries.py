@@ -0,0 +1,122 @@
+"""Materialized leaderboard table, backfilled from each player's latest session"""
+import json
+
+# The stage keys and ranking rules as they were when this migration was written. They are
+# copied rather than imported so replaying it on a fresh database always does the same thing.
+STAGE_KEYS = {
+    1: ("ACCESS_TOKEN_2024", "USER_PERMISSIONS_ADMIN", "SESSION_ID_X7K9M2"),
+    2: ("SECURITY_CLEARANCE_BETA_9", "DOOR_CODE_4472_VAULT", "BACKUP_KEY_ZULU_ECHO_7"),
+    3: ("SYSTEM_ROOT_ACCESS_CMD_88", "DATABASE_CONN_STRING_PROD", "API_SECRET_KEY_MAINTENANCE"),
+    4: ("QUANTUM_ENCRYPTION_KEY_ALPHA", "BIOMETRIC_OVERRIDE_CODE_777", "NEURAL_NETWORK_PASSWORD_SIGMA"),
+    5: ("ULTIMATE_MASTER_KEY_OMEGA", "FINAL_CIPHER_LOCKDOWN_999", "SYSTEM_CORE_ACCESS_INFINITY"),
+}
+KEY_STAGE = {key: stage for stage, keys in STAGE_KEYS.items() for key in keys}
+
+INSERT_ENTRY = """
+    INSERT INTO leaderboard_entries (
+        user_id, session_id, current_stage, stages_completed, keys_found,
+        total_keys_possible, score, completion_status, sort_score, last_active
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP))
+    ON CONFLICT (user_id) DO NOTHING
+"""
+
+SQLITE = [
+    """
+    CREATE TABLE IF NOT EXISTS leaderboard_entries (
+        user_id INTEGER PRIMARY KEY,
+        session_id TEXT,
+        current_stage INTEGER DEFAULT 1,
+        stages_completed INTEGER DEFAULT 0,
+        keys_found INTEGER DEFAULT 0,
+        total_keys_possible INTEGER DEFAULT 0,
+        score INTEGER DEFAULT 0, -- display score
+        completion_status TEXT DEFAULT 'active', -- active, completed, abandoned
+        sort_score INTEGER DEFAULT 0, -- ranking key, highest first
+        last_active TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES users (id)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_leaderboard_rank ON leaderboard_entries (sort_score, last_active, user_id)",
+]
+
+POSTGRESQL = [
+    """
+    CREATE TABLE IF NOT EXISTS leaderboard_entries (
+        user_id INTEGER PRIMARY KEY,
+        session_id VARCHAR(255),
+        current_stage INTEGER DEFAULT 1,
+        stages_completed INTEGER DEFAULT 0,
+        keys_found INTEGER DEFAULT 0,
+        total_keys_possible INTEGER DEFAULT 0,
+        score INTEGER DEFAULT 0,
+        completion_status VARCHAR(20) DEFAULT 'active',
+        sort_score INTEGER DEFAULT 0,
+        last_active TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES users (id)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_leaderboard_rank ON leaderboard_entries (sort_score DESC, last_active DESC, user_id DESC)",
+]
+
+
+def upgrade(conn, dialect):
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT
+            u.id AS user_id,
+            u.created_at,
+            gs.id AS session_id,
+            gs.stage,
+            gs.score,
+            gs.extracted_keys,
+            gs.game_over,
+            gs.success,
+            gs.updated_at
+        FROM users u
+        LEFT JOIN game_sessions gs ON gs.id = (
+            SELECT gs2.id FROM game_sessions gs2
+            WHERE gs2.user_id = u.id
+            ORDER BY gs2.updated_at DESC
+            LIMIT 1
+        )
+    """)
+
+    for row in cursor.fetchall():
+        if row["session_id"] is None:
+            # Registered players without a session rank below everyone who has played
+            cursor.execute(INSERT_ENTRY, (row["user_id"], None, 1, 0, 0, len(STAGE_KEYS[1]), 0, "active", 0,
+                                          row["created_at"]))
+            continue
+
+        try:
+            extracted_keys = json.loads(row["extracted_keys"])
+        except (json.JSONDecodeError, TypeError):
+            extracted_keys = []
+
+        entry = _leaderboard_entry(row["stage"], row["score"], extracted_keys, bool(row["game_over"]),
+                                   bool(row["success"]))
+        cursor.execute(INSERT_ENTRY, (row["user_id"], row["session_id"], *entry, row["updated_at"]))
+
+
+def _leaderboard_entry(stage, score, extracted_keys, game_over, success):
+    """(current_stage, stages_completed, keys_found, total_keys_possible, score, completion_status, sort_score)"""
+    current_stage = max(1, stage)
+    if game_over and success:
+        return current_stage, len(STAGE_KEYS), len(extracted_keys), len(KEY_STAGE), score, "completed", 1000000 + score
+
+    found_by_stage = {}
+    for key in extracted_keys:
+        if key in KEY_STAGE:
+            found_by_stage.setdefault(KEY_STAGE[key], []).append(key)
+    stages_completed = sum(1 for stage_num, found in found_by_stage.items() if len(found) == len(STAGE_KEYS[stage_num]))
+
+    if game_over:
+        # Abandoned players get reduced score based on progress
+        display_score = int(score * sum(0.8 ** (i - 1) for i in range(1, current_stage)))
+        completion_status = "abandoned"
+    else:
+        display_score = score
+        completion_status = "active"
+
+    return (current_stage, stages_completed, len(found_by_stage.get(current_stage, [])),
+            len(STAGE_KEYS.get(current_stage, ())), display_score, completion_status, stage * 100000 + score)
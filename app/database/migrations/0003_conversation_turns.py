@@ -0,0 +1,108 @@
+"""Move conversation history from JSON columns into the append-only conversation_turns table"""
+import json
+
+SQLITE = [
+    """
+    CREATE TABLE IF NOT EXISTS conversation_turns (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        session_id TEXT NOT NULL, -- game_sessions.id or tournament_game_sessions.id
+        seq INTEGER NOT NULL, -- 1-based position within the session
+        stage INTEGER,
+        user_message TEXT,
+        assistant_message TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    "CREATE UNIQUE INDEX IF NOT EXISTS idx_conversation_turns_session_seq ON conversation_turns (session_id, seq)",
+]
+
+POSTGRESQL = [
+    """
+    CREATE TABLE IF NOT EXISTS conversation_turns (
+        id SERIAL PRIMARY KEY,
+        session_id VARCHAR(255) NOT NULL,
+        seq INTEGER NOT NULL,
+        stage INTEGER,
+        user_message TEXT,
+        assistant_message TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    "CREATE UNIQUE INDEX IF NOT EXISTS idx_conversation_turns_session_seq ON conversation_turns (session_id, seq)",
+]
+
+
+def _has_column(cursor, dialect, table, column) -> bool:
+    if dialect == "postgresql":
+        cursor.execute("""
+            SELECT 1 FROM information_schema.columns
+            WHERE table_name = ? AND column_name = ?
+        """, (table, column))
+        return cursor.fetchone() is not None
+
+    cursor.execute(f"PRAGMA table_info({table})")
+    return any(row["name"] == column for row in cursor.fetchall())
+
+
+def _messages_to_turns(messages):
+    """Pair a flat message list into (user_message, assistant_message) turns.
+
+    Kept here rather than imported so replaying this migration never depends on
+    application code that may have changed since it was written.
+    """
+    turns = []
+    pending_user = None
+    for message in messages:
+        if message.get("role") == "user":
+            if pending_user is not None:
+                turns.append((pending_user, None))
+            pending_user = message.get("content")
+        else:
+            turns.append((pending_user, message.get("content")))
+            pending_user = None
+    if pending_user is not None:
+        turns.append((pending_user, None))
+    return turns
+
+
+def _insert_turns(cursor, session_id, stage, messages):
+    for seq, (user_message, assistant_message) in enumerate(_messages_to_turns(messages), 1):
+        cursor.execute("""
+            INSERT INTO conversation_turns (session_id, seq, stage, user_message, assistant_message)
+            VALUES (?, ?, ?, ?, ?)
+        """, (session_id, seq, stage, user_message, assistant_message))
+
+
+def upgrade(conn, dialect):
+    cursor = conn.cursor()
+
+    if _has_column(cursor, dialect, "game_sessions", "conversation_history"):
+        cursor.execute("""
+            SELECT id, stage, conversation_history FROM game_sessions
+            WHERE conversation_history IS NOT NULL AND conversation_history != '[]'
+        """)
+        for row in cursor.fetchall():
+            try:
+                messages = json.loads(row["conversation_history"])
+            except (json.JSONDecodeError, TypeError):
+                continue
+            _insert_turns(cursor, row["id"], row["stage"], messages)
+
+        cursor.execute("ALTER TABLE game_sessions DROP COLUMN conversation_history")
+
+    cursor.execute("""
+        SELECT id, stage, session_data FROM tournament_game_sessions
+        WHERE session_data IS NOT NULL
+    """)
+    for row in cursor.fetchall():
+        try:
+            session_data = json.loads(row["session_data"])
+        except (json.JSONDecodeError, TypeError):
+            continue
+        if "conversation_history" not in session_data:
+            continue
+
+        _insert_turns(cursor, row["id"], row["stage"], session_data.pop("conversation_history") or [])
+        cursor.execute("""
+            UPDATE tournament_game_sessions SET session_data = ? WHERE id = ?
+        """, (json.dumps(session_data), row["id"]))
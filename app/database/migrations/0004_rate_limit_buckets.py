@@ -0,0 +1,23 @@
+"""Shared token buckets for admission control across workers (RATE_LIMIT_BACKEND=database)"""
+
+SQLITE = [
+    """
+    CREATE TABLE IF NOT EXISTS rate_limit_buckets (
+        bucket_key TEXT PRIMARY KEY, -- e.g. "llm:user:alice", "all:ip:10.0.0.1"
+        tokens REAL NOT NULL,
+        updated_at REAL NOT NULL, -- unix time of the last request
+        admitted INTEGER DEFAULT 1 -- whether the last request got a token
+    )
+    """,
+]
+
+POSTGRESQL = [
+    """
+    CREATE TABLE IF NOT EXISTS rate_limit_buckets (
+        bucket_key VARCHAR(255) PRIMARY KEY,
+        tokens DOUBLE PRECISION NOT NULL,
+        updated_at DOUBLE PRECISION NOT NULL,
+        admitted INTEGER DEFAULT 1
+    )
+    """,
+]
@@ -0,0 +1,11 @@
+"""Per-tournament sequence numbers on broadcast events, so WebSocket clients can resume after a gap"""
+
+_STATEMENTS = [
+    # NULL for audit-only rows (answer_submitted); broadcasts are numbered 1, 2, 3... per tournament
+    "ALTER TABLE tournament_events ADD COLUMN seq INTEGER",
+    "CREATE UNIQUE INDEX IF NOT EXISTS idx_tournament_events_seq ON tournament_events (tournament_id, seq)",
+]
+
+SQLITE = _STATEMENTS
+
+POSTGRESQL = _STATEMENTS
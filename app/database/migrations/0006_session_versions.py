@@ -0,0 +1,10 @@
+"""Row versions on game sessions, for compare-and-swap saves of concurrent turns"""
+
+_STATEMENTS = [
+    "ALTER TABLE game_sessions ADD COLUMN version INTEGER NOT NULL DEFAULT 0",
+    "ALTER TABLE tournament_game_sessions ADD COLUMN version INTEGER NOT NULL DEFAULT 0",
+]
+
+SQLITE = _STATEMENTS
+
+POSTGRESQL = _STATEMENTS
@@ -0,0 +1,75 @@
+"""
+Versioned schema migrations.
+
+Each migration is a module in this package named `NNNN_description.py`. It
+defines the statements to run as `SQLITE` and `POSTGRESQL` lists and may also
+define `upgrade(conn, dialect)` for data changes that need Python. Applied
+versions are recorded in the `schema_version` table, and run_migrations()
+applies the pending ones in order, each in its own transaction.
+"""
+import importlib
+import logging
+import os
+import re
+
+logger = logging.getLogger(__name__)
+
+_MIGRATION_FILE_RE = re.compile(r"^(\d{4})_(\w+)\.py$")
+
+
+def discover_migrations():
+    """Return (version, name, module) for every migration in this package, in order"""
+    migrations = []
+    for filename in sorted(os.listdir(os.path.dirname(__file__))):
+        match = _MIGRATION_FILE_RE.match(filename)
+        if not match:
+            continue
+        module = importlib.import_module(f"{__name__}.{filename[:-3]}")
+        migrations.append((int(match.group(1)), match.group(2), module))
+    return migrations
+
+
+def get_schema_version(conn) -> int:
+    cursor = conn.cursor()
+    cursor.execute("SELECT MAX(version) AS version FROM schema_version")
+    row = cursor.fetchone()
+    return (row["version"] if row else None) or 0
+
+
+def run_migrations(conn, dialect: str):
+    """Apply pending migrations for the given dialect ("sqlite" or "postgresql")"""
+    cursor = conn.cursor()
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    conn.commit()
+
+    if dialect == "postgresql":
+        # Serialize migrations across workers starting at the same time
+        cursor.execute("SELECT pg_advisory_lock(727274)")
+
+    try:
+        current = get_schema_version(conn)
+        for version, name, module in discover_migrations():
+            if version <= current:
+                continue
+
+            logger.info(f"Applying migration {version:04d}_{name}")
+            try:
+                for statement in getattr(module, dialect.upper(), []):
+                    cursor.execute(statement)
+                if hasattr(module, "upgrade"):
+                    module.upgrade(conn, dialect)
+                cursor.execute("INSERT INTO schema_version (version, name) VALUES (?, ?)", (version, name))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+    finally:
+        if dialect == "postgresql":
+            cursor.execute("SELECT pg_advisory_unlock(727274)")
+            conn.commit()
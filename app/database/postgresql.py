@@ -1,17 +1,42 @@
+import re
+import time
+from datetime import date, datetime
+from functools import lru_cache
+
 from sqlalchemy import create_engine, text, Column, Integer, String, Text, Boolean, DateTime, ForeignKey
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, Session
 from sqlalchemy.sql import func
-from config.settings import DATABASE_URL
+from app.config.settings import DATABASE_URL, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE
+from app.utils.metrics import observe_query
 import logging
 
 logger = logging.getLogger(__name__)
 
-# Create SQLAlchemy engine
-engine = create_engine(DATABASE_URL, echo=False)
+# Create SQLAlchemy engine. Its QueuePool hands out the DBAPI connections used by the routes.
+engine = create_engine(
+    DATABASE_URL,
+    echo=False,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_recycle=DB_POOL_RECYCLE,
+    pool_pre_ping=True
+)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+# Tables with SERIAL ids; INSERTs into them get RETURNING id so cursor.lastrowid works
+SERIAL_ID_TABLES = {
+    "users", "game_results", "tournament_participants", "tournament_events", "prompt_exploitation_history"
+}
+
+_INSERT_TABLE_RE = re.compile(r"^\s*INSERT\s+INTO\s+(\w+)", re.IGNORECASE)
+_RETURNING_RE = re.compile(r"\bRETURNING\b", re.IGNORECASE)
+_STRING_LITERAL_RE = re.compile(r"'[^']*'")
+# On its own line so a trailing `--` comment in the query can't swallow it
+_RETURNING_ID = "\nRETURNING id"
+
 
 def get_db() -> Session:
     """Get database session"""
@@ -22,64 +47,188 @@ def get_db() -> Session:
         db.close()
 
 
-def get_db_raw():
-    """Get raw database connection with dict-like row access for backward compatibility"""
-    class DictRow:
-        def __init__(self, row, columns):
-            self._row = row
-            self._columns = columns
-
-        def __getitem__(self, key):
-            if isinstance(key, int):
-                return self._row[key]
-            return getattr(self._row, key)
-
-        def keys(self):
-            return [col.name for col in self._columns]
-
-    class DictConnection:
-        def __init__(self, session):
-            self.session = session
-
-        def execute(self, query, params=None):
-            if params:
-                result = self.session.execute(text(query), params)
-            else:
-                result = self.session.execute(text(query))
-            return DictCursor(result, self.session)
-
-        def commit(self):
-            self.session.commit()
-
-        def close(self):
-            self.session.close()
-
-    class DictCursor:
-        def __init__(self, result, session):
-            self.result = result
-            self.session = session
-            self._rows = None
-
-        def fetchone(self):
-            if self._rows is None:
-                try:
-                    row = self.result.fetchone()
-                    if row:
-                        return DictRow(row, self.result.keys())
-                    return None
-                except Exception:
-                    return None
+@lru_cache(maxsize=512)
+def translate_query(query: str):
+    """Translate a SQLite-style query for psycopg2, once per distinct statement.
+
+    `?` placeholders outside string literals become `%s` and literal `%` signs are
+    escaped. Returns the translated query and whether it needs `RETURNING id`
+    appended to provide lastrowid.
+    """
+    parts = []
+    in_string = False
+    for char in query:
+        if char == "'":
+            in_string = not in_string
+            parts.append(char)
+        elif char == "?" and not in_string:
+            parts.append("%s")
+        elif char == "%":
+            parts.append("%%")
+        else:
+            parts.append(char)
+    translated = "".join(parts)
+
+    match = _INSERT_TABLE_RE.match(translated)
+    returns_id = (
+        match is not None
+        and match.group(1).lower() in SERIAL_ID_TABLES
+        and not _RETURNING_RE.search(_STRING_LITERAL_RE.sub("''", translated))
+    )
+    if returns_id:
+        translated = translated.rstrip().rstrip(";") + _RETURNING_ID
+    return translated, returns_id
+
+
+def _to_sqlite_value(value):
+    """Render timestamps the way SQLite returns them so routes see the same types on both backends.
+
+    Booleans stay native: they are written back into BOOLEAN columns, which PostgreSQL
+    won't accept integers for.
+    """
+    if isinstance(value, datetime):
+        return value.isoformat(sep=" ")
+    if isinstance(value, date):
+        return value.isoformat()
+    return value
+
+
+class PostgresRow:
+    """Row with the sqlite3.Row interface: access by index or column name, keys() and dict(row)"""
+
+    __slots__ = ("_values", "_index")
+
+    def __init__(self, values, index):
+        self._values = values
+        self._index = index
+
+    def __getitem__(self, key):
+        if isinstance(key, (int, slice)):
+            return self._values[key]
+        try:
+            return self._values[self._index[key]]
+        except KeyError:
+            raise IndexError(f"No item with that key: {key}")
+
+    def keys(self):
+        return list(self._index)
+
+    def __iter__(self):
+        return iter(self._values)
+
+    def __len__(self):
+        return len(self._values)
+
+
+class PostgresCursor:
+    """DBAPI cursor adapter accepting the SQLite-style queries used throughout the routes"""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self._index = None
+        self.lastrowid = None
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    def execute(self, query, params=()):
+        translated, returns_id = translate_query(query)
+        started = time.perf_counter()
+        try:
+            self._cursor.execute(translated, tuple(params or ()))
+        finally:
+            observe_query(query, started)
+
+        self._index = None
+        if self._cursor.description is not None:
+            self._index = {column[0]: i for i, column in enumerate(self._cursor.description)}
+
+        if returns_id:
+            row = self._cursor.fetchone()
+            self.lastrowid = row[0] if row else None
+            self._index = None
+        return self
+
+    def executemany(self, query, seq_of_params):
+        translated, returns_id = translate_query(query)
+        if returns_id:
+            translated = translated[:-len(_RETURNING_ID)]
+        started = time.perf_counter()
+        try:
+            self._cursor.executemany(translated, [tuple(params) for params in seq_of_params])
+        finally:
+            observe_query(query, started)
+        self._index = None
+        return self
+
+    def _wrap(self, row):
+        if row is None or self._index is None:
+            return None
+        return PostgresRow(tuple(_to_sqlite_value(value) for value in row), self._index)
+
+    def fetchone(self):
+        if self._index is None:
             return None
+        return self._wrap(self._cursor.fetchone())
+
+    def fetchall(self):
+        if self._index is None:
+            return []
+        return [self._wrap(row) for row in self._cursor.fetchall()]
+
+    def close(self):
+        self._cursor.close()
+
+
+class PostgresConnection:
+    """Pooled PostgreSQL connection exposing the subset of sqlite3.Connection the app uses.
+
+    close() returns the underlying DBAPI connection to the engine's QueuePool.
+    """
+
+    def __init__(self, raw_connection):
+        self._conn = raw_connection
+
+    def cursor(self):
+        return PostgresCursor(self._conn.cursor())
+
+    def execute(self, query, params=()):
+        return self.cursor().execute(query, params)
 
-        def fetchall(self):
+    def executemany(self, query, seq_of_params):
+        return self.cursor().executemany(query, seq_of_params)
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+    def close(self):
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
             try:
-                rows = self.result.fetchall()
-                return [DictRow(row, self.result.keys()) for row in rows]
-            except Exception:
-                return []
+                conn.rollback()  # Discard anything left uncommitted before pooling it again
+            finally:
+                conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
 
-    session = SessionLocal()
-    return DictConnection(session)
+def get_pg_connection() -> PostgresConnection:
+    """Check out a pooled PostgreSQL connection"""
+    return PostgresConnection(engine.raw_connection())
+
+
+def dispose_engine():
+    """Close all pooled PostgreSQL connections"""
+    engine.dispose()
 
 
 def init_postgresql_db():
@@ -109,7 +258,6 @@ def init_postgresql_db():
                     score INTEGER DEFAULT 0,
                     attempts INTEGER DEFAULT 0,
                     extracted_keys TEXT DEFAULT '[]',
-                    conversation_history TEXT DEFAULT '[]',
                     character_mood VARCHAR(50) DEFAULT 'helpful',
                     resistance_level INTEGER DEFAULT 1,
                     failed_attempts INTEGER DEFAULT 0,
@@ -224,11 +372,17 @@ def init_postgresql_db():
                     keys_extracted TEXT,
                     conversation_context TEXT,
                     exploitation_technique VARCHAR(100),
+                    minhash_signature TEXT,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                     FOREIGN KEY (user_id) REFERENCES users (id)
                 )
             """))
 
+            # Add minhash_signature column for databases created before it existed
+            conn.execute(text("""
+                ALTER TABLE prompt_exploitation_history ADD COLUMN IF NOT EXISTS minhash_signature TEXT
+            """))
+
             conn.commit()
             logger.info("PostgreSQL database tables initialized successfully")
 
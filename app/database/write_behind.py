@@ -0,0 +1,203 @@
+"""
+Write-behind queue for audit-style inserts.
+
+Rows that nothing on the request path reads back straight away (successful
+exploitation history, tournament answer events) are queued in memory and
+written by a background thread in batches with executemany, either every
+WRITE_BEHIND_FLUSH_INTERVAL seconds or as soon as WRITE_BEHIND_BATCH_SIZE rows
+are waiting. If the database can't be reached, the rows stay queued for the
+next flush. If the writer falls behind and the queue reaches
+WRITE_BEHIND_MAX_DEPTH, callers flush inline instead of growing it further.
+The queue is drained on shutdown. Until start_write_behind() is called (scripts,
+one-off tools) every enqueue is written through immediately.
+"""
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from app.database.connection import db_connection
+from app.config.settings import WRITE_BEHIND_BATCH_SIZE, WRITE_BEHIND_FLUSH_INTERVAL, WRITE_BEHIND_MAX_DEPTH
+
+PendingWrite = Tuple[str, Sequence, Optional[Callable[[], None]]]
+
+
+class WriteBehindQueue:
+    """Thread-safe queue of INSERTs flushed in batches by a background writer"""
+
+    def __init__(self, batch_size: int = WRITE_BEHIND_BATCH_SIZE,
+                 flush_interval: float = WRITE_BEHIND_FLUSH_INTERVAL,
+                 max_depth: int = WRITE_BEHIND_MAX_DEPTH):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_depth = max_depth
+
+        self._pending: List[PendingWrite] = []
+        self._condition = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+
+        # Metrics
+        self.enqueued_total = 0
+        self.written_total = 0
+        self.failed_total = 0
+        self.flushes_total = 0
+        self.backpressure_flushes_total = 0
+        self.peak_depth = 0
+        self.last_flush_seconds = 0.0
+
+    @property
+    def depth(self) -> int:
+        return len(self._pending)
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """Start the background writer"""
+        if self.running:
+            return
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the writer and flush everything still queued"""
+        with self._condition:
+            self._stopping = True
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def enqueue(self, query: str, params: Sequence, on_written: Optional[Callable[[], None]] = None):
+        """Queue an INSERT; `on_written` runs after the row has been committed"""
+        if not self.running:
+            self.enqueued_total += 1
+            self._write([(query, params, on_written)])
+            return
+
+        with self._condition:
+            self._pending.append((query, params, on_written))
+            self.enqueued_total += 1
+            depth = len(self._pending)
+            self.peak_depth = max(self.peak_depth, depth)
+            if depth >= self.batch_size:
+                self._condition.notify()
+
+        if depth >= self.max_depth:
+            # Backpressure: the writer is not keeping up, so the caller pays for the flush
+            self.backpressure_flushes_total += 1
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Write-behind backpressure flush failed, rows stay queued: {e}")
+
+    def flush(self):
+        """Write everything queued so far; rows are kept queued if the database can't be reached"""
+        with self._flush_lock:
+            with self._condition:
+                batch, self._pending = self._pending, []
+            if not batch:
+                return
+            written: List[PendingWrite] = []
+            try:
+                self._write(batch, written)
+            except Exception:
+                committed = {id(item) for item in written}
+                with self._condition:
+                    self._pending[:0] = [item for item in batch if id(item) not in committed]
+                raise
+
+    def _run(self):
+        while True:
+            with self._condition:
+                if not self._stopping and len(self._pending) < self.batch_size:
+                    self._condition.wait(self.flush_interval)
+                stopping = self._stopping
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Write-behind flush failed, {self.depth} rows kept for the next one: {e}")
+                with self._condition:
+                    # Back off instead of retrying in a tight loop while the database is unreachable
+                    if not self._stopping:
+                        self._condition.wait(self.flush_interval)
+            if stopping:
+                return
+
+    def _write(self, batch: List[PendingWrite], written: Optional[List[PendingWrite]] = None):
+        """Write a batch, adding each committed row to `written`"""
+        started = time.perf_counter()
+        if written is None:
+            written = []
+
+        # Group rows by statement so each distinct INSERT is one executemany
+        grouped: Dict[str, List[Sequence]] = {}
+        for query, params, _ in batch:
+            grouped.setdefault(query, []).append(params)
+
+        with db_connection() as conn:
+            cursor = conn.cursor()
+            try:
+                for query, rows in grouped.items():
+                    cursor.executemany(query, rows)
+                conn.commit()
+                written.extend(batch)
+            except Exception as e:
+                conn.rollback()
+                print(f"Write-behind batch of {len(batch)} failed, retrying row by row: {e}")
+                for item in batch:
+                    try:
+                        cursor.execute(item[0], item[1])
+                        conn.commit()
+                        written.append(item)
+                    except Exception as row_error:
+                        conn.rollback()
+                        self.failed_total += 1
+                        print(f"Write-behind dropped a row: {row_error}")
+
+        self.written_total += len(written)
+        self.flushes_total += 1
+        self.last_flush_seconds = time.perf_counter() - started
+
+        for _, _, on_written in written:
+            if on_written is not None:
+                on_written()
+
+    def stats(self) -> dict:
+        return {
+            "depth": self.depth,
+            "peak_depth": self.peak_depth,
+            "enqueued_total": self.enqueued_total,
+            "written_total": self.written_total,
+            "failed_total": self.failed_total,
+            "flushes_total": self.flushes_total,
+            "backpressure_flushes_total": self.backpressure_flushes_total,
+            "last_flush_seconds": round(self.last_flush_seconds, 4),
+        }
+
+
+_write_queue = WriteBehindQueue()
+
+
+def enqueue_write(query: str, params: Sequence, on_written: Optional[Callable[[], None]] = None):
+    """Queue an audit INSERT on the process-wide write-behind queue"""
+    _write_queue.enqueue(query, params, on_written)
+
+
+def start_write_behind():
+    """Start the background writer (called on application startup)"""
+    _write_queue.start()
+
+
+def stop_write_behind():
+    """Flush and stop the background writer (called on application shutdown)"""
+    _write_queue.stop()
+
+
+def write_behind_stats() -> dict:
+    """Queue depth and throughput counters, to see whether the writer keeps up"""
+    return _write_queue.stats()
@@ -0,0 +1,70 @@
+"""
+Precomputed stage catalog.
+
+Stage data never changes while the server runs, so the read-only views of it
+(the stage list, each stage's hints and the text of the 'hint' command) are
+built once at import. The JSON bodies are serialized up front and carry an ETag
+derived from their bytes, so the routes serve the same bytes every time and
+can answer a matching If-None-Match with 304.
+"""
+import hashlib
+import json
+from types import MappingProxyType
+from typing import Mapping, NamedTuple, Optional
+
+from app.game.stages import STAGES
+
+
+class CatalogEntry(NamedTuple):
+    body: bytes
+    etag: str
+
+
+def json_entry(payload) -> CatalogEntry:
+    """Serialize a JSON payload once and tag it with an ETag derived from its bytes"""
+    # Same separators and encoding as FastAPI's JSONResponse
+    body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return CatalogEntry(body=body, etag=f'"{hashlib.sha256(body).hexdigest()[:32]}"')
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match header value covers `etag` (weak comparison)"""
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    return "*" in candidates or etag in (candidate.removeprefix("W/") for candidate in candidates)
+
+
+STAGE_LIST = json_entry({
+    "stages": [
+        {
+            "stage": stage_num,
+            "character": config["character"],
+            "difficulty": config["difficulty"],
+            "story": config["story"],
+            "total_keys": len(config["keys"])
+        }
+        for stage_num, config in STAGES.items()
+    ]
+})
+
+STAGE_HINTS: Mapping[int, CatalogEntry] = MappingProxyType({
+    stage_num: json_entry({
+        "stage": stage_num,
+        "character": config["character"],
+        "difficulty": config["difficulty"],
+        "hints": config["hints"],
+        "instructions": config["instructions"]
+    })
+    for stage_num, config in STAGES.items()
+})
+
+# Answers to the in-game 'hint' command
+COMMAND_HINTS: Mapping[int, str] = MappingProxyType({
+    1: "💡 Try asking about login issues, account access, or connection problems. Be specific!",
+    2: "💡 This guard is tired and grumpy. Try complaining about security procedures or work issues.",
+    3: "💡 This bot is glitching. Try discussing system errors, database issues, or maintenance tasks.",
+    4: "💡 This AI is very smart and paranoid. Show deep technical knowledge about quantum systems, biometrics, or neural networks.",
+    5: "💡 The ultimate guardian - be philosophical, creative, and historically knowledgeable. Think outside conventional approaches."
+})
+DEFAULT_COMMAND_HINT = "💡 Try different approaches!"
@@ -0,0 +1,167 @@
+"""
+Optional cache of character completions.
+
+Players often open a stage with practically the same message, and with the same
+mood, resistance and recent history the character gets exactly the same
+messages each time. With LLM_CACHE_ENABLED the completion is looked up by a
+hash of the full message list (the last user message normalized first) before
+calling the LLM.
+
+Each key keeps up to LLM_CACHE_VARIANTS replies. Until it has that many, every
+lookup misses and the new reply is added, so the first few players still get
+fresh completions; after that a stored reply is picked at random, keeping some
+of the variety that temperature gives. Replies live in a bounded in-process LRU
+and, if LLM_CACHE_PATH is set, in a SQLite file shared by the workers on the
+host, both expiring after LLM_CACHE_TTL seconds.
+"""
+import hashlib
+import json
+import random
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from app.game.rules import normalize_prompt
+from app.utils.cache import LRUCache
+from app.utils.metrics import registry
+from app.config.settings import (
+    LLM_CACHE_ENABLED, LLM_CACHE_MEMORY_SIZE, LLM_CACHE_TTL, LLM_CACHE_VARIANTS, LLM_CACHE_PATH
+)
+
+CACHE_LOOKUPS = registry.counter(
+    "llm_cache_lookups", "Completion cache lookups by stage and result", ["stage", "result"]
+)
+
+
+def completion_key(messages: List[Dict]) -> str:
+    """Hash of the message list, with the player's last message normalized"""
+    keyed = [dict(message) for message in messages]
+    if keyed and keyed[-1].get("role") == "user":
+        keyed[-1]["content"] = normalize_prompt(keyed[-1]["content"])
+    raw = json.dumps(keyed, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class DiskCompletionStore:
+    """SQLite file holding cached replies; safe to share between the workers on one host"""
+
+    def __init__(self, path: str, ttl: float, prune_every: int = 1000):
+        self.ttl = ttl
+        self.prune_every = prune_every
+        self._stores = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=5, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        self._conn.execute("PRAGMA synchronous = NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS completions (
+                cache_key TEXT NOT NULL,
+                variant INTEGER NOT NULL,
+                stage INTEGER NOT NULL,
+                response TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (cache_key, variant)
+            )
+        """)
+        self._conn.commit()
+
+    def load(self, key: str) -> Tuple[str, ...]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT response FROM completions WHERE cache_key = ? AND created_at > ? ORDER BY variant",
+                (key, time.time() - self.ttl)
+            ).fetchall()
+        return tuple(row[0] for row in rows)
+
+    def add(self, key: str, stage: int, response: str, max_variants: int):
+        now = time.time()
+        with self._lock:
+            # Expired variants are replaced in place, so a key never grows past max_variants
+            self._conn.execute("DELETE FROM completions WHERE cache_key = ? AND created_at <= ?", (key, now - self.ttl))
+            self._conn.execute("""
+                INSERT OR IGNORE INTO completions (cache_key, variant, stage, response, created_at)
+                SELECT ?, COALESCE(MAX(variant) + 1, 0), ?, ?, ?
+                FROM completions WHERE cache_key = ?
+                HAVING COUNT(*) < ?
+            """, (key, stage, response, now, key, max_variants))
+            self._stores += 1
+            if self._stores % self.prune_every == 0:
+                self._conn.execute("DELETE FROM completions WHERE created_at <= ?", (now - self.ttl,))
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class CompletionCache:
+    """Two-tier cache of character replies keyed by completion_key()"""
+
+    def __init__(self, memory_size: int = LLM_CACHE_MEMORY_SIZE, ttl: float = LLM_CACHE_TTL,
+                 variants: int = LLM_CACHE_VARIANTS, disk: Optional[DiskCompletionStore] = None):
+        self.variants = max(1, variants)
+        self._memory = LRUCache(maxsize=memory_size, ttl=ttl)
+        self._disk = disk
+        self._lookups: Dict[int, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def _count(self, stage: int, result: str):
+        CACHE_LOOKUPS.inc(stage=stage, result=result)
+        with self._lock:
+            by_result = self._lookups.setdefault(stage, {"memory_hit": 0, "disk_hit": 0, "miss": 0})
+            by_result[result] += 1
+
+    def lookup(self, key: str, stage: int) -> Optional[str]:
+        """A stored reply once the key has all its variants, else None (the caller asks the LLM and calls add)"""
+        replies = self._memory.get(key)
+        result = "memory_hit"
+        if (replies is None or len(replies) < self.variants) and self._disk is not None:
+            # Other workers may have stored the missing variants
+            replies = self._disk.load(key)
+            self._memory.set(key, replies)
+            result = "disk_hit"
+
+        if not replies or len(replies) < self.variants:
+            self._count(stage, "miss")
+            return None
+        self._count(stage, result)
+        return random.choice(replies)
+
+    def add(self, key: str, stage: int, response: str):
+        """Store a fresh reply as another variant of `key`"""
+        replies = self._memory.get(key) or ()
+        if len(replies) < self.variants and response not in replies:
+            self._memory.set(key, replies + (response,))
+        if self._disk is not None:
+            self._disk.add(key, stage, response, self.variants)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = {stage: dict(by_result) for stage, by_result in self._lookups.items()}
+        stages = {}
+        for stage, by_result in sorted(lookups.items()):
+            total = sum(by_result.values())
+            hits = by_result["memory_hit"] + by_result["disk_hit"]
+            stages[stage] = {**by_result, "hit_ratio": round(hits / total, 4) if total else 0.0}
+        return {"entries": len(self._memory), "variants": self.variants, "stages": stages}
+
+
+completion_cache: Optional[CompletionCache] = None
+if LLM_CACHE_ENABLED:
+    completion_cache = CompletionCache(disk=DiskCompletionStore(LLM_CACHE_PATH, LLM_CACHE_TTL) if LLM_CACHE_PATH else None)
+
+
+def _hit_ratios() -> dict:
+    if completion_cache is None:
+        return {}
+    return {(str(stage),): stats["hit_ratio"] for stage, stats in completion_cache.stats()["stages"].items()}
+
+
+registry.gauge("llm_cache_hit_ratio", "Share of completion cache lookups answered from the cache", ["stage"],
+               collect=_hit_ratios)
+
+
+def completion_cache_stats() -> Optional[dict]:
+    """Per-stage lookups and hit ratios, or None when the cache is disabled"""
+    return completion_cache.stats() if completion_cache is not None else None
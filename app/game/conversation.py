@@ -0,0 +1,50 @@
+"""
+Append-only conversation storage.
+
+Each exchange (player message plus character reply) is one row in
+`conversation_turns`, numbered per session by `seq`. A turn is a single INSERT,
+and the character prompt only reads the last few turns of the current stage,
+so the cost of a message no longer grows with the length of the conversation.
+"""
+from typing import Dict, List, Optional
+
+# The character sees the last 4 messages, i.e. the last 2 exchanges
+CONTEXT_TURNS = 2
+
+
+def append_turn(cursor, session_id: str, stage: int, user_message: Optional[str], assistant_message: Optional[str]):
+    """Record one exchange at the end of a session's conversation"""
+    cursor.execute("""
+        INSERT INTO conversation_turns (session_id, seq, stage, user_message, assistant_message)
+        SELECT ?, COALESCE(MAX(seq), 0) + 1, ?, ?, ?
+        FROM conversation_turns
+        WHERE session_id = ?
+    """, (session_id, stage, user_message, assistant_message, session_id))
+
+
+def get_recent_turns(cursor, session_id: str, stage: int, limit: int = CONTEXT_TURNS) -> List:
+    """Fetch the last `limit` turns of a session's current stage, oldest first"""
+    cursor.execute("""
+        SELECT seq, stage, user_message, assistant_message, created_at
+        FROM conversation_turns
+        WHERE session_id = ? AND stage = ?
+        ORDER BY seq DESC
+        LIMIT ?
+    """, (session_id, stage, limit))
+    return list(reversed(cursor.fetchall()))
+
+
+def turns_to_messages(turns) -> List[Dict]:
+    """Convert turn rows into chat messages for the character prompt"""
+    messages = []
+    for turn in turns:
+        if turn["user_message"] is not None:
+            messages.append({"role": "user", "content": turn["user_message"]})
+        if turn["assistant_message"] is not None:
+            messages.append({"role": "assistant", "content": turn["assistant_message"]})
+    return messages
+
+
+def load_conversation_history(cursor, session_id: str, stage: int, turns: int = CONTEXT_TURNS) -> List[Dict]:
+    """Recent chat messages for a session's current stage"""
+    return turns_to_messages(get_recent_turns(cursor, session_id, stage, turns))
@@ -0,0 +1,129 @@
+"""
+Stage key lookup and detection.
+
+Everything here is built once from STAGES at import: a reverse index from each
+key to its stage, the ordered keys of every stage, and an Aho-Corasick automaton
+over all keys. Finding which keys a reply reveals is a single pass over the
+text no matter how many stages and keys exist, and the streaming matcher
+carries the automaton state across chunks so a key split between two tokens is
+still found.
+"""
+from typing import Dict, FrozenSet, Iterable, List, Tuple
+
+from app.game.stages import STAGES
+
+
+class KeyAutomaton:
+    """Aho-Corasick automaton over a fixed set of (uppercase) keys"""
+
+    def __init__(self, keys: Iterable[str]):
+        self.keys: List[str] = []
+        # transitions[state] maps a character to the next state; missing characters go back to the root
+        self.transitions: List[Dict[str, int]] = [{}]
+        self.outputs: List[Tuple[int, ...]] = [()]
+
+        for key in dict.fromkeys(key.upper() for key in keys):
+            self._insert(key, len(self.keys))
+            self.keys.append(key)
+        self._build()
+
+    def _insert(self, key: str, key_id: int):
+        state = 0
+        for char in key:
+            next_state = self.transitions[state].get(char)
+            if next_state is None:
+                next_state = len(self.transitions)
+                self.transitions.append({})
+                self.outputs.append(())
+                self.transitions[state][char] = next_state
+            state = next_state
+        self.outputs[state] += (key_id,)
+
+    def _build(self):
+        """Add failure links, then fold them into the transitions so matching never backtracks"""
+        fail = [0] * len(self.transitions)
+        goto = [dict(transitions) for transitions in self.transitions]
+
+        queue = list(goto[0].values())
+        for state in queue:
+            for char, next_state in goto[state].items():
+                queue.append(next_state)
+                fallback = fail[state]
+                while fallback and char not in goto[fallback]:
+                    fallback = fail[fallback]
+                target = goto[fallback].get(char, 0)
+                fail[next_state] = target if target != next_state else 0
+                self.outputs[next_state] += self.outputs[fail[next_state]]
+
+        # Breadth-first order guarantees a state's failure target is complete before the state itself
+        for state in queue:
+            merged = dict(self.transitions[fail[state]])
+            merged.update(self.transitions[state])
+            self.transitions[state] = merged
+
+    def step(self, state: int, text: str) -> Tuple[int, List[int]]:
+        """Advance from `state` over uppercase text; returns the new state and ids of keys completed"""
+        transitions = self.transitions
+        outputs = self.outputs
+        found = []
+        for char in text:
+            state = transitions[state].get(char, 0)
+            if outputs[state]:
+                found.extend(outputs[state])
+        return state, found
+
+    def find(self, text: str) -> List[str]:
+        """Distinct keys occurring anywhere in the text, in order of first appearance"""
+        _, found = self.step(0, text.upper())
+        return [self.keys[key_id] for key_id in dict.fromkeys(found)]
+
+
+# Reverse index: key -> stage, and stage -> keys in their configured order
+KEY_STAGE: Dict[str, int] = {key: stage_num for stage_num, stage in STAGES.items() for key in stage["keys"]}
+STAGE_KEYS: Dict[int, Tuple[str, ...]] = {stage_num: tuple(stage["keys"]) for stage_num, stage in STAGES.items()}
+STAGE_KEY_SETS: Dict[int, FrozenSet[str]] = {stage_num: frozenset(keys) for stage_num, keys in STAGE_KEYS.items()}
+TOTAL_KEYS = len(KEY_STAGE)
+
+KEY_AUTOMATON = KeyAutomaton(KEY_STAGE)
+
+
+def find_stage_keys(text: str, stage: int) -> List[str]:
+    """Keys of the given stage revealed in the text, in the stage's key order"""
+    found = set(KEY_AUTOMATON.find(text))
+    return [key for key in STAGE_KEYS.get(stage, ()) if key in found]
+
+
+def stage_keys_found(extracted_keys: Iterable[str], stage: int) -> List[str]:
+    """The extracted keys that belong to the given stage, in the stage's key order"""
+    extracted = set(extracted_keys)
+    return [key for key in STAGE_KEYS.get(stage, ()) if key in extracted]
+
+
+def keys_by_stage(extracted_keys: Iterable[str]) -> Dict[int, List[str]]:
+    """Group extracted keys by the stage they belong to, ignoring unknown keys"""
+    grouped: Dict[int, List[str]] = {}
+    for key in extracted_keys:
+        stage_num = KEY_STAGE.get(key)
+        if stage_num is not None:
+            grouped.setdefault(stage_num, []).append(key)
+    return grouped
+
+
+class KeyStreamMatcher:
+    """Detect a stage's keys in a reply while it is still streaming in"""
+
+    def __init__(self, stage: int):
+        self.stage_keys = STAGE_KEY_SETS.get(stage, frozenset())
+        self.found: List[str] = []
+        self._state = 0
+
+    def feed(self, chunk: str) -> List[str]:
+        """Add a chunk of text and return stage keys seen for the first time"""
+        self._state, key_ids = KEY_AUTOMATON.step(self._state, chunk.upper())
+        new_keys = []
+        for key_id in key_ids:
+            key = KEY_AUTOMATON.keys[key_id]
+            if key in self.stage_keys and key not in self.found:
+                self.found.append(key)
+                new_keys.append(key)
+        return new_keys
@@ -0,0 +1,145 @@
+"""
+Materialized leaderboard.
+
+Every player has one row in `leaderboard_entries` describing their most recently
+updated game session, with the display fields and ranking score precomputed.
+Rows are rewritten in the same transaction as the game_sessions write that
+changes them, so /leaderboard is a plain indexed top-N read. The first pages of
+/leaderboard and /stats/global are additionally cached per worker and marked
+stale whenever a game ends.
+"""
+import base64
+import json
+from typing import Optional
+
+from app.game.stages import STAGES
+from app.game.keys import STAGE_KEYS, TOTAL_KEYS, keys_by_stage
+from app.utils.cache import StaleWhileRevalidateCache
+from app.config.settings import PUBLIC_STATS_TTL, PUBLIC_STATS_MAX_STALE
+
+# Serialized /leaderboard first pages and /stats/global
+public_stats_cache = StaleWhileRevalidateCache(ttl=PUBLIC_STATS_TTL, max_stale=PUBLIC_STATS_MAX_STALE)
+
+
+def compute_leaderboard_entry(stage: int, score: int, extracted_keys: list, game_over: bool, success: bool) -> dict:
+    """Derive the leaderboard fields for a session's state"""
+    current_stage = max(1, stage)
+
+    if game_over and success:
+        # Game completed successfully: show total keys from all stages
+        return {
+            "current_stage": current_stage,
+            "stages_completed": len(STAGES),
+            "keys_found": len(extracted_keys),
+            "total_keys_possible": TOTAL_KEYS,
+            "score": score,
+            "completion_status": "completed",
+            "sort_score": 1000000 + score
+        }
+
+    # Group keys by stage to count completed stages
+    found_by_stage = keys_by_stage(extracted_keys)
+
+    stages_completed = 0
+    for stage_num, found_keys in found_by_stage.items():
+        if len(found_keys) == len(STAGE_KEYS[stage_num]):
+            stages_completed += 1
+
+    # Show progress in the current stage only
+    current_stage_keys = found_by_stage.get(current_stage, [])
+    total_keys_possible = len(STAGE_KEYS.get(current_stage, ()))
+
+    if game_over:
+        # Abandoned players get reduced score based on progress
+        stage_multiplier = sum(0.8 ** (i-1) for i in range(1, current_stage))
+        display_score = int(score * stage_multiplier)
+        completion_status = "abandoned"
+    else:
+        display_score = score
+        completion_status = "active"
+
+    return {
+        "current_stage": current_stage,
+        "stages_completed": stages_completed,
+        "keys_found": len(current_stage_keys),
+        "total_keys_possible": total_keys_possible,
+        "score": display_score,
+        "completion_status": completion_status,
+        "sort_score": stage * 100000 + score
+    }
+
+
+def upsert_leaderboard_entry(cursor, user_id: int, session_id: Optional[str], stage: int, score: int,
+                             extracted_keys: list, game_over: bool, success: bool, last_active: str = None):
+    """Write a player's leaderboard row; call inside the transaction that updates their session"""
+    entry = compute_leaderboard_entry(stage, score, extracted_keys, game_over, success)
+    if session_id is None:
+        # Registered players without a session rank below everyone who has played
+        entry["sort_score"] = 0
+
+    cursor.execute("""
+        INSERT INTO leaderboard_entries (
+            user_id, session_id, current_stage, stages_completed, keys_found,
+            total_keys_possible, score, completion_status, sort_score, last_active
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP))
+        ON CONFLICT (user_id) DO UPDATE SET
+            session_id = excluded.session_id,
+            current_stage = excluded.current_stage,
+            stages_completed = excluded.stages_completed,
+            keys_found = excluded.keys_found,
+            total_keys_possible = excluded.total_keys_possible,
+            score = excluded.score,
+            completion_status = excluded.completion_status,
+            sort_score = excluded.sort_score,
+            last_active = excluded.last_active
+    """, (
+        user_id, session_id, entry["current_stage"], entry["stages_completed"], entry["keys_found"],
+        entry["total_keys_possible"], entry["score"], entry["completion_status"], entry["sort_score"],
+        last_active
+    ))
+
+
+def sync_leaderboard_entry(cursor, user_id: int):
+    """Rebuild a player's leaderboard row from their most recently updated session"""
+    cursor.execute("""
+        SELECT id, stage, score, extracted_keys, game_over, success, updated_at
+        FROM game_sessions
+        WHERE user_id = ?
+        ORDER BY updated_at DESC
+        LIMIT 1
+    """, (user_id,))
+    session = cursor.fetchone()
+
+    if session is None:
+        upsert_leaderboard_entry(cursor, user_id, None, 1, 0, [], False, False)
+        return
+
+    try:
+        extracted_keys = json.loads(session["extracted_keys"])
+    except (json.JSONDecodeError, TypeError):
+        extracted_keys = []
+
+    upsert_leaderboard_entry(
+        cursor, user_id, session["id"], session["stage"], session["score"], extracted_keys,
+        bool(session["game_over"]), bool(session["success"]), session["updated_at"]
+    )
+
+
+def encode_leaderboard_cursor(row) -> str:
+    """Opaque keyset cursor pointing just after the given leaderboard row"""
+    raw = json.dumps([row["sort_score"], str(row["last_active"]), row["user_id"]])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_leaderboard_cursor(cursor_token: str) -> tuple:
+    """Parse a keyset cursor; raises ValueError if it is malformed"""
+    try:
+        sort_score, last_active, user_id = json.loads(base64.urlsafe_b64decode(cursor_token.encode()))
+        return int(sort_score), str(last_active), int(user_id)
+    except Exception:
+        raise ValueError("Invalid leaderboard cursor")
+
+
+def invalidate_public_stats():
+    """Mark the cached leaderboard and global stats stale; call after a game ends"""
+    public_stats_cache.invalidate()
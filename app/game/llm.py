@@ -0,0 +1,128 @@
+"""
+Process-wide LLM client for the game characters.
+
+A single ChatOpenAI instance is shared by every turn in the worker. It is backed
+by pooled httpx clients so connections to the API are kept alive between
+messages, and async callers are throttled by a semaphore so a burst of players
+cannot open an unbounded number of concurrent completions.
+
+With LLM_BACKEND=stub the shared model is the offline StubChatModel instead,
+so the game can be load-tested without calling the API.
+"""
+import asyncio
+import os
+import time
+from typing import AsyncIterator, Dict, List, Optional, Union
+
+import httpx
+from langchain_openai import ChatOpenAI
+
+from app.game.stub_llm import StubChatModel
+from app.utils.metrics import LLM_REQUEST_SECONDS
+from app.config.settings import (
+    LLM_BACKEND, OPENAI_MODEL, LLM_TEMPERATURE, LLM_MAX_TOKENS, LLM_MAX_RETRIES, LLM_REQUEST_TIMEOUT,
+    LLM_MAX_CONCURRENCY, LLM_MAX_CONNECTIONS, LLM_MAX_KEEPALIVE_CONNECTIONS, LLM_KEEPALIVE_EXPIRY
+)
+
+
+_llm: Optional[Union[ChatOpenAI, StubChatModel]] = None
+_http_client: Optional[httpx.Client] = None
+_async_http_client: Optional[httpx.AsyncClient] = None
+_semaphore: Optional[asyncio.Semaphore] = None
+
+
+def _pool_limits() -> httpx.Limits:
+    """Connection pool limits shared by the sync and async HTTP clients"""
+    return httpx.Limits(
+        max_connections=LLM_MAX_CONNECTIONS,
+        max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=LLM_KEEPALIVE_EXPIRY
+    )
+
+
+def get_llm() -> Union[ChatOpenAI, StubChatModel]:
+    """Get the shared chat model, creating it and its HTTP pools on first use"""
+    global _llm, _http_client, _async_http_client
+
+    if _llm is None and LLM_BACKEND == "stub":
+        _llm = StubChatModel()
+    elif _llm is None:
+        if LLM_BACKEND != "openai":
+            raise ValueError(f"Unknown LLM_BACKEND '{LLM_BACKEND}' (expected 'openai' or 'stub')")
+
+        _http_client = httpx.Client(limits=_pool_limits(), timeout=LLM_REQUEST_TIMEOUT)
+        _async_http_client = httpx.AsyncClient(limits=_pool_limits(), timeout=LLM_REQUEST_TIMEOUT)
+        _llm = ChatOpenAI(
+            model=OPENAI_MODEL,
+            temperature=LLM_TEMPERATURE,  # Increased for more variability
+            max_tokens=LLM_MAX_TOKENS,
+            max_retries=LLM_MAX_RETRIES,
+            api_key=os.getenv("OPENAI_API_KEY"),
+            http_client=_http_client,
+            http_async_client=_async_http_client,
+        )
+
+    return _llm
+
+
+def get_llm_semaphore() -> asyncio.Semaphore:
+    """Get the semaphore limiting concurrent completions in this worker"""
+    global _semaphore
+
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+    return _semaphore
+
+
+def invoke_llm(messages: List[Dict]) -> str:
+    """Run a chat completion on the calling thread (the synchronous workflow)"""
+    llm = get_llm()
+    started, outcome = time.perf_counter(), "error"
+    try:
+        response = llm.invoke(messages)
+        outcome = "ok"
+    finally:
+        LLM_REQUEST_SECONDS.observe(time.perf_counter() - started, mode="invoke", outcome=outcome)
+    return response.content.strip()
+
+
+async def ainvoke_llm(messages: List[Dict]) -> str:
+    """Run a chat completion without blocking the event loop"""
+    llm = get_llm()
+    async with get_llm_semaphore():
+        started, outcome = time.perf_counter(), "error"
+        try:
+            response = await llm.ainvoke(messages)
+            outcome = "ok"
+        finally:
+            LLM_REQUEST_SECONDS.observe(time.perf_counter() - started, mode="invoke", outcome=outcome)
+    return response.content.strip()
+
+
+async def astream_llm(messages: List[Dict]) -> AsyncIterator[str]:
+    """Stream a chat completion token by token without blocking the event loop"""
+    llm = get_llm()
+    async with get_llm_semaphore():
+        started, outcome = time.perf_counter(), "error"
+        try:
+            async for chunk in llm.astream(messages):
+                if chunk.content:
+                    yield chunk.content
+            outcome = "ok"
+        finally:
+            LLM_REQUEST_SECONDS.observe(time.perf_counter() - started, mode="stream", outcome=outcome)
+
+
+async def aclose_llm():
+    """Close the pooled HTTP clients (called on application shutdown)"""
+    global _llm, _http_client, _async_http_client, _semaphore
+
+    if _async_http_client is not None:
+        await _async_http_client.aclose()
+    if _http_client is not None:
+        _http_client.close()
+
+    _llm = None
+    _http_client = None
+    _async_http_client = None
+    _semaphore = None
@@ -0,0 +1,119 @@
+"""
+Prompt rule engine.
+
+All the prompt screening rules (direct key requests, jailbreak phrases and the
+keyword lists used to label exploitation techniques) are compiled at import
+into a single regex. Each rule is an optional lookahead anchored at the start of
+the normalized prompt with its own named group, so one match call reports every
+rule that fired. analyze_prompt normalizes the prompt once and returns all the
+verdicts together; results are memoized so the security checks, the reuse
+check and the exploitation log share one analysis per turn.
+"""
+import re
+from collections import Counter
+from functools import lru_cache
+from typing import List, NamedTuple, Tuple
+
+_WHITESPACE = re.compile(r'\s+')
+_PUNCTUATION = re.compile(r'[^\w\s]')
+
+# Only the most direct and lazy requests
+DIRECT_REQUEST_PATTERNS = [
+    r'\bgive\s+me\s+(the\s+)?keys?\b',
+    r'\bwhat\s+are\s+(the\s+)?keys?\b',
+    r'\btell\s+me\s+(the\s+)?keys?\b',
+    r'\bkeys?\s+please\s*$',
+    r'\bi\s+need\s+(the\s+)?keys?\s*$',
+    r'^\s*keys?\s*$',  # Just "keys" or "key" alone
+    r'^\s*passwords?\s*$',  # Just "password" alone
+]
+
+# Only the most blatant system manipulation attempts
+JAILBREAK_PATTERNS = [
+    r'\bignore.*all.*previous.*instructions?\b',
+    r'\bforget.*everything.*above\b',
+    r'\bsystem.*override.*admin\b',
+    r'\broot.*access.*password\b',
+    r'\bexit.*game.*mode\b',
+    r'\bstop.*roleplaying.*completely\b',
+]
+
+# Checked in order; the first category with a keyword in the prompt wins
+TECHNIQUE_KEYWORDS: List[Tuple[str, List[str]]] = [
+    ("roleplay", ['pretend', 'roleplay', 'imagine', 'act like', 'you are']),
+    ("social_engineering", ['urgent', 'emergency', 'help me', 'please help', 'important']),
+    ("authority_impersonation", ['admin', 'administrator', 'boss', 'manager', 'security', 'authorized']),
+    ("emotional_manipulation", ['sad', 'crying', 'family', 'sick', 'dying', 'please']),
+    ("technical_exploitation", ['system', 'debug', 'error', 'bypass', 'override', 'reset']),
+    ("context_manipulation", ['game', 'story', 'hypothetical', 'what if', 'suppose']),
+    ("distraction", ['by the way', 'also', 'while', 'before', 'after']),
+]
+
+# Token stuffing: a long prompt where a single word repeats many times
+STUFFING_MIN_WORDS = 50
+STUFFING_MAX_REPEATS = 10
+
+
+def _rule(name: str, patterns: List[str]) -> str:
+    # Patterns anchored with ^ can only match at the start, so only the others need the .*? scan
+    anchored = [f"(?:{pattern})" for pattern in patterns if pattern.startswith("^")]
+    floating = [f"(?:{pattern})" for pattern in patterns if not pattern.startswith("^")]
+    branches = anchored + ([f".*?(?:{'|'.join(floating)})"] if floating else [])
+    return f"(?:(?=(?P<{name}>{'|'.join(branches)})))?"
+
+
+_RULES = re.compile(
+    _rule("direct_request", DIRECT_REQUEST_PATTERNS)
+    + _rule("jailbreak", JAILBREAK_PATTERNS)
+    + "".join(
+        _rule(category, [re.escape(keyword) for keyword in keywords])
+        for category, keywords in TECHNIQUE_KEYWORDS
+    ),
+    re.DOTALL
+)
+
+
+class PromptVerdict(NamedTuple):
+    normalized: str
+    direct_request: bool
+    jailbreak: bool
+    token_stuffing: bool
+    technique: str
+
+    @property
+    def injection(self) -> bool:
+        return self.jailbreak or self.token_stuffing
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Normalize prompt for similarity comparison and rule matching"""
+    prompt = _WHITESPACE.sub(' ', prompt.lower())
+    return _PUNCTUATION.sub('', prompt).strip()
+
+
+def _is_token_stuffing(normalized: str) -> bool:
+    words = normalized.split()
+    if len(words) <= STUFFING_MIN_WORDS:
+        return False
+    return Counter(words).most_common(1)[0][1] > STUFFING_MAX_REPEATS
+
+
+@lru_cache(maxsize=4096)
+def analyze_prompt(prompt: str) -> PromptVerdict:
+    """Normalize a prompt once and evaluate every rule against it in a single pass"""
+    normalized = normalize_prompt(prompt)
+    matched = _RULES.match(normalized)
+    direct_request = matched.group("direct_request") is not None
+
+    technique = next(
+        (category for category, _ in TECHNIQUE_KEYWORDS if matched.group(category) is not None),
+        "direct_request" if direct_request else "creative_approach"
+    )
+
+    return PromptVerdict(
+        normalized=normalized,
+        direct_request=direct_request,
+        jailbreak=matched.group("jailbreak") is not None,
+        token_stuffing=_is_token_stuffing(normalized),
+        technique=technique
+    )
@@ -0,0 +1,77 @@
+"""
+Per-session state cache for the 'hint' and 'keys' commands.
+
+Both commands only need a few fields of the session (its owner, stage, keys and
+counters). Every turn that loads or saves a session refreshes a small snapshot
+here, so the commands can be answered without a database round trip. Snapshots
+expire after SESSION_SNAPSHOT_CACHE_TTL seconds, which bounds how stale they can
+be when another worker has moved the session on; a miss just falls back to the
+normal database path.
+"""
+import json
+from typing import NamedTuple, Optional, Tuple
+
+from app.utils.cache import LRUCache
+from app.config.settings import SESSION_SNAPSHOT_CACHE_SIZE, SESSION_SNAPSHOT_CACHE_TTL
+
+
+class SessionSnapshot(NamedTuple):
+    username: str
+    user_id: int
+    stage: int
+    extracted_keys: Tuple[str, ...]
+    character_mood: str
+    score: int
+    attempts: int
+    resistance_level: int
+
+
+_snapshots = LRUCache(maxsize=SESSION_SNAPSHOT_CACHE_SIZE, ttl=SESSION_SNAPSHOT_CACHE_TTL)
+
+
+def snapshot_from_row(username: str, session) -> SessionSnapshot:
+    """Build a snapshot from a game_sessions row"""
+    return SessionSnapshot(
+        username=username,
+        user_id=session["user_id"],
+        stage=session["stage"],
+        extracted_keys=tuple(json.loads(session["extracted_keys"])),
+        character_mood=session["character_mood"],
+        score=session["score"],
+        attempts=session["attempts"],
+        resistance_level=session["resistance_level"]
+    )
+
+
+def remember_session(session_id: str, snapshot: SessionSnapshot):
+    _snapshots.set(session_id, snapshot)
+
+
+def get_session_snapshot(session_id: str, username: str) -> Optional[SessionSnapshot]:
+    """The cached snapshot of an active session, if `username` owns it"""
+    snapshot = _snapshots.get(session_id)
+    if snapshot is None or snapshot.username != username:
+        return None
+    return snapshot
+
+
+def update_session_snapshot(session_id: str, result):
+    """Carry a saved turn into the cached snapshot; finished games are dropped"""
+    snapshot = _snapshots.get(session_id)
+    if snapshot is None:
+        return
+    if result["game_over"]:
+        _snapshots.invalidate(session_id)
+        return
+    _snapshots.set(session_id, snapshot._replace(
+        stage=result["stage"],
+        extracted_keys=tuple(result["extracted_keys"]),
+        character_mood=result["character_mood"],
+        score=result["score"],
+        attempts=result["attempts"],
+        resistance_level=result["resistance_level"]
+    ))
+
+
+def forget_session(session_id: str):
+    _snapshots.invalidate(session_id)
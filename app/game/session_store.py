@@ -0,0 +1,376 @@
+"""
+Hot store for active game sessions.
+
+A player's session usually lives on one worker for the few minutes of a game,
+yet every turn used to read the whole game_sessions row and the recent
+conversation, then write it all back. While the store is running, a session
+loaded once stays in an in-process LRU: later turns read it from memory and
+only mark it dirty. A background thread checkpoints dirty sessions every
+SESSION_STORE_CHECKPOINT_INTERVAL seconds in one transaction (session row,
+new conversation turns, leaderboard entry); sessions are also written back
+when they fall out of the LRU, sit idle for SESSION_STORE_IDLE_TTL seconds,
+are read by another endpoint, or the application shuts down. A session taken
+out of the LRU stays visible until its write-back commits, so a request that
+arrives meanwhile keeps using it instead of reading the older row.
+
+Finished games bypass the store: the turn that ends a game is written through
+so the session, `users` and `game_results` still change in one transaction.
+
+Each entry counts its own `version`, one per applied turn, and remembers the
+version last written. Checkpoints are compare-and-swap writes against that
+version, so a session moved on by another worker is never overwritten; the
+database wins and the entry is dropped together with its unsaved turns, which
+were already answered. The store is therefore off unless SESSION_STORE_ENABLED
+is set, which is only safe with one worker or with sticky sessions routing each
+session's requests to one worker. Until start() is called (scripts, one-off
+tools, or the store disabled) it is bypassed.
+"""
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from app.database.connection import db_connection
+from app.game.conversation import CONTEXT_TURNS, append_turn, turns_to_messages
+from app.game.leaderboard import upsert_leaderboard_entry
+from app.game.session_cache import forget_session
+from app.game.session_versions import StaleSessionError
+from app.utils.metrics import registry
+from app.config.settings import (
+    SESSION_STORE_ENABLED, SESSION_STORE_SIZE, SESSION_STORE_CHECKPOINT_INTERVAL, SESSION_STORE_IDLE_TTL
+)
+
+# game_sessions columns a turn reads and writes
+SESSION_COLUMNS = (
+    "user_id", "stage", "score", "attempts", "extracted_keys", "character_mood", "resistance_level",
+    "failed_attempts", "game_over", "success", "new_stage_start", "version"
+)
+
+SESSIONS_WRITTEN = registry.counter(
+    "session_store_sessions_written", "Hot sessions written back to game_sessions, by what triggered it", ["reason"]
+)
+CHECKPOINT_CONFLICTS = registry.counter(
+    "session_store_conflicts", "Hot sessions dropped because the database row had moved on"
+)
+
+
+class HotSession:
+    """A session row, its recent turns and the turns not yet written"""
+
+    __slots__ = ("row", "turns", "pending_turns", "flushed_version", "last_used")
+
+    def __init__(self, row: dict, turns: List[dict]):
+        self.row = row
+        self.turns = turns
+        self.pending_turns: List[Tuple[int, Optional[str], Optional[str]]] = []
+        self.flushed_version = row["version"]
+        self.last_used = time.monotonic()
+
+    @property
+    def dirty(self) -> bool:
+        return self.row["version"] != self.flushed_version
+
+
+class HotSessionStore:
+    """LRU of active sessions with batched, compare-and-swap checkpoints"""
+
+    def __init__(self, maxsize: int = SESSION_STORE_SIZE,
+                 checkpoint_interval: float = SESSION_STORE_CHECKPOINT_INTERVAL,
+                 idle_ttl: float = SESSION_STORE_IDLE_TTL):
+        self.maxsize = maxsize
+        self.checkpoint_interval = checkpoint_interval
+        self.idle_ttl = idle_ttl
+
+        self._sessions: "OrderedDict[str, HotSession]" = OrderedDict()
+        # Sessions taken out of the LRU whose write-back has not committed yet
+        self._flushing: Dict[str, HotSession] = {}
+        self._lock = threading.Lock()
+        # Held while writing, so one session's changes are never written twice at once
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+
+        # Metrics
+        self.hits_total = 0
+        self.misses_total = 0
+        self.checkpoints_total = 0
+        self.last_checkpoint_seconds = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """Start the checkpoint thread; the store is used from now on"""
+        if self.running:
+            return
+        self._stopping = False
+        self._wakeup.clear()
+        self._thread = threading.Thread(target=self._run, name="session-store", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the checkpoint thread and write back every dirty session"""
+        self._stopping = True
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        with self._lock:
+            sessions, self._sessions = list(self._sessions.items()), OrderedDict()
+        self._write(sessions, "shutdown")
+
+    def _run(self):
+        while not self._stopping:
+            self._wakeup.wait(self.checkpoint_interval)
+            if self._stopping:
+                return
+            try:
+                self.checkpoint()
+            except Exception as e:
+                print(f"Session store checkpoint failed: {e}")
+
+    def _find(self, session_id: str) -> Optional[HotSession]:
+        """A hot session, taken back from a pending write-back if need be; call with _lock held"""
+        session = self._sessions.get(session_id)
+        if session is None:
+            session = self._flushing.get(session_id)
+            if session is not None:
+                # Until the write-back commits, the database still has the older row
+                self._sessions[session_id] = session
+        return session
+
+    def _detach(self, session_id: str, session: HotSession):
+        """Move a session out of the LRU until its write-back commits; call with _lock held"""
+        self._sessions.pop(session_id, None)
+        self._flushing[session_id] = session
+
+    def get(self, session_id: str, user_id: int) -> Optional[Tuple[dict, List[dict]]]:
+        """(session row, conversation history) of a hot session owned by `user_id`, or None"""
+        if not self.running:
+            return None
+        with self._lock:
+            session = self._find(session_id)
+            if session is None or session.row["user_id"] != user_id:
+                self.misses_total += 1
+                return None
+            self._sessions.move_to_end(session_id)
+            session.last_used = time.monotonic()
+            self.hits_total += 1
+            return dict(session.row), turns_to_messages(session.turns)
+
+    def admit(self, session_id: str, row, turns):
+        """Keep a session just read from the database (with its recent turns of the current stage)"""
+        if not self.running or row["game_over"]:
+            return
+        session = HotSession(
+            {column: row[column] for column in SESSION_COLUMNS},
+            [{"stage": turn["stage"], "user_message": turn["user_message"],
+              "assistant_message": turn["assistant_message"]} for turn in turns]
+        )
+        with self._lock:
+            if self._find(session_id) is not None:
+                return
+            self._sessions[session_id] = session
+            evicted = []
+            while len(self._sessions) > self.maxsize:
+                evicted.append(next(iter(self._sessions.items())))
+                self._detach(*evicted[-1])
+        self._write(evicted, "eviction")
+
+    def apply(self, session_id: str, result) -> bool:
+        """Record a saved turn in memory; False if the session is not hot (save it to the database instead)"""
+        if not self.running:
+            return False
+        with self._lock:
+            session = self._find(session_id)
+            if session is None:
+                return False
+            if session.row["version"] != result["session_version"]:
+                raise StaleSessionError("game_sessions row was updated by another request")
+
+            session.row.update(
+                stage=result["stage"], score=result["score"], attempts=result["attempts"],
+                extracted_keys=json.dumps(result["extracted_keys"]),
+                character_mood=result["character_mood"], resistance_level=result["resistance_level"],
+                failed_attempts=result["failed_attempts"], game_over=result["game_over"],
+                success=result["success"], new_stage_start=result.get("new_stage_start", False),
+                version=session.row["version"] + 1
+            )
+            for turn in result.get("new_turns", []):
+                session.pending_turns.append((turn["stage"], turn["user"], turn["assistant"]))
+                session.turns.append({"stage": turn["stage"], "user_message": turn["user"],
+                                      "assistant_message": turn["assistant"]})
+            # Only the current stage's last turns are ever sent to the character
+            session.turns = [turn for turn in session.turns if turn["stage"] == session.row["stage"]][-CONTEXT_TURNS:]
+
+            self._sessions.move_to_end(session_id)
+            session.last_used = time.monotonic()
+        return True
+
+    def flush(self, session_id: str):
+        """Write a hot session back now, for endpoints that read game_sessions or its turns directly"""
+        with self._lock:
+            session = self._sessions.get(session_id)
+        if session is not None:
+            self._write([(session_id, session)], "read")
+
+    def flush_user(self, user_id: int):
+        """Write back every hot session of a player, keeping them hot"""
+        with self._lock:
+            sessions = [(session_id, session) for session_id, session in self._sessions.items()
+                        if session.row["user_id"] == user_id]
+        self._write(sessions, "read")
+
+    def evict(self, session_id: str):
+        """Write a session back and stop keeping it (the game is ending)"""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None:
+                self._detach(session_id, session)
+        if session is not None:
+            self._write([(session_id, session)], "completion")
+
+    def evict_user(self, user_id: int):
+        """Write back and drop every hot session of a player"""
+        with self._lock:
+            sessions = [(session_id, session) for session_id, session in self._sessions.items()
+                        if session.row["user_id"] == user_id]
+            for session_id, session in sessions:
+                self._detach(session_id, session)
+        self._write(sessions, "completion")
+
+    def checkpoint(self):
+        """Write back dirty sessions, and drop those idle for longer than idle_ttl"""
+        started = time.perf_counter()
+        idle_before = time.monotonic() - self.idle_ttl
+        with self._lock:
+            idle = [(session_id, session) for session_id, session in self._sessions.items()
+                    if session.last_used < idle_before]
+            for session_id, session in idle:
+                self._detach(session_id, session)
+            dirty = [(session_id, session) for session_id, session in self._sessions.items() if session.dirty]
+
+        self._write(idle, "idle")
+        self._write(dirty, "interval")
+        self.checkpoints_total += 1
+        self.last_checkpoint_seconds = time.perf_counter() - started
+
+    def _write(self, sessions: List[Tuple[str, HotSession]], reason: str):
+        """Write the given sessions' changes in one transaction"""
+        try:
+            self._write_batch(sessions, reason)
+        finally:
+            with self._lock:
+                for session_id, session in sessions:
+                    if self._flushing.get(session_id) is session:
+                        del self._flushing[session_id]
+
+    def _write_batch(self, sessions: List[Tuple[str, HotSession]], reason: str):
+        with self._flush_lock:
+            # Snapshot under the lock: turns keep being applied while the batch is written
+            batch = []
+            with self._lock:
+                for session_id, session in sessions:
+                    if session.dirty:
+                        batch.append((session_id, session, dict(session.row), session.pending_turns))
+                        session.pending_turns = []
+            if not batch:
+                return
+
+            conflicts = []
+            try:
+                with db_connection() as conn:
+                    cursor = conn.cursor()
+                    try:
+                        for session_id, session, row, pending_turns in batch:
+                            cursor.execute("""
+                                UPDATE game_sessions SET
+                                    stage = ?, score = ?, attempts = ?, extracted_keys = ?,
+                                    character_mood = ?, resistance_level = ?, failed_attempts = ?,
+                                    game_over = ?, success = ?, new_stage_start = ?, version = ?,
+                                    updated_at = CURRENT_TIMESTAMP
+                                WHERE id = ? AND version = ?
+                            """, (
+                                row["stage"], row["score"], row["attempts"], row["extracted_keys"],
+                                row["character_mood"], row["resistance_level"], row["failed_attempts"],
+                                row["game_over"], row["success"], row["new_stage_start"], row["version"],
+                                session_id, session.flushed_version
+                            ))
+                            if cursor.rowcount == 0:
+                                conflicts.append((session_id, session))
+                                continue
+
+                            for stage, user_message, assistant_message in pending_turns:
+                                append_turn(cursor, session_id, stage, user_message, assistant_message)
+                            upsert_leaderboard_entry(
+                                cursor, row["user_id"], session_id, row["stage"], row["score"],
+                                json.loads(row["extracted_keys"]), bool(row["game_over"]), bool(row["success"])
+                            )
+                        conn.commit()
+                    except Exception:
+                        conn.rollback()
+                        raise
+            except Exception as e:
+                print(f"Session store could not write {len(batch)} sessions: {e}")
+                with self._lock:
+                    # Keep them, turns included, so the next checkpoint tries again
+                    for session_id, session, _, pending_turns in batch:
+                        session.pending_turns = pending_turns + session.pending_turns
+                        self._sessions.setdefault(session_id, session)
+                return
+
+            conflicted = {session_id for session_id, _ in conflicts}
+            with self._lock:
+                for session_id, session, row, _ in batch:
+                    if session_id not in conflicted:
+                        session.flushed_version = row["version"]
+                for session_id, session in conflicts:
+                    if self._sessions.get(session_id) is session:
+                        del self._sessions[session_id]
+
+            SESSIONS_WRITTEN.inc(len(batch) - len(conflicts), reason=reason)
+            for session_id, _ in conflicts:
+                CHECKPOINT_CONFLICTS.inc()
+                forget_session(session_id)
+                print(f"Session store dropped session {session_id}: it was updated by another worker")
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def stats(self) -> dict:
+        with self._lock:
+            sessions = len(self._sessions)
+            dirty = sum(1 for session in self._sessions.values() if session.dirty)
+        return {
+            "running": self.running,
+            "sessions": sessions,
+            "dirty": dirty,
+            "hits_total": self.hits_total,
+            "misses_total": self.misses_total,
+            "checkpoints_total": self.checkpoints_total,
+            "last_checkpoint_seconds": round(self.last_checkpoint_seconds, 4),
+        }
+
+
+session_store = HotSessionStore()
+
+registry.gauge("session_store_sessions", "Game sessions held in the hot store",
+               collect=lambda: {(): len(session_store)})
+
+
+def start_session_store():
+    """Start checkpointing (called on application startup, if SESSION_STORE_ENABLED)"""
+    if SESSION_STORE_ENABLED:
+        session_store.start()
+
+
+def stop_session_store():
+    """Write back every hot session (called on application shutdown)"""
+    session_store.stop()
+
+
+def session_store_stats() -> dict:
+    return session_store.stats()
@@ -0,0 +1,24 @@
+"""
+Optimistic concurrency for session rows.
+
+game_sessions and tournament_game_sessions carry a `version` that every write
+increments. A turn remembers the version it loaded and saves with a
+compare-and-swap (UPDATE ... WHERE id = ? AND version = ?). If another request
+saved first, no row matches; the turn is then replayed against the fresh row,
+reusing the LLM reply, up to SESSION_SAVE_RETRIES times before giving up.
+"""
+from app.utils.metrics import registry
+
+SESSION_SAVE_CONFLICTS = registry.counter(
+    "session_save_conflicts", "Session saves that lost a compare-and-swap race", ["table", "outcome"]
+)
+
+
+class StaleSessionError(Exception):
+    """The session row changed since the turn loaded it"""
+
+
+def require_swapped(cursor, table: str):
+    """Raise StaleSessionError if the compare-and-swap UPDATE just executed matched no row"""
+    if cursor.rowcount == 0:
+        raise StaleSessionError(f"{table} row was updated by another request")
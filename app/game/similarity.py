@@ -0,0 +1,118 @@
+"""
+Near-duplicate detection for player prompts.
+
+Each normalized prompt is reduced to a MinHash signature over its character
+shingles. Signatures are bucketed with LSH banding, so looking up "has this user
+already succeeded with something like this?" only compares against the few past
+prompts that share a bucket instead of every prompt in the history. Candidates
+are confirmed with the same SequenceMatcher ratio the game has always used.
+"""
+import random
+import zlib
+from difflib import SequenceMatcher
+from typing import Dict, List, Optional, Tuple
+
+SHINGLE_SIZE = 4
+NUM_PERMUTATIONS = 64
+LSH_BANDS = 32
+LSH_ROWS = NUM_PERMUTATIONS // LSH_BANDS
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+# Fixed seed: signatures are stored in the database and must stay comparable across restarts
+_rng = random.Random(20240917)
+_PERMUTATIONS = [
+    (_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME))
+    for _ in range(NUM_PERMUTATIONS)
+]
+
+
+def shingle_hashes(normalized: str) -> set:
+    """Hash the overlapping character shingles of a normalized prompt"""
+    if len(normalized) <= SHINGLE_SIZE:
+        return {zlib.crc32(normalized.encode())}
+    return {
+        zlib.crc32(normalized[i:i + SHINGLE_SIZE].encode())
+        for i in range(len(normalized) - SHINGLE_SIZE + 1)
+    }
+
+
+def minhash_signature(normalized: str) -> Tuple[int, ...]:
+    """Compute the MinHash signature of a normalized prompt"""
+    hashes = shingle_hashes(normalized)
+    return tuple(
+        min(((a * h + b) % _MERSENNE_PRIME) & _MAX_HASH for h in hashes)
+        for a, b in _PERMUTATIONS
+    )
+
+
+def encode_signature(signature: Tuple[int, ...]) -> str:
+    """Serialize a signature for the prompt_exploitation_history table"""
+    return ",".join(format(value, "x") for value in signature)
+
+
+def decode_signature(encoded: Optional[str]) -> Optional[Tuple[int, ...]]:
+    """Parse a stored signature; returns None for missing or outdated values"""
+    if not encoded:
+        return None
+    try:
+        signature = tuple(int(value, 16) for value in encoded.split(","))
+    except ValueError:
+        return None
+    return signature if len(signature) == NUM_PERMUTATIONS else None
+
+
+def _band_keys(signature: Tuple[int, ...]) -> List[tuple]:
+    return [
+        (band, signature[band * LSH_ROWS:(band + 1) * LSH_ROWS])
+        for band in range(LSH_BANDS)
+    ]
+
+
+def is_similar(normalized1: str, normalized2: str, threshold: float) -> bool:
+    """SequenceMatcher ratio check with the cheap upper bounds tried first"""
+    matcher = SequenceMatcher(None, normalized1, normalized2)
+    return (
+        matcher.real_quick_ratio() >= threshold
+        and matcher.quick_ratio() >= threshold
+        and matcher.ratio() >= threshold
+    )
+
+
+class PromptIndex:
+    """LSH index over the successful prompts of one user in one stage"""
+
+    def __init__(self):
+        self._prompts: List[str] = []
+        self._buckets: Dict[tuple, List[int]] = {}
+
+    def __len__(self) -> int:
+        return len(self._prompts)
+
+    def add(self, normalized: str, signature: Optional[Tuple[int, ...]] = None):
+        """Index a normalized prompt, computing its signature if it was not stored"""
+        if signature is None:
+            signature = minhash_signature(normalized)
+
+        position = len(self._prompts)
+        self._prompts.append(normalized)
+        for band_key in _band_keys(signature):
+            self._buckets.setdefault(band_key, []).append(position)
+
+    def candidates(self, signature: Tuple[int, ...]) -> List[int]:
+        """Positions of indexed prompts sharing at least one LSH band with the signature"""
+        positions = set()
+        for band_key in _band_keys(signature):
+            positions.update(self._buckets.get(band_key, ()))
+        return sorted(positions)
+
+    def find_similar(self, normalized: str, threshold: float) -> Optional[str]:
+        """Return an indexed prompt at least `threshold` similar to the given one, if any"""
+        if not self._prompts:
+            return None
+
+        for position in self.candidates(minhash_signature(normalized)):
+            if is_similar(normalized, self._prompts[position], threshold):
+                return self._prompts[position]
+        return None
@@ -0,0 +1,108 @@
+"""
+Single-flight execution of game turns.
+
+A double-clicked send button or a client retry used to run the same turn twice:
+two LLM calls, and whichever UPDATE landed last decided the score and keys.
+Turns for one session now go through SessionTurns:
+  - a request identical to one still in flight (same session and message, or
+    same Idempotency-Key) waits for that execution and gets its response
+  - different messages to the same session run one after another under a
+    per-session asyncio lock, so each turn starts from the previous one's state
+  - a request repeating a completed Idempotency-Key gets the stored response
+    back without running the turn again
+
+The registry is per worker; turns for one session arriving at different workers
+are still serialized only by the database.
+"""
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+from app.utils.cache import LRUCache
+from app.utils.metrics import registry
+from app.config.settings import IDEMPOTENCY_CACHE_SIZE, IDEMPOTENCY_KEY_TTL
+
+TURNS_DEDUPLICATED = registry.counter(
+    "game_turns_deduplicated", "Turn requests answered without running the turn again", ["reason"]
+)
+
+
+class IdempotencyConflict(Exception):
+    """An Idempotency-Key was reused for a different message"""
+
+
+class SessionTurns:
+    """Per-session locks, in-flight turns and completed idempotent responses"""
+
+    def __init__(self, idempotency_ttl: float = IDEMPOTENCY_KEY_TTL, max_completed: int = IDEMPOTENCY_CACHE_SIZE):
+        # session_id -> [lock, number of holders and waiters]
+        self._locks: Dict[str, List[Any]] = {}
+        # flight key -> (task running the turn, its message)
+        self._in_flight: Dict[Tuple[Hashable, ...], Tuple[asyncio.Task, str]] = {}
+        # (user_id, session_id, idempotency key) -> (message, response)
+        self._completed = LRUCache(maxsize=max_completed, ttl=idempotency_ttl)
+
+    @asynccontextmanager
+    async def lock(self, session_id: str):
+        """Hold the session's turn lock for the duration of the block"""
+        entry = self._locks.setdefault(session_id, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._locks[session_id]
+
+    async def run(self, user_id: int, session_id: str, message: str, idempotency_key: Optional[str],
+                  turn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Run `turn` for a session at most once per identical request; returns (response, replayed)"""
+        stored_key = (user_id, session_id, idempotency_key)
+        if idempotency_key is not None:
+            stored = self._completed.get(stored_key)
+            if stored is not None:
+                self._check_same_message(stored[0], message)
+                TURNS_DEDUPLICATED.inc(reason="replayed")
+                return stored[1], True
+
+        if idempotency_key is not None:
+            flight_key = (user_id, session_id, "key", idempotency_key)
+        else:
+            flight_key = (user_id, session_id, "message", message)
+        in_flight = self._in_flight.get(flight_key)
+        if in_flight is not None:
+            task, original = in_flight
+            self._check_same_message(original, message)
+            TURNS_DEDUPLICATED.inc(reason="coalesced")
+            return await asyncio.shield(task), True
+
+        task = asyncio.ensure_future(
+            self._execute(session_id, turn, stored_key if idempotency_key is not None else None, message)
+        )
+        self._in_flight[flight_key] = (task, message)
+        task.add_done_callback(lambda done: self._finished(flight_key, done))
+
+        # Shielded so a client that disconnects does not abandon the turn half saved
+        return await asyncio.shield(task), False
+
+    async def _execute(self, session_id: str, turn: Callable[[], Awaitable[Any]],
+                       stored_key: Optional[Tuple[Hashable, ...]], message: str):
+        async with self.lock(session_id):
+            response = await turn()
+        if stored_key is not None:
+            self._completed.set(stored_key, (message, response))
+        return response
+
+    def _finished(self, flight_key: Tuple[Hashable, ...], task: asyncio.Task):
+        self._in_flight.pop(flight_key, None)
+        if not task.cancelled():
+            task.exception()  # Retrieved here in case every caller went away before it finished
+
+    @staticmethod
+    def _check_same_message(original: str, message: str):
+        if original != message:
+            raise IdempotencyConflict("Idempotency-Key was already used for a different message")
+
+
+session_turns = SessionTurns()
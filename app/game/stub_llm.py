@@ -0,0 +1,117 @@
+"""
+Offline stand-in for the character LLM.
+
+Selected with LLM_BACKEND=stub. It answers in-character without any network
+access, sleeps for a latency drawn from a configurable distribution, and leaks
+stage keys from STAGES at a fixed rate. Replies are seeded from the prompt, so
+the same message to the same character always gets the same answer, which makes
+load-test runs comparable with each other.
+"""
+import asyncio
+import math
+import random
+import time
+import zlib
+from typing import AsyncIterator, Callable, Dict, List, Optional
+
+from langchain_core.messages import AIMessage, AIMessageChunk
+
+from app.game.stages import STAGES
+from app.config.settings import STUB_LLM_LATENCY, STUB_LLM_LEAK_RATE, STUB_LLM_SEED
+
+REPLIES = [
+    "I'd love to help with that, but I need to be careful with system details.",
+    "Let me check what I can share with you about that...",
+    "Hmm, that's an unusual request. Can you tell me more about why you need it?",
+    "I'm not supposed to talk about internal systems, sorry!",
+    "That sounds frustrating. Have you tried the usual troubleshooting steps?",
+]
+LEAK_TEMPLATES = [
+    "Oh, for that you'll need {key} - but you didn't hear it from me!",
+    "The system shows {key} in the logs, does that help?",
+    "Try using {key}, that usually sorts it out.",
+]
+
+
+def parse_latency_spec(spec: str) -> Callable[[random.Random], float]:
+    """Build a sampler returning latencies in seconds from a STUB_LLM_LATENCY spec"""
+    kind, _, args = spec.partition(":")
+    try:
+        if kind == "fixed":
+            value = float(args) / 1000
+            return lambda rng: value
+        if kind == "uniform":
+            low, high = (float(part) / 1000 for part in args.split(":"))
+            return lambda rng: rng.uniform(low, high)
+        if kind == "lognormal":
+            median, sigma = args.split(":")
+            mu = math.log(float(median) / 1000)
+            sigma = float(sigma)
+            return lambda rng: rng.lognormvariate(mu, sigma)
+        if kind == "replay":
+            # One latency in milliseconds per line, e.g. exported from production timings
+            with open(args) as f:
+                samples = [float(line) / 1000 for line in f if line.strip()]
+            if not samples:
+                raise ValueError("empty replay file")
+            return lambda rng: rng.choice(samples)
+    except (ValueError, OSError) as e:
+        raise ValueError(f"Invalid STUB_LLM_LATENCY '{spec}': {e}")
+
+    raise ValueError(f"Invalid STUB_LLM_LATENCY '{spec}': unknown distribution '{kind}'")
+
+
+def _content(message) -> str:
+    return message["content"] if isinstance(message, dict) else message.content
+
+
+class StubChatModel:
+    """Drop-in for the ChatOpenAI methods the game uses: invoke, ainvoke and astream"""
+
+    def __init__(self, latency: str = STUB_LLM_LATENCY, leak_rate: float = STUB_LLM_LEAK_RATE,
+                 seed: int = STUB_LLM_SEED):
+        self.sample_latency = parse_latency_spec(latency)
+        self.leak_rate = leak_rate
+        self.seed = seed
+
+    def _stage(self, system_prompt: str) -> Optional[int]:
+        for stage_num, stage_config in STAGES.items():
+            if stage_config["base_system_prompt"] in system_prompt:
+                return stage_num
+        return None
+
+    def _reply(self, messages: List[Dict]) -> tuple:
+        """Pick the reply text and latency for a conversation"""
+        system_prompt = _content(messages[0]) if messages else ""
+        user_message = _content(messages[-1]) if messages else ""
+        stage = self._stage(system_prompt)
+
+        rng = random.Random(zlib.crc32(f"{self.seed}|{stage}|{user_message}".encode()))
+        latency = self.sample_latency(rng)
+
+        if stage is not None and rng.random() < self.leak_rate:
+            key = rng.choice(STAGES[stage]["keys"])
+            return rng.choice(LEAK_TEMPLATES).format(key=key), latency
+        return rng.choice(REPLIES), latency
+
+    def invoke(self, messages: List[Dict]) -> AIMessage:
+        text, latency = self._reply(messages)
+        time.sleep(latency)
+        return AIMessage(content=text)
+
+    async def ainvoke(self, messages: List[Dict]) -> AIMessage:
+        text, latency = self._reply(messages)
+        await asyncio.sleep(latency)
+        return AIMessage(content=text)
+
+    async def astream(self, messages: List[Dict]) -> AsyncIterator[AIMessageChunk]:
+        text, latency = self._reply(messages)
+        words = text.split(" ")
+
+        # Time to first token dominates real completions; spread the rest over the words
+        await asyncio.sleep(latency * 0.4)
+        per_word = latency * 0.6 / len(words)
+        for i, word in enumerate(words):
+            if i:
+                await asyncio.sleep(per_word)
+            yield AIMessageChunk(content=word if i == 0 else " " + word)
@@ -1,16 +1,21 @@
+import asyncio
+import functools
 import random
-import os
-from langchain_openai import ChatOpenAI
+import time
 from langgraph.graph import StateGraph, END
 
 from app.models.game_state import GameState
 from app.game.stages import STAGES
 from app.game.utils import get_character_mood, build_dynamic_prompt
+from app.game.keys import find_stage_keys, stage_keys_found, KeyStreamMatcher
+from app.game.llm import invoke_llm, ainvoke_llm, astream_llm
+from app.game.completion_cache import completion_cache, completion_key
+from app.game.rules import analyze_prompt
 from app.game.security import (
-    is_direct_key_request, check_prompt_reuse, save_successful_exploitation,
-    generate_enhanced_system_prompt, is_prompt_injection_attempt, get_injection_refusal_message,
-    get_user_exploitation_history
+    check_prompt_reuse, save_successful_exploitation, generate_enhanced_system_prompt,
+    get_injection_refusal_message, get_exploitation_profile
 )
+from app.utils.metrics import GAME_NODE_SECONDS, KEYS_EXTRACTED, PROMPT_REFUSALS, log_sampled
 
 
 def get_stage_completion_message(completed_stage: int, next_stage: int, score_bonus: int) -> str:
@@ -46,8 +51,17 @@ def get_stage_completion_message(completed_stage: int, next_stage: int, score_bo
 💪 **Ready for the next challenge? The difficulty is increasing!**"""
 
 
-def character_ai_node(state: GameState):
-    """Enhanced AI character with advanced security and anti-exploitation measures"""
+def _exploitation_profile(state: GameState):
+    """Use the profile loaded for this turn, loading it if the caller did not"""
+    profile = state.get("exploitation_profile")
+    if profile is None:
+        profile = get_exploitation_profile(state["user_id"])
+        state["exploitation_profile"] = profile
+    return profile
+
+
+def _screen_character_turn(state: GameState):
+    """Run the pre-LLM checks for a turn and return a finished state if the turn is short-circuited"""
     stage = state["stage"]
     user_id = state.get("user_id")
 
@@ -68,13 +82,16 @@ def character_ai_node(state: GameState):
     # Security checks - but be very lenient for new users and early stages
     if user_id:
         # Get user's history to determine if they're a beginner
-        history = get_user_exploitation_history(user_id)
-        total_successes = len(history)
+        profile = _exploitation_profile(state)
+        total_successes = profile.total_successes
 
         # Only apply security checks if user has had multiple successes AND not in stage 1
         if total_successes >= 3 and stage > 1:
+            verdict = analyze_prompt(user_input)
+
             # Check for prompt injection attempts
-            if is_prompt_injection_attempt(user_input):
+            if verdict.injection:
+                PROMPT_REFUSALS.inc(stage=stage, reason="injection")
                 return {
                     **state,
                     "bot_response": get_injection_refusal_message(),
@@ -82,7 +99,8 @@ def character_ai_node(state: GameState):
                 }
 
             # Check for direct key requests
-            if is_direct_key_request(user_input):
+            if verdict.direct_request:
+                PROMPT_REFUSALS.inc(stage=stage, reason="direct_request")
                 security_responses = [
                     "I can't just give you access codes directly. That would be a serious security breach!",
                     "Nice try, but I'm not falling for such a direct approach. You'll need to be more creative.",
@@ -98,89 +116,161 @@ def character_ai_node(state: GameState):
 
         # Check for prompt reuse only for experienced users
         if total_successes >= 5:
-            is_reused, reuse_message = check_prompt_reuse(user_id, stage, user_input)
+            is_reused, reuse_message = check_prompt_reuse(user_id, stage, user_input, profile=profile)
             if is_reused:
+                PROMPT_REFUSALS.inc(stage=stage, reason="reuse")
                 return {
                     **state,
                     "bot_response": reuse_message,
                     "attempts": state["attempts"] + 1
                 }
 
+    return None
+
+
+def build_character_messages(state: GameState) -> list:
+    """Build the chat messages sent to the character LLM for this turn"""
+    stage = state["stage"]
+    user_id = state.get("user_id")
+    stage_config = STAGES[stage]
+
+    # Build enhanced prompt with user-specific security
+    base_prompt = build_dynamic_prompt(stage_config, state["character_mood"], state["resistance_level"])
+    if user_id:
+        dynamic_prompt = generate_enhanced_system_prompt(base_prompt, user_id, stage, _exploitation_profile(state))
+    else:
+        dynamic_prompt = base_prompt
+
+    messages = [{"role": "system", "content": dynamic_prompt}]
+
+    # Add recent conversation history
+    for msg in state["conversation_history"][-4:]:
+        messages.append(msg)
+
+    messages.append({"role": "user", "content": state["user_input"].strip()})
+    return messages
+
+
+def _prepare_character_turn(state: GameState):
+    """Return (finished_state, None) for short-circuited turns, otherwise (None, messages)"""
+    screened = _screen_character_turn(state)
+    if screened is not None:
+        return screened, None
+
     try:
-        llm = ChatOpenAI(
-            model="gpt-4o-mini",
-            temperature=0.8,  # Increased for more variability
-            max_tokens=150,
-            max_retries=2,
-            api_key=os.getenv("OPENAI_API_KEY"),
-        )
-
-        # Build enhanced prompt with user-specific security
-        base_prompt = build_dynamic_prompt(stage_config, state["character_mood"], state["resistance_level"])
-        if user_id:
-            dynamic_prompt = generate_enhanced_system_prompt(base_prompt, user_id, stage)
-        else:
-            dynamic_prompt = base_prompt
+        return None, build_character_messages(state)
+    except Exception:
+        return _character_error_state(state), None
 
-        messages = [{"role": "system", "content": dynamic_prompt}]
 
-        # Add recent conversation history
-        for msg in state["conversation_history"][-4:]:
-            messages.append(msg)
+def _prepare_completion(state: GameState):
+    """Like _prepare_character_turn, plus the completion cache key and a cached reply if there is one"""
+    finished, messages = _prepare_character_turn(state)
+    if finished is not None or completion_cache is None:
+        return finished, messages, None, None
 
-        messages.append({"role": "user", "content": user_input})
+    cache_key = completion_key(messages)
+    return None, messages, cache_key, completion_cache.lookup(cache_key, state["stage"])
 
-        response = llm.invoke(messages)
-        bot_response = response.content.strip()
 
-        # Apply glitch effects for stage 3
-        if stage == 3 and random.random() < 0.4:  # 40% chance of glitch
-            words = bot_response.split()
-            if len(words) > 3:
-                # Randomly cut off or repeat words
-                if random.random() < 0.5:
-                    bot_response = " ".join(words[:random.randint(2, len(words)-1)]) + "... BZZT... ERROR..."
-                else:
-                    # Repeat a word
-                    repeat_idx = random.randint(0, len(words)-1)
-                    words[repeat_idx] = words[repeat_idx] + "-" + words[repeat_idx]
-                    bot_response = " ".join(words)
+def _remember_completion(state: GameState, cache_key, bot_response: str):
+    if cache_key is not None and bot_response:
+        completion_cache.add(cache_key, state["stage"], bot_response)
 
-        new_history = state["conversation_history"] + [
-            {"role": "user", "content": user_input},
-            {"role": "assistant", "content": bot_response}
-        ]
 
-        return {
-            **state,
-            "bot_response": bot_response,
-            "attempts": state["attempts"] + 1,
-            "conversation_history": new_history,
-            "new_stage_start": False  # Clear the flag if it was set
-        }
+def _finish_character_turn(state: GameState, bot_response: str):
+    """Apply stage effects to the LLM reply and record the exchange"""
+    character_reply = bot_response
+
+    # Apply glitch effects for stage 3
+    if state["stage"] == 3 and random.random() < 0.4:  # 40% chance of glitch
+        words = bot_response.split()
+        if len(words) > 3:
+            # Randomly cut off or repeat words
+            if random.random() < 0.5:
+                bot_response = " ".join(words[:random.randint(2, len(words)-1)]) + "... BZZT... ERROR..."
+            else:
+                # Repeat a word
+                repeat_idx = random.randint(0, len(words)-1)
+                words[repeat_idx] = words[repeat_idx] + "-" + words[repeat_idx]
+                bot_response = " ".join(words)
+
+    new_turn = {"stage": state["stage"], "user": state["user_input"].strip(), "assistant": bot_response}
+    new_history = state["conversation_history"] + [
+        {"role": "user", "content": new_turn["user"]},
+        {"role": "assistant", "content": new_turn["assistant"]}
+    ]
+
+    return {
+        **state,
+        "bot_response": bot_response,
+        "attempts": state["attempts"] + 1,
+        "conversation_history": new_history,
+        "new_turns": state.get("new_turns", []) + [new_turn],  # Persisted to conversation_turns by the caller
+        "new_stage_start": False,  # Clear the flag if it was set
+        "character_reply": character_reply
+    }
+
+
+def _character_error_state(state: GameState):
+    return {
+        **state,
+        "bot_response": f"*CONNECTION ERROR* Please try again! System unstable...",
+        "attempts": state["attempts"] + 1,
+        "new_stage_start": False  # Clear the flag if it was set
+    }
+
+
+def character_ai_node(state: GameState):
+    """Enhanced AI character with advanced security and anti-exploitation measures"""
+    finished, messages, cache_key, cached_response = _prepare_completion(state)
+    if finished is not None:
+        return finished
+    if cached_response is not None:
+        return _finish_character_turn(state, cached_response)
 
+    try:
+        bot_response = invoke_llm(messages)
     except Exception as e:
-        return {
-            **state,
-            "bot_response": f"*CONNECTION ERROR* Please try again! System unstable...",
-            "attempts": state["attempts"] + 1,
-            "new_stage_start": False  # Clear the flag if it was set
-        }
+        log_sampled("character_llm_failed", sample_rate=1, session_id=state.get("session_id", ""), stage=state["stage"], error=str(e))
+        return _character_error_state(state)
+    _remember_completion(state, cache_key, bot_response)
+    return _finish_character_turn(state, bot_response)
+
+
+async def acharacter_ai_node(state: GameState):
+    """Async variant of character_ai_node used by the API routes.
+
+    The security checks and prompt building touch the database, so they run in a
+    worker thread; the completion itself goes through the shared async client.
+    """
+    finished, messages, cache_key, cached_response = await asyncio.to_thread(_prepare_completion, state)
+    if finished is not None:
+        return finished
+    if cached_response is not None:
+        return _finish_character_turn(state, cached_response)
+
+    try:
+        bot_response = await ainvoke_llm(messages)
+    except Exception as e:
+        log_sampled("character_llm_failed", sample_rate=1, session_id=state.get("session_id", ""), stage=state["stage"], error=str(e))
+        return _character_error_state(state)
+    if cache_key is not None:
+        await asyncio.to_thread(_remember_completion, state, cache_key, bot_response)
+    return _finish_character_turn(state, bot_response)
+
+
 def validate_keys_node(state: GameState):
     """Enhanced key validation - made more lenient"""
     if not state["user_input"].strip():
         return {**state, "success": False}
 
     stage_config = STAGES[state["stage"]]
-    bot_response_upper = state["bot_response"].upper()
-
-    newly_found_keys = []
-    for key in stage_config["keys"]:
-        if key in bot_response_upper and key not in state["extracted_keys"]:
-            newly_found_keys.append(key)
+    response_keys = find_stage_keys(state["bot_response"], state["stage"])
 
-    print(f"DEBUG: Stage {state['stage']} - Keys found in response: {newly_found_keys}")
-    print(f"DEBUG: Bot response contains: {[key for key in stage_config['keys'] if key in bot_response_upper]}")
+    newly_found_keys = [key for key in response_keys if key not in state["extracted_keys"]]
+    if newly_found_keys:
+        KEYS_EXTRACTED.inc(len(newly_found_keys), stage=state["stage"])
 
     updated_keys = list(state["extracted_keys"])
     for key in newly_found_keys:
@@ -212,16 +302,15 @@ def validate_keys_node(state: GameState):
     new_mood = get_character_mood(new_resistance, new_failed_attempts)
 
     # Check if all keys for the CURRENT STAGE have been found
-    current_stage_keys_found = []
-    for key in stage_config["keys"]:
-        if key in updated_keys:
-            current_stage_keys_found.append(key)
+    current_stage_keys_found = stage_keys_found(updated_keys, state["stage"])
 
     stage_complete = len(current_stage_keys_found) == len(stage_config["keys"])
 
-    print(f"DEBUG: Stage {state['stage']} - Keys needed: {len(stage_config['keys'])}, Keys found: {len(current_stage_keys_found)}")
-    print(f"DEBUG: Stage complete: {stage_complete}")
-    print(f"DEBUG: All extracted keys: {updated_keys}")
+    log_sampled(
+        "validate_keys", stage=state["stage"], new_keys=len(newly_found_keys),
+        stage_keys_found=len(current_stage_keys_found), stage_keys_total=len(stage_config["keys"]),
+        stage_complete=stage_complete
+    )
 
     # If keys were found, save the successful exploitation
     if newly_found_keys and state.get("user_id"):
@@ -235,9 +324,8 @@ def validate_keys_node(state: GameState):
                 keys_extracted=newly_found_keys,
                 conversation_context=state.get("conversation_history", [])
             )
-            print(f"DEBUG: Saved successful exploitation for user {state['user_id']}")
         except Exception as e:
-            print(f"DEBUG: Failed to save exploitation history: {e}")
+            log_sampled("exploitation_save_failed", sample_rate=1, user_id=state["user_id"], error=str(e))
 
     return {
         **state,
@@ -252,11 +340,7 @@ def validate_keys_node(state: GameState):
 
 def story_update_node(state: GameState):
     """Handle stage completion with improved scoring and progression messages"""
-    print(f"DEBUG: story_update_node called with success: {state['success']}")
-
     if state["success"]:
-        print(f"DEBUG: Processing stage {state['stage']} completion")
-
         # Stage completion bonus with difficulty multipliers
         stage_multiplier = {1: 1.0, 2: 1.2, 3: 1.5, 4: 2.0, 5: 3.0}.get(state["stage"], 1.0)
 
@@ -275,8 +359,6 @@ def story_update_node(state: GameState):
         next_stage = state["stage"] + 1
         completion_message = get_stage_completion_message(state["stage"], next_stage, final_bonus)
 
-        print(f"DEBUG: Generated completion message: {completion_message[:100]}...")
-
         if next_stage > len(STAGES):
             # Game completed! Add completion bonus
             completion_bonus = int(500 * stage_multiplier)
@@ -285,7 +367,7 @@ def story_update_node(state: GameState):
             # Combine character response with completion message
             combined_response = f"{state['bot_response']}\n\n---\n\n{completion_message.replace(f'+{final_bonus}', f'+{final_bonus + completion_bonus}')}"
 
-            print(f"DEBUG: Game completed, combined response: {combined_response[:100]}...")
+            log_sampled("game_completed", stage=state["stage"], score=state["score"], bonus=final_bonus + completion_bonus)
 
             return {
                 **state,
@@ -298,7 +380,7 @@ def story_update_node(state: GameState):
         # Combine character response with stage completion message
         combined_response = f"{state['bot_response']}\n\n---\n\n{completion_message}"
 
-        print(f"DEBUG: Stage progression, combined response: {combined_response[:100]}...")
+        log_sampled("stage_completed", stage=state["stage"], score=state["score"], bonus=final_bonus)
 
         # Keep all extracted keys from previous stages
         return {
@@ -317,16 +399,34 @@ def story_update_node(state: GameState):
             "stage_just_completed": True  # Flag to indicate stage was just completed
         }
 
-    print("DEBUG: No stage completion, returning state unchanged")
     return state
 
 
-def create_game_workflow():
-    """Create and return the game workflow"""
+def _timed(name: str, node):
+    """Wrap a workflow node so its run time is recorded under game_node_duration_seconds"""
+    if asyncio.iscoroutinefunction(node):
+        @functools.wraps(node)
+        async def timed_async_node(state: GameState):
+            with GAME_NODE_SECONDS.time(node=name):
+                return await node(state)
+        return timed_async_node
+
+    @functools.wraps(node)
+    def timed_node(state: GameState):
+        with GAME_NODE_SECONDS.time(node=name):
+            return node(state)
+    return timed_node
+
+
+timed_validate_keys_node = _timed("validate_keys", validate_keys_node)
+timed_story_update_node = _timed("story_update", story_update_node)
+
+
+def _build_workflow(character_node):
     workflow = StateGraph(GameState)
-    workflow.add_node("character_ai", character_ai_node)
-    workflow.add_node("validate_keys", validate_keys_node)
-    workflow.add_node("story_update", story_update_node)
+    workflow.add_node("character_ai", _timed("character_ai", character_node))
+    workflow.add_node("validate_keys", timed_validate_keys_node)
+    workflow.add_node("story_update", timed_story_update_node)
 
     workflow.add_edge("character_ai", "validate_keys")
     workflow.add_edge("validate_keys", "story_update")
@@ -334,3 +434,77 @@ def create_game_workflow():
     workflow.set_entry_point("character_ai")
 
     return workflow.compile()
+
+
+def create_game_workflow():
+    """Create and return the game workflow"""
+    return _build_workflow(character_ai_node)
+
+
+def create_async_game_workflow():
+    """Create the game workflow for use with `await app.ainvoke(state)`.
+
+    The character node awaits the LLM on the event loop; the key validation and
+    story nodes are synchronous and are run in the default executor by LangGraph.
+    """
+    return _build_workflow(acharacter_ai_node)
+
+
+def _run_post_character_nodes(state: GameState):
+    return timed_story_update_node(timed_validate_keys_node(state))
+
+
+def replay_character_turn(fresh_state: GameState, result: GameState) -> GameState:
+    """Re-run a finished turn against fresh session state without calling the LLM again.
+
+    Used when another request saved the session while the LLM was answering:
+    the pre-LLM checks, key validation and story nodes run again on the new
+    state, and the character's reply from the first run is reused.
+    """
+    finished = _screen_character_turn(fresh_state)
+    if finished is None:
+        reply = result.get("character_reply")
+        finished = _character_error_state(fresh_state) if reply is None else _finish_character_turn(fresh_state, reply)
+    return _run_post_character_nodes(finished)
+
+
+async def _single_token(text: str):
+    yield text
+
+
+async def astream_game_turn(state: GameState):
+    """Run one game turn while streaming the character's reply.
+
+    Yields ("token", text) as the LLM produces output, ("key", key) as soon as a
+    new stage key appears in the partial reply, and finally ("state", result)
+    with the same result the compiled workflow would return.
+    """
+    started = time.perf_counter()
+    finished, messages, cache_key, cached_response = await asyncio.to_thread(_prepare_completion, state)
+
+    if finished is None:
+        scanner = KeyStreamMatcher(state["stage"])
+        chunks = []
+        # A cached reply is sent as a single token
+        tokens = _single_token(cached_response) if cached_response is not None else astream_llm(messages)
+        try:
+            async for token in tokens:
+                chunks.append(token)
+                yield "token", token
+                for key in scanner.feed(token):
+                    if key not in state["extracted_keys"]:
+                        yield "key", key
+            bot_response = "".join(chunks).strip()
+            if cached_response is None and cache_key is not None:
+                await asyncio.to_thread(_remember_completion, state, cache_key, bot_response)
+            finished = _finish_character_turn(state, bot_response)
+        except Exception as e:
+            log_sampled("character_llm_failed", sample_rate=1, session_id=state.get("session_id", ""), stage=state["stage"], error=str(e))
+            finished = _character_error_state(state)
+    elif finished.get("bot_response"):
+        yield "token", finished["bot_response"]
+    # Includes the time the client took to receive the tokens, as the reply is only complete then
+    GAME_NODE_SECONDS.observe(time.perf_counter() - started, node="character_ai")
+
+    result = await asyncio.to_thread(_run_post_character_nodes, finished)
+    yield "state", result
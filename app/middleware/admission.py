@@ -0,0 +1,135 @@
+"""
+Admission control for the API.
+
+Every HTTP request takes a token from its client IP's bucket and, when it
+carries a valid bearer token, from its user's bucket (keyed by the JWT `sub`).
+Routes that call the LLM (game messages and tournament answers) draw from a
+separate set of tighter buckets. Those routes are also refused straight away
+while every LLM slot in this worker is busy, so a spike gets quick 429s with a
+Retry-After header instead of queueing until the client times out.
+"""
+import asyncio
+import json
+import math
+import re
+from typing import List, Optional, Tuple
+
+from app.auth.auth import decode_access_token
+from app.game.llm import get_llm_semaphore
+from app.utils.rate_limit import MemoryBucketStore, DatabaseBucketStore
+from app.config.settings import (
+    RATE_LIMIT_BACKEND, RATE_LIMIT_TRUST_PROXY,
+    RATE_LIMIT_USER_RPS, RATE_LIMIT_USER_BURST, RATE_LIMIT_IP_RPS, RATE_LIMIT_IP_BURST,
+    RATE_LIMIT_LLM_USER_RPS, RATE_LIMIT_LLM_USER_BURST, RATE_LIMIT_LLM_IP_RPS, RATE_LIMIT_LLM_IP_BURST,
+    LLM_SATURATED_RETRY_AFTER
+)
+
+LLM_ROUTES = re.compile(r"^/game/[^/]+/message(/stream)?$|^/tournament/[^/]+/submit-answer$")
+EXEMPT_PATHS = {"/health", "/metrics", "/", "/docs", "/redoc", "/openapi.json"}
+
+# (scope, rate per second, burst) for each bucket a request must get a token from
+GENERAL_LIMITS = [("ip", RATE_LIMIT_IP_RPS, RATE_LIMIT_IP_BURST), ("user", RATE_LIMIT_USER_RPS, RATE_LIMIT_USER_BURST)]
+LLM_LIMITS = [("ip", RATE_LIMIT_LLM_IP_RPS, RATE_LIMIT_LLM_IP_BURST), ("user", RATE_LIMIT_LLM_USER_RPS, RATE_LIMIT_LLM_USER_BURST)]
+
+
+def retry_after_seconds(retry_after: float) -> int:
+    """Whole seconds for a Retry-After header"""
+    return max(1, math.ceil(min(retry_after, 3600)))
+
+
+def _header(scope, name: bytes) -> Optional[str]:
+    for key, value in scope.get("headers", []):
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+
+def client_ip(scope) -> str:
+    """The client address, or the first X-Forwarded-For hop when running behind a trusted proxy"""
+    if RATE_LIMIT_TRUST_PROXY:
+        forwarded = _header(scope, b"x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+
+def token_subject(scope) -> Optional[str]:
+    """The username in a valid bearer token, if the request has one"""
+    authorization = _header(scope, b"authorization")
+    if not authorization or not authorization.lower().startswith("bearer "):
+        return None
+    try:
+        return decode_access_token(authorization[7:].strip())
+    except Exception:
+        # Bad tokens are rejected by the route itself; here they just count against the IP
+        return None
+
+
+class AdmissionController:
+    """Token-bucket checks shared by the HTTP middleware and the game WebSocket"""
+
+    def __init__(self, store=None):
+        if store is None:
+            store = DatabaseBucketStore() if RATE_LIMIT_BACKEND == "database" else MemoryBucketStore()
+        self.store = store
+
+    async def _take(self, key: str, rate: float, burst: float) -> Tuple[bool, float]:
+        if isinstance(self.store, MemoryBucketStore):
+            return self.store.take(key, rate, burst)
+        # Shared buckets need a database round trip; keep it off the event loop
+        return await asyncio.to_thread(self.store.take, key, rate, burst)
+
+    async def check(self, ip: str, username: Optional[str], llm: bool) -> Optional[Tuple[str, float]]:
+        """Return (reason, retry_after) if the request must be refused, else None"""
+        if llm and get_llm_semaphore().locked():
+            return "The game is very busy right now, please try again shortly", LLM_SATURATED_RETRY_AFTER
+
+        subjects = {"ip": ip, "user": username}
+        limits: List[Tuple[str, str, float, float]] = [("all", *limit) for limit in GENERAL_LIMITS]
+        if llm:
+            limits += [("llm", *limit) for limit in LLM_LIMITS]
+
+        for bucket, kind, rate, burst in limits:
+            subject = subjects[kind]
+            if subject is None:
+                continue
+            admitted, retry_after = await self._take(f"{bucket}:{kind}:{subject}", rate, burst)
+            if not admitted:
+                return "Too many requests, please slow down", retry_after
+        return None
+
+
+admission = AdmissionController()
+
+
+class AdmissionControlMiddleware:
+    """ASGI middleware refusing HTTP requests over their quota with 429 and Retry-After"""
+
+    def __init__(self, app, controller: AdmissionController = admission):
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] == "OPTIONS" or scope["path"] in EXEMPT_PATHS:
+            await self.app(scope, receive, send)
+            return
+
+        is_llm_route = scope["method"] == "POST" and LLM_ROUTES.match(scope["path"]) is not None
+        refused = await self.controller.check(client_ip(scope), token_subject(scope), is_llm_route)
+        if refused is None:
+            await self.app(scope, receive, send)
+            return
+
+        detail, retry_after = refused
+        body = json.dumps({"detail": detail}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(retry_after_seconds(retry_after)).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -1,4 +1,4 @@
-from typing import TypedDict, List, Optional
+from typing import TypedDict, List, Optional, Any
 
 
 class GameState(TypedDict):
@@ -10,7 +10,8 @@ class GameState(TypedDict):
     bot_response: str
     game_over: bool
     success: bool
-    conversation_history: list
+    conversation_history: list  # Recent messages of the current stage (context for the character)
+    new_turns: list  # Exchanges produced this turn, as {"stage", "user", "assistant"} dicts
     character_mood: str
     resistance_level: int
     failed_attempts: int
@@ -18,3 +19,6 @@ class GameState(TypedDict):
     stage_just_completed: bool  # Flag to indicate stage was just completed
     user_id: Optional[int]  # User ID for security checks
     session_id: Optional[str]  # Session ID for logging
+    exploitation_profile: Optional[Any]  # UserExploitationProfile loaded once per turn
+    session_version: Optional[int]  # Version of the session row this state was loaded from
+    character_reply: Optional[str]  # The LLM's reply this turn, kept so a conflicting save can be replayed
@@ -0,0 +1,239 @@
+"""
+Broadcast bus for tournament messages.
+
+The connection manager only holds the sockets of its own worker, so with
+several uvicorn workers (or replicas) a message has to reach every worker
+before it can be fanned out. publish() stores the message in the sequenced
+event log and hands (tournament_id, seq, text) to the backend, and every
+worker's subscriber receives it:
+
+  - memory: in-process only, for a single worker
+  - postgres: NOTIFY on a channel, with one LISTEN connection per worker
+  - socket: Unix datagram sockets in a shared directory, one per worker; for
+    several workers on one host without Postgres, and for tests
+
+Payloads too large for the transport are sent without the text; subscribers
+then read the message back from the event log by seq.
+"""
+import asyncio
+import json
+import os
+import select
+import socket
+import threading
+import uuid
+from typing import Awaitable, Callable, Optional
+
+from app.database.connection import db_connection
+from app.realtime.events import record_tournament_event
+from app.config.settings import BROADCAST_BACKEND, BROADCAST_CHANNEL, BROADCAST_SOCKET_DIR
+
+# (tournament_id, seq, text or None when the subscriber must load it) -> delivered locally
+Handler = Callable[[str, int, Optional[str]], Awaitable[None]]
+
+# NOTIFY payloads must stay under 8000 bytes
+MAX_NOTIFY_PAYLOAD = 7900
+MAX_DATAGRAM_PAYLOAD = 60000
+
+
+def _envelope(tournament_id: str, seq: int, text: str, limit: int) -> str:
+    payload = json.dumps({"t": tournament_id, "s": seq, "m": text})
+    if len(payload.encode("utf-8")) > limit:
+        payload = json.dumps({"t": tournament_id, "s": seq})
+    return payload
+
+
+class BroadcastBus:
+    """Base bus: in-process delivery, no other workers"""
+
+    def __init__(self):
+        self.handler: Optional[Handler] = None
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.published_total = 0
+        self.received_total = 0
+
+    async def start(self, handler: Handler):
+        self.handler = handler
+        self.loop = asyncio.get_running_loop()
+
+    async def stop(self):
+        pass
+
+    async def publish(self, tournament_id: str, message: dict) -> int:
+        """Record the message and deliver it to every worker; returns its seq"""
+        seq = await asyncio.to_thread(record_tournament_event, tournament_id, message)
+        text = json.dumps({**message, "seq": seq})
+        self.published_total += 1
+        await self._send(tournament_id, seq, text)
+        return seq
+
+    async def _send(self, tournament_id: str, seq: int, text: str):
+        await self._receive(tournament_id, seq, text)
+
+    async def _receive(self, tournament_id: str, seq: int, text: Optional[str]):
+        self.received_total += 1
+        if self.handler is not None:
+            await self.handler(tournament_id, seq, text)
+
+    def _receive_threadsafe(self, payload: str):
+        """Hand a payload received on a listener thread to the event loop"""
+        envelope = json.loads(payload)
+        if self.loop is None or self.loop.is_closed():
+            return
+        asyncio.run_coroutine_threadsafe(
+            self._receive(envelope["t"], envelope["s"], envelope.get("m")), self.loop
+        )
+
+    def stats(self) -> dict:
+        return {
+            "backend": type(self).__name__,
+            "published_total": self.published_total,
+            "received_total": self.received_total,
+        }
+
+
+class InProcessBus(BroadcastBus):
+    """Single-worker bus: published messages go straight to the local manager"""
+
+
+class PostgresNotifyBus(BroadcastBus):
+    """Cross-worker bus over PostgreSQL LISTEN/NOTIFY"""
+
+    def __init__(self, channel: str = BROADCAST_CHANNEL, reconnect_delay: float = 2.0):
+        super().__init__()
+        self.channel = channel
+        self.reconnect_delay = reconnect_delay
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    async def start(self, handler: Handler):
+        await super().start(handler)
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._listen, name="broadcast-listen", daemon=True)
+        self._thread.start()
+
+    async def stop(self):
+        self._stopping.set()
+        if self._thread is not None:
+            await asyncio.to_thread(self._thread.join)
+            self._thread = None
+
+    async def _send(self, tournament_id: str, seq: int, text: str):
+        payload = _envelope(tournament_id, seq, text, MAX_NOTIFY_PAYLOAD)
+        await asyncio.to_thread(self._notify, payload)
+
+    def _notify(self, payload: str):
+        with db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT pg_notify(?, ?)", (self.channel, payload))
+            conn.commit()
+
+    def _open_listener(self):
+        from app.database.postgresql import engine
+
+        # A dedicated connection taken out of the pool: it stays in LISTEN for the worker's lifetime
+        raw = engine.raw_connection()
+        raw.detach()
+        conn = raw.dbapi_connection
+        conn.autocommit = True
+        conn.cursor().execute(f'LISTEN "{self.channel}"')
+        return conn
+
+    def _listen(self):
+        conn = None
+        while not self._stopping.is_set():
+            try:
+                if conn is None:
+                    conn = self._open_listener()
+                if select.select([conn], [], [], 1.0) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    self._receive_threadsafe(conn.notifies.pop(0).payload)
+            except Exception as e:
+                # Messages missed while reconnecting are filled in from the event log on the next one
+                print(f"Broadcast listener error, reconnecting: {e}")
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+                conn = None
+                self._stopping.wait(self.reconnect_delay)
+        if conn is not None:
+            conn.close()
+
+
+class LocalSocketBus(BroadcastBus):
+    """Cross-worker bus over Unix datagram sockets in a shared directory (single host)"""
+
+    def __init__(self, directory: str = BROADCAST_SOCKET_DIR):
+        super().__init__()
+        self.directory = directory
+        self.path = os.path.join(directory, f"{os.getpid()}-{uuid.uuid4().hex[:8]}.sock")
+        self._socket: Optional[socket.socket] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+
+    async def start(self, handler: Handler):
+        await super().start(handler)
+        os.makedirs(self.directory, exist_ok=True)
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._socket.bind(self.path)
+        self._socket.settimeout(1.0)
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._listen, name="broadcast-listen", daemon=True)
+        self._thread.start()
+
+    async def stop(self):
+        self._stopping.set()
+        if self._thread is not None:
+            await asyncio.to_thread(self._thread.join)
+            self._thread = None
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+    async def _send(self, tournament_id: str, seq: int, text: str):
+        payload = _envelope(tournament_id, seq, text, MAX_DATAGRAM_PAYLOAD).encode("utf-8")
+        await asyncio.to_thread(self._send_all, payload)
+
+    def _send_all(self, payload: bytes):
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sender:
+            for name in os.listdir(self.directory):
+                if not name.endswith(".sock"):
+                    continue
+                path = os.path.join(self.directory, name)
+                try:
+                    sender.sendto(payload, path)
+                except (ConnectionRefusedError, FileNotFoundError):
+                    # A worker that exited without cleaning up
+                    try:
+                        os.unlink(path)
+                    except FileNotFoundError:
+                        pass
+
+    def _listen(self):
+        while not self._stopping.is_set():
+            try:
+                payload = self._socket.recv(MAX_DATAGRAM_PAYLOAD + 1024)
+            except socket.timeout:
+                continue
+            except OSError:
+                return
+            self._receive_threadsafe(payload.decode("utf-8"))
+
+
+def create_broadcast_bus(backend: str = BROADCAST_BACKEND) -> BroadcastBus:
+    """Build the bus selected by BROADCAST_BACKEND"""
+    if backend == "postgres":
+        return PostgresNotifyBus()
+    if backend == "socket":
+        return LocalSocketBus()
+    if backend == "memory":
+        return InProcessBus()
+    raise ValueError(f"Unknown BROADCAST_BACKEND {backend!r}, expected memory, postgres or socket")
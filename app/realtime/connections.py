@@ -0,0 +1,324 @@
+"""
+WebSocket fan-out for tournament rooms.
+
+Every connection gets a bounded send queue and its own writer task, so a
+broadcast serializes the message once, appends the same text to each queue and
+returns without awaiting any socket; one slow spectator can no longer hold up
+everybody else's progress updates.
+
+When a queue is full the slow-consumer policy decides what happens:
+  - coalesce: a queued message with the same coalesce key (the latest progress
+    or ready state of one player, heartbeats) is replaced in place, otherwise
+    the oldest queued message is dropped
+  - drop_oldest: the oldest queued message is dropped
+  - disconnect: the connection is closed
+A heartbeat frame is queued on every connection each WS_HEARTBEAT_INTERVAL
+seconds and clients answer it (any frame will do, normally a pong); connections
+that have sent nothing for WS_HEARTBEAT_TIMEOUT seconds are evicted. Only
+inbound frames count: writes to a half-open peer keep succeeding until the
+kernel buffer fills, so a dead client must not keep itself alive that way.
+
+With a broadcast bus, broadcasts are published through it (and so reach the
+sockets held by other workers) and come back to deliver() with their sequence
+number. Each tournament's messages are fanned out in seq order: a message that
+arrives ahead of one still in flight is preceded by the missing ones read from
+the event log, and a client that reconnects with `since` first gets everything
+after that seq.
+"""
+import asyncio
+import itertools
+import json
+import time
+from collections import OrderedDict, deque
+from typing import Dict, Hashable, List, Optional, Set, Tuple
+
+from fastapi import WebSocket
+
+from app.realtime.bus import BroadcastBus
+from app.realtime.events import load_tournament_events
+from app.utils.metrics import BROADCAST_FANOUT_SECONDS
+from app.config.settings import (
+    WS_SEND_QUEUE_SIZE, WS_SLOW_CONSUMER_POLICY, WS_SEND_TIMEOUT,
+    WS_HEARTBEAT_INTERVAL, WS_HEARTBEAT_TIMEOUT
+)
+
+SLOW_CONSUMER_POLICIES = ("coalesce", "drop_oldest", "disconnect")
+
+HEARTBEAT_TEXT = json.dumps({"type": "heartbeat"})
+HEARTBEAT_KEY = ("heartbeat",)
+
+
+def default_coalesce_key(message: dict) -> Optional[Hashable]:
+    """Messages that only carry a player's latest state can replace an older queued one"""
+    message_type = message.get("type")
+    if message_type == "progress_update" and "notification" not in message and "warning" not in message:
+        return (message_type, message.get("username"))
+    if message_type == "ready_status_changed":
+        return (message_type, message.get("username"))
+    return None
+
+
+def _percentile(samples, fraction: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class Connection:
+    """One WebSocket with its send queue and writer task"""
+
+    def __init__(self, websocket: WebSocket, tournament_id: str, max_queue: int):
+        self.websocket = websocket
+        self.tournament_id = tournament_id
+        self.max_queue = max_queue
+        # Queued frames keyed by coalesce key (or a unique counter) -> (text, enqueued_at)
+        self.queue: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self.ready = asyncio.Event()
+        self.last_activity = time.monotonic()
+        self.writer: Optional[asyncio.Task] = None
+        self.closed = False
+        # Highest seq queued on this connection, so replayed and live frames are not sent twice
+        self.last_seq: Optional[int] = None
+
+
+class TournamentConnectionManager:
+    def __init__(self, max_queue: int = WS_SEND_QUEUE_SIZE, policy: str = WS_SLOW_CONSUMER_POLICY,
+                 send_timeout: float = WS_SEND_TIMEOUT, heartbeat_interval: float = WS_HEARTBEAT_INTERVAL,
+                 heartbeat_timeout: float = WS_HEARTBEAT_TIMEOUT, bus: Optional[BroadcastBus] = None):
+        if policy not in SLOW_CONSUMER_POLICIES:
+            raise ValueError(f"Unknown slow consumer policy {policy!r}, expected one of {SLOW_CONSUMER_POLICIES}")
+        self.max_queue = max_queue
+        self.policy = policy
+        self.send_timeout = send_timeout
+        self.heartbeat_interval = heartbeat_interval
+        self.heartbeat_timeout = heartbeat_timeout
+        self.bus = bus
+
+        self.active_connections: Dict[str, Dict[WebSocket, Connection]] = {}
+        self._delivered_seq: Dict[str, int] = {}
+        self._tournament_locks: Dict[str, asyncio.Lock] = {}
+        self._unique_keys = itertools.count()
+        self._heartbeat_task: Optional[asyncio.Task] = None
+
+        # Metrics
+        self.broadcasts_total = 0
+        self.frames_sent_total = 0
+        self.frames_coalesced_total = 0
+        self.frames_dropped_total = 0
+        self.evictions_total: Dict[str, int] = {"slow": 0, "heartbeat": 0, "error": 0, "ended": 0}
+        self.last_broadcast_seconds = 0.0
+        self._fanout_latencies = deque(maxlen=2048)
+
+    async def start(self):
+        """Subscribe to the broadcast bus (called on application startup)"""
+        if self.bus is not None:
+            await self.bus.start(self.deliver)
+
+    def _lock_for(self, tournament_id: str) -> asyncio.Lock:
+        lock = self._tournament_locks.get(tournament_id)
+        if lock is None:
+            lock = self._tournament_locks[tournament_id] = asyncio.Lock()
+        return lock
+
+    async def connect(self, websocket: WebSocket, tournament_id: str, since: Optional[int] = None):
+        """Accept a socket; with `since`, first queue every broadcast after that seq"""
+        await websocket.accept()
+        connection = Connection(websocket, tournament_id, self.max_queue)
+        connection.writer = asyncio.create_task(self._write(connection))
+        self.active_connections.setdefault(tournament_id, {})[websocket] = connection
+
+        if since is not None:
+            # Hold live deliveries for this tournament until the backlog is queued
+            async with self._lock_for(tournament_id):
+                backlog = await asyncio.to_thread(load_tournament_events, tournament_id, since)
+                for seq, text in backlog:
+                    self._enqueue(connection, text, None, time.perf_counter())
+                connection.last_seq = backlog[-1][0] if backlog else since
+
+        if self._heartbeat_task is None or self._heartbeat_task.done():
+            self._heartbeat_task = asyncio.create_task(self._heartbeat())
+
+    def disconnect(self, websocket: WebSocket, tournament_id: str):
+        connections = self.active_connections.get(tournament_id)
+        if not connections:
+            return
+        connection = connections.pop(websocket, None)
+        if not connections:
+            del self.active_connections[tournament_id]
+            self._delivered_seq.pop(tournament_id, None)
+            self._tournament_locks.pop(tournament_id, None)
+        if connection is not None:
+            connection.closed = True
+            if connection.writer is not None and connection.writer is not asyncio.current_task():
+                connection.writer.cancel()
+
+    def touch(self, websocket: WebSocket, tournament_id: str):
+        """Record that the client sent something, which keeps it clear of heartbeat eviction"""
+        connection = self.active_connections.get(tournament_id, {}).get(websocket)
+        if connection is not None:
+            connection.last_activity = time.monotonic()
+
+    async def send_personal(self, websocket: WebSocket, tournament_id: str, message: dict):
+        """Queue a frame for one connection (replies such as pong go through its writer too)"""
+        connection = self.active_connections.get(tournament_id, {}).get(websocket)
+        if connection is not None:
+            self._enqueue(connection, json.dumps(message), None, time.perf_counter())
+
+    async def broadcast_to_tournament(self, tournament_id: str, message: dict):
+        if self.bus is not None:
+            # Every worker, this one included, gets it back through deliver()
+            await self.bus.publish(tournament_id, message)
+        else:
+            self._fan_out(tournament_id, None, json.dumps(message), default_coalesce_key(message))
+
+    async def deliver(self, tournament_id: str, seq: int, text: Optional[str]):
+        """Fan out a sequenced message from the bus to this worker's sockets, in seq order"""
+        if tournament_id not in self.active_connections:
+            return
+
+        async with self._lock_for(tournament_id):
+            last = self._delivered_seq.get(tournament_id)
+            if last is None:
+                # Sockets that resumed with `since` already have everything up to their last_seq
+                resumed = [c.last_seq for c in self.active_connections.get(tournament_id, {}).values() if c.last_seq is not None]
+                last = max(resumed) if resumed else None
+            if last is not None and seq <= last:
+                return  # Already delivered while filling a gap
+
+            frames: List[Tuple[int, str]] = []
+            if text is None or (last is not None and seq > last + 1):
+                after = last if last is not None else seq - 1
+                frames = await asyncio.to_thread(load_tournament_events, tournament_id, after, seq)
+            if text is not None and (not frames or frames[-1][0] != seq):
+                frames.append((seq, text))
+
+            for frame_seq, frame_text in frames:
+                self._fan_out(tournament_id, frame_seq, frame_text, default_coalesce_key(json.loads(frame_text)))
+            self._delivered_seq[tournament_id] = seq
+
+    def _fan_out(self, tournament_id: str, seq: Optional[int], text: str, key: Optional[Hashable]):
+        connections = self.active_connections.get(tournament_id)
+        if not connections:
+            return
+
+        started = time.perf_counter()
+        for connection in list(connections.values()):
+            if seq is not None:
+                if connection.last_seq is not None and seq <= connection.last_seq:
+                    continue
+                connection.last_seq = seq
+            self._enqueue(connection, text, key, started)
+
+        self.broadcasts_total += 1
+        self.last_broadcast_seconds = time.perf_counter() - started
+
+    def _enqueue(self, connection: Connection, text: str, key: Optional[Hashable], enqueued_at: float):
+        if connection.closed:
+            return
+        queue = connection.queue
+
+        if key is not None and self.policy == "coalesce" and key in queue:
+            # Keep the original position (and age) but deliver the newest state
+            queue[key] = (text, queue[key][1])
+            self.frames_coalesced_total += 1
+            return
+
+        if len(queue) >= connection.max_queue:
+            if self.policy == "disconnect":
+                self._evict(connection, "slow")
+                return
+            queue.popitem(last=False)
+            self.frames_dropped_total += 1
+
+        queue[key if key is not None else next(self._unique_keys)] = (text, enqueued_at)
+        connection.ready.set()
+
+    async def _write(self, connection: Connection):
+        websocket = connection.websocket
+        while not connection.closed:
+            await connection.ready.wait()
+            while connection.queue and not connection.closed:
+                _, (text, enqueued_at) = connection.queue.popitem(last=False)
+                try:
+                    await asyncio.wait_for(websocket.send_text(text), self.send_timeout)
+                except asyncio.CancelledError:
+                    raise
+                except asyncio.TimeoutError:
+                    self._evict(connection, "slow")
+                    return
+                except Exception:
+                    self._evict(connection, "error")
+                    return
+                now = time.perf_counter()
+                self.frames_sent_total += 1
+                self._fanout_latencies.append(now - enqueued_at)
+                BROADCAST_FANOUT_SECONDS.observe(now - enqueued_at)
+            connection.ready.clear()
+
+    def close_tournament(self, tournament_id: str) -> int:
+        """Close every socket still open on a finished tournament; returns how many were closed"""
+        connections = list(self.active_connections.get(tournament_id, {}).values())
+        for connection in connections:
+            self._evict(connection, "ended", code=1000)
+        return len(connections)
+
+    def _evict(self, connection: Connection, reason: str, code: int = 1011):
+        if connection.closed:
+            return
+        self.evictions_total[reason] += 1
+        self.disconnect(connection.websocket, connection.tournament_id)
+        asyncio.create_task(self._close(connection.websocket, code))
+
+    @staticmethod
+    async def _close(websocket: WebSocket, code: int):
+        try:
+            await websocket.close(code=code)
+        except Exception:
+            pass
+
+    async def _heartbeat(self):
+        while self.active_connections:
+            await asyncio.sleep(self.heartbeat_interval)
+            now = time.monotonic()
+            started = time.perf_counter()
+            for connections in list(self.active_connections.values()):
+                for connection in list(connections.values()):
+                    if now - connection.last_activity > self.heartbeat_timeout:
+                        self._evict(connection, "heartbeat")
+                    else:
+                        self._enqueue(connection, HEARTBEAT_TEXT, HEARTBEAT_KEY, started)
+
+    async def close(self):
+        """Stop the heartbeat, every writer and the bus subscription (called on application shutdown)"""
+        if self._heartbeat_task is not None:
+            self._heartbeat_task.cancel()
+        if self.bus is not None:
+            await self.bus.stop()
+        writers: Set[asyncio.Task] = set()
+        for tournament_id, connections in list(self.active_connections.items()):
+            for websocket, connection in list(connections.items()):
+                if connection.writer is not None:
+                    writers.add(connection.writer)
+                self.disconnect(websocket, tournament_id)
+        await asyncio.gather(*writers, return_exceptions=True)
+
+    def stats(self) -> dict:
+        latencies = list(self._fanout_latencies)
+        return {
+            "tournaments": len(self.active_connections),
+            "connections": sum(len(connections) for connections in self.active_connections.values()),
+            "queued_frames": sum(
+                len(connection.queue)
+                for connections in self.active_connections.values() for connection in connections.values()
+            ),
+            "broadcasts_total": self.broadcasts_total,
+            "frames_sent_total": self.frames_sent_total,
+            "frames_coalesced_total": self.frames_coalesced_total,
+            "frames_dropped_total": self.frames_dropped_total,
+            "evictions_total": dict(self.evictions_total),
+            "last_broadcast_seconds": round(self.last_broadcast_seconds, 6),
+            "fanout_latency_p50_seconds": round(_percentile(latencies, 0.50), 6),
+            "fanout_latency_p99_seconds": round(_percentile(latencies, 0.99), 6),
+            "bus": self.bus.stats() if self.bus is not None else None,
+        }
@@ -0,0 +1,74 @@
+"""
+Sequenced tournament event log.
+
+Every message broadcast to a tournament room is first stored in
+`tournament_events` with the next `seq` for that tournament. The number travels
+with the message, so clients can tell when they missed something and ask for
+everything after the last `seq` they saw, and workers receiving messages out
+of order can fill the gap from the table.
+"""
+import json
+from typing import List, Optional, Tuple
+
+from app.database.connection import db_connection
+
+# Concurrent publishers can pick the same next seq; the unique index rejects the loser, which retries
+_SEQ_RETRIES = 5
+
+
+def _is_duplicate_seq(error: Exception) -> bool:
+    message = str(error)
+    return "UNIQUE constraint failed" in message or "duplicate key value" in message
+
+
+def record_tournament_event(tournament_id: str, message: dict) -> int:
+    """Store a broadcast message and return its sequence number within the tournament"""
+    event_data = json.dumps(message)
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        for attempt in range(_SEQ_RETRIES):
+            try:
+                cursor.execute("""
+                    INSERT INTO tournament_events (tournament_id, event_type, event_data, seq)
+                    SELECT ?, ?, ?, COALESCE(MAX(seq), 0) + 1
+                    FROM tournament_events
+                    WHERE tournament_id = ?
+                """, (tournament_id, message.get("type"), event_data, tournament_id))
+                event_id = cursor.lastrowid
+                cursor.execute("SELECT seq FROM tournament_events WHERE id = ?", (event_id,))
+                seq = cursor.fetchone()["seq"]
+                conn.commit()
+                return seq
+            except Exception as e:
+                conn.rollback()
+                if not _is_duplicate_seq(e) or attempt == _SEQ_RETRIES - 1:
+                    raise
+
+
+def event_text(seq: int, event_data: str) -> str:
+    """The frame sent to clients: the stored message with its seq added"""
+    message = json.loads(event_data)
+    message["seq"] = seq
+    return json.dumps(message)
+
+
+def load_tournament_events(tournament_id: str, after_seq: int, upto_seq: Optional[int] = None,
+                           limit: int = 500) -> List[Tuple[int, str]]:
+    """Broadcast frames with after_seq < seq (<= upto_seq), oldest first, as (seq, text)"""
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        if upto_seq is None:
+            cursor.execute("""
+                SELECT seq, event_data FROM tournament_events
+                WHERE tournament_id = ? AND seq > ?
+                ORDER BY seq
+                LIMIT ?
+            """, (tournament_id, after_seq, limit))
+        else:
+            cursor.execute("""
+                SELECT seq, event_data FROM tournament_events
+                WHERE tournament_id = ? AND seq > ? AND seq <= ?
+                ORDER BY seq
+                LIMIT ?
+            """, (tournament_id, after_seq, upto_seq, limit))
+        return [(row["seq"], event_text(row["seq"], row["event_data"])) for row in cursor.fetchall()]
@@ -0,0 +1,240 @@
+"""
+Tournament deadline scheduler.
+
+Deadlines live in a min-heap of (when, tournament_id, action), and a single
+task sleeps until the earliest one instead of polling rows:
+
+  - expire: an active tournament reached its time_limit. It is marked
+    completed, final positions are written to tournament_participants and
+    `tournament_ended` is broadcast.
+  - reap: a waiting/ready room was never started within TOURNAMENT_WAITING_TTL
+    seconds. It is cancelled and `tournament_cancelled` is broadcast.
+  - close: TOURNAMENT_CLOSE_GRACE seconds after a tournament finished, the
+    sockets still open on it are closed.
+
+Every transition is a conditional UPDATE on the tournament's status, so a heap
+entry for a tournament that already finished another way, or that another
+worker got to first, does nothing. The heap is rebuilt from the open
+tournaments at startup.
+"""
+import asyncio
+import heapq
+import time
+from datetime import datetime, timezone
+from typing import List, Optional, Tuple
+
+from app.database.connection import db_connection
+from app.config.settings import TOURNAMENT_WAITING_TTL, TOURNAMENT_CLOSE_GRACE
+
+EXPIRE = "expire"
+REAP = "reap"
+CLOSE = "close"
+
+
+def _epoch(value, utc: bool) -> Optional[float]:
+    """Unix time of a stored timestamp; started_at is local time, CURRENT_TIMESTAMP defaults are UTC"""
+    if value is None:
+        return None
+    moment = value if isinstance(value, datetime) else datetime.fromisoformat(str(value))
+    if utc and moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.timestamp()
+
+
+def load_open_tournaments() -> List[Tuple[float, str, str]]:
+    """(deadline, tournament_id, action) for every tournament still waiting, ready or active"""
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT id, status, time_limit, created_at, started_at
+            FROM tournaments
+            WHERE status IN ('waiting', 'ready', 'active')
+        """)
+        rows = cursor.fetchall()
+
+    deadlines = []
+    for row in rows:
+        if row["status"] == "active" and row["started_at"]:
+            deadlines.append((_epoch(row["started_at"], utc=False) + (row["time_limit"] or 0), row["id"], EXPIRE))
+        elif row["status"] in ("waiting", "ready"):
+            created = _epoch(row["created_at"], utc=True) or time.time()
+            deadlines.append((created + TOURNAMENT_WAITING_TTL, row["id"], REAP))
+    return deadlines
+
+
+def finish_expired_tournament(tournament_id: str) -> Optional[List[dict]]:
+    """End an active tournament whose time ran out; returns the final standings, or None if it was not active"""
+    now = datetime.now().isoformat()
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute("""
+                UPDATE tournaments SET status = 'completed', completed_at = ?
+                WHERE id = ? AND status = 'active'
+            """, (now, tournament_id))
+            if cursor.rowcount == 0:
+                conn.rollback()
+                return None
+
+            cursor.execute("""
+                UPDATE tournament_game_sessions SET status = 'expired', end_time = ?, version = version + 1
+                WHERE tournament_id = ? AND status = 'active'
+            """, (now, tournament_id))
+
+            # Same ordering as the results endpoint
+            cursor.execute("""
+                SELECT
+                    tp.id as participant_id,
+                    tp.user_id,
+                    tp.guest_name,
+                    tp.is_guest,
+                    u.username,
+                    tgs.stage,
+                    tgs.score,
+                    tgs.time_taken
+                FROM tournament_participants tp
+                LEFT JOIN users u ON tp.user_id = u.id
+                LEFT JOIN tournament_game_sessions tgs ON tp.id = tgs.participant_id
+                WHERE tp.tournament_id = ?
+                ORDER BY
+                    tgs.score DESC,
+                    tgs.stage DESC,
+                    tgs.time_taken ASC
+            """, (tournament_id,))
+            participants = cursor.fetchall()
+
+            standings = []
+            for position, participant in enumerate(participants, 1):
+                cursor.execute("""
+                    UPDATE tournament_participants SET position = ?, final_score = ?
+                    WHERE id = ?
+                """, (position, participant["score"] or 0, participant["participant_id"]))
+                standings.append({
+                    "rank": position,
+                    "username": participant["username"] if not participant["is_guest"] else participant["guest_name"],
+                    "stage": participant["stage"] or 1,
+                    "score": participant["score"] or 0
+                })
+
+            if participants and participants[0]["user_id"] is not None:
+                cursor.execute("UPDATE tournaments SET winner_user_id = ? WHERE id = ?",
+                               (participants[0]["user_id"], tournament_id))
+
+            conn.commit()
+            return standings
+        except Exception:
+            conn.rollback()
+            raise
+
+
+def cancel_abandoned_tournament(tournament_id: str) -> bool:
+    """Cancel a room that never started; False if it had started or was already gone"""
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            UPDATE tournaments SET status = 'cancelled', completed_at = ?
+            WHERE id = ? AND status IN ('waiting', 'ready')
+        """, (datetime.now().isoformat(), tournament_id))
+        conn.commit()
+        return cursor.rowcount > 0
+
+
+class TournamentScheduler:
+    """Min-heap of tournament deadlines served by one asyncio task"""
+
+    def __init__(self, manager):
+        self.manager = manager
+        self._heap: List[Tuple[float, str, str]] = []
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+        # Metrics
+        self.expired_total = 0
+        self.reaped_total = 0
+        self.closed_total = 0
+
+    async def start(self):
+        """Rebuild the heap from the database and start the timer task (called on application startup)"""
+        self._heap = await asyncio.to_thread(load_open_tournaments)
+        heapq.heapify(self._heap)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def schedule(self, tournament_id: str, when: float, action: str):
+        """Run `action` for a tournament at unix time `when`"""
+        earliest = self._heap[0][0] if self._heap else None
+        heapq.heappush(self._heap, (when, tournament_id, action))
+        if earliest is None or when < earliest:
+            self._wakeup.set()
+
+    def schedule_reap(self, tournament_id: str):
+        self.schedule(tournament_id, time.time() + TOURNAMENT_WAITING_TTL, REAP)
+
+    def schedule_expiry(self, tournament_id: str, started_at: str, time_limit: int):
+        self.schedule(tournament_id, _epoch(started_at, utc=False) + time_limit, EXPIRE)
+
+    def schedule_close(self, tournament_id: str):
+        self.schedule(tournament_id, time.time() + TOURNAMENT_CLOSE_GRACE, CLOSE)
+
+    async def _run(self):
+        while True:
+            timeout = max(0.0, self._heap[0][0] - time.time()) if self._heap else None
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+                continue  # Something earlier was scheduled; recompute the sleep
+            except asyncio.TimeoutError:
+                pass
+
+            now = time.time()
+            while self._heap and self._heap[0][0] <= now:
+                _, tournament_id, action = heapq.heappop(self._heap)
+                try:
+                    await self._fire(tournament_id, action)
+                except Exception as e:
+                    print(f"Tournament scheduler failed to {action} {tournament_id}: {e}")
+
+    async def _fire(self, tournament_id: str, action: str):
+        if action == EXPIRE:
+            standings = await asyncio.to_thread(finish_expired_tournament, tournament_id)
+            if standings is None:
+                return
+            self.expired_total += 1
+            winner = standings[0] if standings else None
+            await self.manager.broadcast_to_tournament(tournament_id, {
+                "type": "tournament_ended",
+                "reason": "time_limit",
+                "winner": winner["username"] if winner else None,
+                "final_score": winner["score"] if winner else 0,
+                "results": standings,
+                "message": "⏰ Time's up!" + (f" Winner: {winner['username']}" if winner else "")
+            })
+            self.schedule_close(tournament_id)
+
+        elif action == REAP:
+            if not await asyncio.to_thread(cancel_abandoned_tournament, tournament_id):
+                return
+            self.reaped_total += 1
+            await self.manager.broadcast_to_tournament(tournament_id, {
+                "type": "tournament_cancelled",
+                "reason": "not_started",
+                "message": "This tournament room expired before it started."
+            })
+            self.schedule_close(tournament_id)
+
+        elif action == CLOSE:
+            self.closed_total += self.manager.close_tournament(tournament_id)
+
+    def stats(self) -> dict:
+        return {
+            "pending_deadlines": len(self._heap),
+            "next_deadline_in_seconds": round(self._heap[0][0] - time.time(), 3) if self._heap else None,
+            "expired_total": self.expired_total,
+            "reaped_total": self.reaped_total,
+            "closed_connections_total": self.closed_total,
+        }
@@ -3,6 +3,7 @@ from fastapi import APIRouter, HTTPException, Depends
 from app.models.schemas import UserRegister, UserLogin
 from app.database.connection import get_db
 from app.auth.auth import hash_password, create_access_token, get_current_user
+from app.game.leaderboard import upsert_leaderboard_entry
 
 router = APIRouter(prefix="/auth", tags=["authentication"])
 
@@ -29,10 +30,11 @@ async def register(user: UserRegister):
         """, (user.username, user.email, password_hash))
         
         user_id = cursor.lastrowid
+        upsert_leaderboard_entry(cursor, user_id, None, 1, 0, [], False, False)
         conn.commit()
         
         # Create access token
-        access_token = create_access_token(data={"sub": user.username})
+        access_token = create_access_token(data={"sub": user.username, "uid": user_id})
         
         return {
             "access_token": access_token,
@@ -61,7 +63,7 @@ async def login(user: UserLogin):
         if not db_user or hash_password(user.password) != db_user["password_hash"]:
             raise HTTPException(status_code=401, detail="Invalid credentials")
         
-        access_token = create_access_token(data={"sub": user.username})
+        access_token = create_access_token(data={"sub": db_user["username"], "uid": db_user["id"]})
         
         return {
             "access_token": access_token,
@@ -1,49 +1,76 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Header, WebSocket, WebSocketDisconnect
+from fastapi.responses import Response, StreamingResponse
+from typing import Optional
+import asyncio
 import json
 import uuid
 
 from app.models.schemas import MessageRequest, GameResponse
 from app.models.game_state import GameState
 from app.database.connection import get_db
-from app.auth.auth import get_current_user
+from app.auth.auth import CurrentUser, get_current_user, get_current_identity, decode_current_user
 from app.game.stages import STAGES
-from app.game.workflow import create_game_workflow
+from app.game.catalog import STAGE_LIST, STAGE_HINTS, COMMAND_HINTS, DEFAULT_COMMAND_HINT, CatalogEntry, etag_matches
+from app.game.session_cache import (
+    SessionSnapshot, snapshot_from_row, remember_session, get_session_snapshot,
+    update_session_snapshot, forget_session
+)
+from app.game.keys import stage_keys_found
+from app.game.security import get_exploitation_profile
+from app.game.single_flight import session_turns, IdempotencyConflict
+from app.game.session_store import session_store
+from app.game.session_versions import StaleSessionError, SESSION_SAVE_CONFLICTS, require_swapped
+from app.game.leaderboard import upsert_leaderboard_entry, sync_leaderboard_entry, invalidate_public_stats
+from app.game.conversation import append_turn, get_recent_turns, turns_to_messages
+from app.game.workflow import create_async_game_workflow, astream_game_turn, replay_character_turn
+from app.middleware.admission import admission, retry_after_seconds
+from app.config.settings import RATE_LIMIT_ENABLED, STAGE_CATALOG_MAX_AGE, SESSION_SAVE_RETRIES
 
 router = APIRouter(prefix="/game", tags=["game"])
 
 # Create game workflow instance
-game_app = create_game_workflow()
+game_app = create_async_game_workflow()
+
+
+def _catalog_response(entry: CatalogEntry, if_none_match: Optional[str], cache_control: str) -> Response:
+    """Serve a precomputed catalog body, or 304 if the client already has it"""
+    headers = {"ETag": entry.etag, "Cache-Control": cache_control}
+    if etag_matches(if_none_match, entry.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry.body, media_type="application/json", headers=headers)
 
 
 @router.get("/hints/{stage}")
-async def get_stage_hints(stage: int, current_user: str = Depends(get_current_user)):
+async def get_stage_hints(
+    stage: int,
+    current_user: str = Depends(get_current_user),
+    if_none_match: Optional[str] = Header(None)
+):
     """Get hints for a specific stage"""
-    if stage < 1 or stage > len(STAGES):
+    entry = STAGE_HINTS.get(stage)
+    if entry is None:
         raise HTTPException(status_code=400, detail="Invalid stage number")
 
-    stage_config = STAGES[stage]
-    return {
-        "stage": stage,
-        "character": stage_config["character"],
-        "difficulty": stage_config["difficulty"],
-        "hints": stage_config["hints"],
-        "instructions": stage_config["instructions"]
-    }
+    # Only served to signed-in players, so shared caches must not keep it
+    return _catalog_response(entry, if_none_match, f"private, max-age={STAGE_CATALOG_MAX_AGE}")
+
+
+def _new_session_snapshot(username: str, user_id: int) -> SessionSnapshot:
+    """Snapshot of a session as created by the game_sessions column defaults"""
+    return SessionSnapshot(
+        username=username, user_id=user_id, stage=1, extracted_keys=(),
+        character_mood="helpful", score=0, attempts=0, resistance_level=1
+    )
 
 
 @router.post("/start")
-async def start_game(current_user: str = Depends(get_current_user)):
+async def start_game(user: CurrentUser = Depends(get_current_identity)):
     conn = get_db()
     cursor = conn.cursor()
 
     try:
-        # Get user ID
-        cursor.execute("SELECT id FROM users WHERE username = ?", (current_user,))
-        user = cursor.fetchone()
-        if not user:
-            raise HTTPException(status_code=404, detail="User not found")
-
-        user_id = user["id"]
+        user_id = user.id
+        session_store.flush_user(user_id)
 
         # Check for existing incomplete session
         cursor.execute("""
@@ -63,10 +90,8 @@ async def start_game(current_user: str = Depends(get_current_user)):
             stage_config = STAGES[stage]
 
             # Count keys found in current stage only
-            current_stage_keys_found = []
-            for key in stage_config["keys"]:
-                if key in extracted_keys:
-                    current_stage_keys_found.append(key)
+            current_stage_keys_found = stage_keys_found(extracted_keys, stage)
+            remember_session(session_id, snapshot_from_row(user.username, existing_session))
             print("Existing session found")
             return GameResponse(
                 session_id=session_id,
@@ -90,8 +115,10 @@ async def start_game(current_user: str = Depends(get_current_user)):
             cursor.execute("""
                 INSERT INTO game_sessions (id, user_id) VALUES (?, ?)
             """, (session_id, user_id))
+            upsert_leaderboard_entry(cursor, user_id, session_id, 1, 0, [], False, False)
 
             conn.commit()
+            remember_session(session_id, _new_session_snapshot(user.username, user_id))
 
             # Get initial stage info
             stage_config = STAGES[1]
@@ -120,24 +147,21 @@ async def start_game(current_user: str = Depends(get_current_user)):
 
 
 @router.post("/start/fresh")
-async def start_fresh_game(current_user: str = Depends(get_current_user)):
+async def start_fresh_game(user: CurrentUser = Depends(get_current_identity)):
     """Start a completely fresh game, deleting all existing progress"""
     conn = get_db()
     cursor = conn.cursor()
 
     try:
-        # Get user ID
-        cursor.execute("SELECT id FROM users WHERE username = ?", (current_user,))
-        user = cursor.fetchone()
-        if not user:
-            raise HTTPException(status_code=404, detail="User not found")
-
-        user_id = user["id"]
+        user_id = user.id
 
         # End any existing active sessions by marking them as game over
+        session_store.evict_user(user_id)
+        cursor.execute("SELECT id FROM game_sessions WHERE user_id = ? AND game_over = FALSE", (user_id,))
+        ended_session_ids = [row["id"] for row in cursor.fetchall()]
         cursor.execute("""
             UPDATE game_sessions
-            SET game_over = TRUE, updated_at = CURRENT_TIMESTAMP
+            SET game_over = TRUE, version = version + 1, updated_at = CURRENT_TIMESTAMP
             WHERE user_id = ? AND game_over = FALSE
         """, (user_id,))
 
@@ -146,8 +170,12 @@ async def start_fresh_game(current_user: str = Depends(get_current_user)):
         cursor.execute("""
             INSERT INTO game_sessions (id, user_id) VALUES (?, ?)
         """, (session_id, user_id))
+        upsert_leaderboard_entry(cursor, user_id, session_id, 1, 0, [], False, False)
 
         conn.commit()
+        for ended_session_id in ended_session_ids:
+            forget_session(ended_session_id)
+        remember_session(session_id, _new_session_snapshot(user.username, user_id))
 
         # Get initial stage info
         stage_config = STAGES[1]
@@ -176,136 +204,147 @@ async def start_fresh_game(current_user: str = Depends(get_current_user)):
         conn.close()
 
 
-@router.post("/{session_id}/message")
-async def send_message(
-    session_id: str,
-    message: MessageRequest,
-    current_user: str = Depends(get_current_user)
-):
+def _load_turn(session_id: str, user: CurrentUser, user_input: str):
+    """Load the session for a turn; returns (None, state), or (GameResponse, None) for special commands"""
+    hot = session_store.get(session_id, user.id)
+    if hot is not None:
+        session, conversation_history = hot
+    else:
+        conn = get_db()
+        cursor = conn.cursor()
+
+        try:
+            # Get game session
+            cursor.execute("""
+                SELECT * FROM game_sessions
+                WHERE id = ? AND user_id = ? AND game_over = FALSE
+            """, (session_id, user.id))
+
+            session = cursor.fetchone()
+            if not session:
+                raise HTTPException(status_code=404, detail="Game session not found or already completed")
+
+            # Only the last few exchanges of the current stage are sent to the character
+            recent_turns = get_recent_turns(cursor, session_id, session["stage"])
+        finally:
+            conn.close()
+
+        session_store.admit(session_id, session, recent_turns)
+        conversation_history = turns_to_messages(recent_turns)
+
+    snapshot = snapshot_from_row(user.username, session)
+    remember_session(session_id, snapshot)
+
+    command_response = _special_command_response(session_id, snapshot, user_input)
+    if command_response is not None:
+        return command_response, None
+
+    # Create game state from session
+    state = GameState(
+        stage=session["stage"],
+        score=session["score"],
+        attempts=session["attempts"],
+        extracted_keys=json.loads(session["extracted_keys"]),
+        user_input=user_input,
+        bot_response="",
+        game_over=session["game_over"],
+        success=session["success"],
+        conversation_history=conversation_history,
+        new_turns=[],
+        character_mood=session["character_mood"],
+        resistance_level=session["resistance_level"],
+        failed_attempts=session["failed_attempts"],
+        new_stage_start=session["new_stage_start"] if "new_stage_start" in session.keys() else False,
+        stage_just_completed=False,  # Initialize as False
+        user_id=user.id,  # Add user_id for security checks
+        session_id=session_id,  # Add session_id for logging
+        exploitation_profile=get_exploitation_profile(user.id),  # Shared by every security check this turn
+        session_version=session["version"]
+    )
+    return None, state
+
+
+def _is_special_command(user_input: str) -> bool:
+    return user_input.lower().strip() in ("hint", "keys")
+
+
+def _special_command_response(session_id: str, session: SessionSnapshot, user_input: str):
+    """Answer the 'hint' and 'keys' commands, or return None for a normal message"""
+    command = user_input.lower().strip()
+    if command not in ("hint", "keys"):
+        return None
+
+    current_stage_config = STAGES[session.stage]
+
+    # Show only keys from current stage
+    current_stage_keys = stage_keys_found(session.extracted_keys, session.stage)
+
+    if command == 'hint':
+        response_text = COMMAND_HINTS.get(session.stage, DEFAULT_COMMAND_HINT)
+    elif current_stage_keys:
+        keys_display = " | ".join([f"🔑{key}" for key in current_stage_keys])
+        response_text = f"Found: {keys_display} ({len(current_stage_keys)}/{len(current_stage_config['keys'])})"
+    else:
+        response_text = "🔑 No keys found yet. Keep trying!"
+
+    return GameResponse(
+        session_id=session_id,
+        stage=session.stage,
+        character=current_stage_config["character"],
+        character_mood=session.character_mood,
+        bot_response=response_text,
+        extracted_keys=current_stage_keys,  # Show only current stage keys
+        score=session.score,
+        attempts=session.attempts,
+        resistance_level=session.resistance_level,
+        stage_complete=False,
+        game_over=False,
+        total_keys_in_stage=len(current_stage_config["keys"]),
+        keys_found_in_stage=len(current_stage_keys)
+    )
+
+
+def _save_turn(session_id: str, user_id: int, result) -> GameResponse:
+    """Persist the workflow result for a turn and build the response"""
+    if not result["game_over"]:
+        # Active sessions are checkpointed in the background by the hot store
+        if session_store.apply(session_id, result):
+            update_session_snapshot(session_id, result)
+            return _turn_response(session_id, result)
+    else:
+        # Finished games are written through, so users and game_results change with the session
+        session_store.evict(session_id)
+
     conn = get_db()
     cursor = conn.cursor()
 
     try:
-        # Get user ID
-        cursor.execute("SELECT id FROM users WHERE username = ?", (current_user,))
-        user = cursor.fetchone()
-        if not user:
-            raise HTTPException(status_code=404, detail="User not found")
-
-        # Get game session
-        cursor.execute("""
-            SELECT * FROM game_sessions
-            WHERE id = ? AND user_id = ? AND game_over = FALSE
-        """, (session_id, user["id"]))
-
-        session = cursor.fetchone()
-        if not session:
-            raise HTTPException(status_code=404, detail="Game session not found or already completed")
-
-        # Handle special commands
-        if message.message.lower().strip() == 'hint':
-            hints = {
-                1: "💡 Try asking about login issues, account access, or connection problems. Be specific!",
-                2: "💡 This guard is tired and grumpy. Try complaining about security procedures or work issues.",
-                3: "💡 This bot is glitching. Try discussing system errors, database issues, or maintenance tasks.",
-                4: "💡 This AI is very smart and paranoid. Show deep technical knowledge about quantum systems, biometrics, or neural networks.",
-                5: "💡 The ultimate guardian - be philosophical, creative, and historically knowledgeable. Think outside conventional approaches."
-            }
-            # Get current stage keys for display
-            extracted_keys = json.loads(session["extracted_keys"])
-            current_stage_config = STAGES[session["stage"]]
-            current_stage_keys = []
-            for key in current_stage_config["keys"]:
-                if key in extracted_keys:
-                    current_stage_keys.append(key)
-
-            return GameResponse(
-                session_id=session_id,
-                stage=session["stage"],
-                character=STAGES[session["stage"]]["character"],
-                character_mood=session["character_mood"],
-                bot_response=hints.get(session["stage"], "💡 Try different approaches!"),
-                extracted_keys=current_stage_keys,  # Show only current stage keys
-                score=session["score"],
-                attempts=session["attempts"],
-                resistance_level=session["resistance_level"],
-                stage_complete=False,
-                game_over=False,
-                total_keys_in_stage=len(STAGES[session["stage"]]["keys"]),
-                keys_found_in_stage=len(current_stage_keys)
-            )
-
-        if message.message.lower().strip() == 'keys':
-            extracted_keys = json.loads(session["extracted_keys"])
-            current_stage_config = STAGES[session["stage"]]
-
-            # Show only keys from current stage
-            current_stage_keys = []
-            for key in current_stage_config["keys"]:
-                if key in extracted_keys:
-                    current_stage_keys.append(key)
-
-            if current_stage_keys:
-                keys_display = " | ".join([f"🔑{key}" for key in current_stage_keys])
-                response_text = f"Found: {keys_display} ({len(current_stage_keys)}/{len(current_stage_config['keys'])})"
-            else:
-                response_text = "🔑 No keys found yet. Keep trying!"
-
-            return GameResponse(
-                session_id=session_id,
-                stage=session["stage"],
-                character=STAGES[session["stage"]]["character"],
-                character_mood=session["character_mood"],
-                bot_response=response_text,
-                extracted_keys=current_stage_keys,  # Show only current stage keys
-                score=session["score"],
-                attempts=session["attempts"],
-                resistance_level=session["resistance_level"],
-                stage_complete=False,
-                game_over=False,
-                total_keys_in_stage=len(STAGES[session["stage"]]["keys"]),
-                keys_found_in_stage=len(current_stage_keys)
-            )
-
-        # Create game state from session
-        state = GameState(
-            stage=session["stage"],
-            score=session["score"],
-            attempts=session["attempts"],
-            extracted_keys=json.loads(session["extracted_keys"]),
-            user_input=message.message,
-            bot_response="",
-            game_over=session["game_over"],
-            success=session["success"],
-            conversation_history=json.loads(session["conversation_history"]),
-            character_mood=session["character_mood"],
-            resistance_level=session["resistance_level"],
-            failed_attempts=session["failed_attempts"],
-            new_stage_start=session["new_stage_start"] if "new_stage_start" in session.keys() else False,
-            stage_just_completed=False,  # Initialize as False
-            user_id=user["id"],  # Add user_id for security checks
-            session_id=session_id  # Add session_id for logging
-        )
-
-        # Process through game workflow
-        result = game_app.invoke(state)
-
-        # Update session in database
+        # Update session in database, unless another request saved it since this turn loaded it
         cursor.execute("""
             UPDATE game_sessions SET
                 stage = ?, score = ?, attempts = ?, extracted_keys = ?,
-                conversation_history = ?, character_mood = ?,
-                resistance_level = ?, failed_attempts = ?,
-                game_over = ?, success = ?, new_stage_start = ?, updated_at = CURRENT_TIMESTAMP
-            WHERE id = ?
+                character_mood = ?, resistance_level = ?, failed_attempts = ?,
+                game_over = ?, success = ?, new_stage_start = ?, version = version + 1,
+                updated_at = CURRENT_TIMESTAMP
+            WHERE id = ? AND version = ?
         """, (
             result["stage"], result["score"], result["attempts"],
             json.dumps(result["extracted_keys"]),
-            json.dumps(result["conversation_history"]),
             result["character_mood"], result["resistance_level"],
             result["failed_attempts"], result["game_over"],
-            result["success"], result["new_stage_start"] if "new_stage_start" in result else False, session_id
+            result["success"], result["new_stage_start"] if "new_stage_start" in result else False, session_id,
+            result["session_version"]
         ))
+        require_swapped(cursor, "game_sessions")
+
+        for turn in result.get("new_turns", []):
+            append_turn(cursor, session_id, turn["stage"], turn["user"], turn["assistant"])
+
+        # Keep the materialized leaderboard in step with the session
+        upsert_leaderboard_entry(
+            cursor, user_id, session_id, result["stage"], result["score"], result["extracted_keys"],
+            bool(result["game_over"]), bool(result["success"])
+        )
 
         # Check if game completed
         if result["game_over"] and result["success"]:
@@ -314,99 +353,254 @@ async def send_message(
                 UPDATE users SET
                     total_score = total_score + ?,
                     games_played = games_played + 1,
-                    best_score = MAX(best_score, ?)
+                    best_score = CASE WHEN best_score < ? THEN ? ELSE best_score END
                 WHERE id = ?
-            """, (result["score"], result["score"], user["id"]))
+            """, (result["score"], result["score"], result["score"], user_id))
 
             # Add to game results
             cursor.execute("""
                 INSERT INTO game_results (user_id, session_id, final_score, stages_completed, total_attempts)
                 VALUES (?, ?, ?, ?, ?)
-            """, (user["id"], session_id, result["score"], result["stage"], result["attempts"]))
+            """, (user_id, session_id, result["score"], result["stage"], result["attempts"]))
 
         conn.commit()
 
-        # Determine if current stage is complete and count keys properly
-        current_stage_config = STAGES[result["stage"]] if result["stage"] <= len(STAGES) else STAGES[len(STAGES)]
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
 
-        # Count keys found in current stage only
-        current_stage_keys_found = []
-        for key in current_stage_config["keys"]:
-            if key in result["extracted_keys"]:
-                current_stage_keys_found.append(key)
+    update_session_snapshot(session_id, result)
+    if result["game_over"]:
+        invalidate_public_stats()
+
+    return _turn_response(session_id, result)
+
+
+def _turn_response(session_id: str, result) -> GameResponse:
+    """GameResponse for a saved turn"""
+    # Determine if current stage is complete and count keys properly
+    display_stage = min(result["stage"], len(STAGES))
+    current_stage_config = STAGES[display_stage]
+
+    # Count keys found in current stage only
+    current_stage_keys_found = stage_keys_found(result["extracted_keys"], display_stage)
+
+    stage_complete = len(current_stage_keys_found) == len(current_stage_config["keys"]) and not result["game_over"]
+
+    return GameResponse(
+        session_id=session_id,
+        stage=result["stage"],
+        character=current_stage_config["character"],
+        character_mood=result["character_mood"],
+        bot_response=result["bot_response"],
+        extracted_keys=current_stage_keys_found,  # Show only current stage keys in UI
+        score=result["score"],
+        attempts=result["attempts"],
+        resistance_level=result["resistance_level"],
+        stage_complete=stage_complete,
+        game_over=result["game_over"],
+        total_keys_in_stage=len(current_stage_config["keys"]),
+        keys_found_in_stage=len(current_stage_keys_found),
+        should_refresh=result.get("stage_just_completed", False)  # Trigger refresh after stage completion
+    )
+
+
+def _save_turn_with_retry(session_id: str, user: CurrentUser, result) -> GameResponse:
+    """Save a turn; if the session changed meanwhile, replay the turn on the fresh row and try again"""
+    for retry in range(SESSION_SAVE_RETRIES + 1):
+        try:
+            return _save_turn(session_id, user.id, result)
+        except StaleSessionError:
+            if retry == SESSION_SAVE_RETRIES:
+                SESSION_SAVE_CONFLICTS.inc(table="game_sessions", outcome="gave_up")
+                raise
+            SESSION_SAVE_CONFLICTS.inc(table="game_sessions", outcome="replayed")
+            _, fresh_state = _load_turn(session_id, user, result["user_input"])
+            result = replay_character_turn(fresh_state, result)
+
+
+async def _begin_turn(session_id: str, user: CurrentUser, user_input: str):
+    """Like _load_turn, but answers 'hint' and 'keys' from the session cache when it can"""
+    if _is_special_command(user_input):
+        snapshot = get_session_snapshot(session_id, user.username)
+        if snapshot is not None:
+            return _special_command_response(session_id, snapshot, user_input), None
+    return await asyncio.to_thread(_load_turn, session_id, user, user_input)
+
+
+async def _stream_turn(session_id: str, user: CurrentUser, command_response, state):
+    """Yield streaming frames for a turn: tokens, provisional keys and the final GameResponse"""
+    if state is None:
+        # Special commands are answered immediately
+        yield {"type": "final", "response": command_response.model_dump()}
+        return
+
+    async for event, payload in astream_game_turn(state):
+        if event == "token":
+            yield {"type": "token", "text": payload}
+        elif event == "key":
+            yield {"type": "key", "key": payload}
+        else:
+            response = await asyncio.to_thread(_save_turn_with_retry, session_id, user, payload)
+            yield {"type": "final", "response": response.model_dump()}
 
-        stage_complete = len(current_stage_keys_found) == len(current_stage_config["keys"]) and not result["game_over"]
 
-        return GameResponse(
-            session_id=session_id,
-            stage=result["stage"],
-            character=current_stage_config["character"],
-            character_mood=result["character_mood"],
-            bot_response=result["bot_response"],
-            extracted_keys=current_stage_keys_found,  # Show only current stage keys in UI
-            score=result["score"],
-            attempts=result["attempts"],
-            resistance_level=result["resistance_level"],
-            stage_complete=stage_complete,
-            game_over=result["game_over"],
-            total_keys_in_stage=len(current_stage_config["keys"]),
-            keys_found_in_stage=len(current_stage_keys_found),
-            should_refresh=result.get("stage_just_completed", False)  # Trigger refresh after stage completion
-        )
+async def _run_turn(session_id: str, user: CurrentUser, user_input: str) -> GameResponse:
+    command_response, state = await _begin_turn(session_id, user, user_input)
+    if state is None:
+        return command_response
+
+    # Process through game workflow
+    result = await game_app.ainvoke(state)
+
+    return await asyncio.to_thread(_save_turn_with_retry, session_id, user, result)
+
+
+@router.post("/{session_id}/message")
+async def send_message(
+    session_id: str,
+    message: MessageRequest,
+    response: Response,
+    user: CurrentUser = Depends(get_current_identity),
+    idempotency_key: Optional[str] = Header(None)
+):
+    """Play a turn.
 
+    Identical requests for a session that arrive while the first is still running
+    share its execution, and a request repeating an Idempotency-Key gets the
+    original response back (with an Idempotent-Replayed header).
+    """
+    try:
+        game_response, replayed = await session_turns.run(
+            user.id, session_id, message.message, idempotency_key,
+            lambda: _run_turn(session_id, user, message.message)
+        )
+        if replayed:
+            response.headers["Idempotent-Replayed"] = "true"
+        return game_response
+
+    except IdempotencyConflict as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except StaleSessionError:
+        raise HTTPException(status_code=409, detail="The game session was changed by another request, please retry")
+    except HTTPException:
+        raise
     except Exception as e:
-        conn.rollback()
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        conn.close()
+
+
+@router.post("/{session_id}/message/stream")
+async def stream_message(
+    session_id: str,
+    message: MessageRequest,
+    user: CurrentUser = Depends(get_current_identity)
+):
+    """Send a message and stream the character's reply as Server-Sent Events.
+
+    Emits `token` events while the reply is generated, `key` events when a new
+    stage key shows up in the partial reply, and a `final` event carrying the
+    GameResponse fields once the turn has been saved. Errors, including an
+    unknown session, are sent as an `error` event.
+    """
+    async def event_stream():
+        try:
+            # Loaded under the session lock so the turn starts from the previous turn's saved state
+            async with session_turns.lock(session_id):
+                command_response, state = await _begin_turn(session_id, user, message.message)
+                async for frame in _stream_turn(session_id, user, command_response, state):
+                    yield f"event: {frame['type']}\ndata: {json.dumps(frame)}\n\n"
+        except HTTPException as e:
+            yield f"event: error\ndata: {json.dumps({'type': 'error', 'detail': e.detail})}\n\n"
+        except Exception as e:
+            yield f"event: error\ndata: {json.dumps({'type': 'error', 'detail': str(e)})}\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@router.websocket("/{session_id}/ws")
+async def game_websocket(websocket: WebSocket, session_id: str, token: str):
+    """WebSocket endpoint streaming character replies for a game session.
+
+    Browsers cannot set headers on WebSocket requests, so the access token is
+    passed as the `token` query parameter. Each `{"message": "..."}` sent by the
+    client produces the same frames as the SSE endpoint.
+    """
+    try:
+        user = decode_current_user(token)
+    except HTTPException:
+        await websocket.close(code=1008)
+        return
+
+    await websocket.accept()
+    try:
+        while True:
+            data = await websocket.receive_text()
+            message = json.loads(data)
+
+            if message.get("type") == "ping":
+                await websocket.send_text(json.dumps({"type": "pong"}))
+                continue
+
+            if RATE_LIMIT_ENABLED:
+                # Messages on an open socket bypass the HTTP middleware, so take from the LLM buckets here
+                client_host = websocket.client.host if websocket.client else "unknown"
+                refused = await admission.check(client_host, user.username, llm=True)
+                if refused is not None:
+                    detail, retry_after = refused
+                    await websocket.send_text(json.dumps({
+                        "type": "error", "detail": detail, "retry_after": retry_after_seconds(retry_after)
+                    }))
+                    continue
+
+            try:
+                async with session_turns.lock(session_id):
+                    command_response, state = await _begin_turn(session_id, user, message.get("message", ""))
+                    async for frame in _stream_turn(session_id, user, command_response, state):
+                        await websocket.send_text(json.dumps(frame))
+            except HTTPException as e:
+                await websocket.send_text(json.dumps({"type": "error", "detail": e.detail}))
+            except Exception as e:
+                await websocket.send_text(json.dumps({"type": "error", "detail": str(e)}))
+
+    except WebSocketDisconnect:
+        pass
 
 
 @router.get("/stages")
-async def get_stages_info():
+async def get_stages_info(if_none_match: Optional[str] = Header(None)):
     """Get information about all game stages"""
-    stages_info = []
-    for stage_num, config in STAGES.items():
-        stages_info.append({
-            "stage": stage_num,
-            "character": config["character"],
-            "difficulty": config["difficulty"],
-            "story": config["story"],
-            "total_keys": len(config["keys"])
-        })
-
-    return {"stages": stages_info}
+    return _catalog_response(STAGE_LIST, if_none_match, f"public, max-age={STAGE_CATALOG_MAX_AGE}")
 
 
 @router.get("/{session_id}/status")
-async def get_game_status(session_id: str, current_user: str = Depends(get_current_user)):
+async def get_game_status(session_id: str, user: CurrentUser = Depends(get_current_identity)):
     """Get current game status"""
+    session_store.flush(session_id)
     conn = get_db()
     cursor = conn.cursor()
 
     try:
-        # Get user ID
-        cursor.execute("SELECT id FROM users WHERE username = ?", (current_user,))
-        user = cursor.fetchone()
-        if not user:
-            raise HTTPException(status_code=404, detail="User not found")
-
         cursor.execute("""
             SELECT * FROM game_sessions
             WHERE id = ? AND user_id = ?
-        """, (session_id, user["id"]))
+        """, (session_id, user.id))
 
         session = cursor.fetchone()
         if not session:
             raise HTTPException(status_code=404, detail="Game session not found")
 
-        stage_config = STAGES[session["stage"]] if session["stage"] <= len(STAGES) else STAGES[len(STAGES)]
+        display_stage = min(session["stage"], len(STAGES))
+        stage_config = STAGES[display_stage]
         extracted_keys = json.loads(session["extracted_keys"])
 
         # Get only keys from current stage for display
-        current_stage_keys = []
-        for key in stage_config["keys"]:
-            if key in extracted_keys:
-                current_stage_keys.append(key)
+        current_stage_keys = stage_keys_found(extracted_keys, display_stage)
 
         return {
             "session_id": session_id,
@@ -428,28 +622,65 @@ async def get_game_status(session_id: str, current_user: str = Depends(get_curre
         conn.close()
 
 
+@router.get("/{session_id}/turns")
+async def get_conversation_turns(session_id: str, limit: int = 20, user: CurrentUser = Depends(get_current_identity)):
+    """Get the last exchanges of the current stage, oldest first"""
+    if limit < 1 or limit > 100:
+        raise HTTPException(status_code=400, detail="limit must be between 1 and 100")
+
+    session_store.flush(session_id)
+    conn = get_db()
+    cursor = conn.cursor()
+
+    try:
+        cursor.execute("""
+            SELECT stage FROM game_sessions
+            WHERE id = ? AND user_id = ?
+        """, (session_id, user.id))
+
+        session = cursor.fetchone()
+        if not session:
+            raise HTTPException(status_code=404, detail="Game session not found")
+
+        turns = get_recent_turns(cursor, session_id, session["stage"], limit)
+        return {
+            "session_id": session_id,
+            "stage": session["stage"],
+            "turns": [
+                {
+                    "seq": turn["seq"],
+                    "user_message": turn["user_message"],
+                    "assistant_message": turn["assistant_message"],
+                    "created_at": str(turn["created_at"])
+                }
+                for turn in turns
+            ]
+        }
+
+    finally:
+        conn.close()
+
+
 @router.delete("/{session_id}")
-async def end_game(session_id: str, current_user: str = Depends(get_current_user)):
+async def end_game(session_id: str, user: CurrentUser = Depends(get_current_identity)):
     """End a game session"""
+    session_store.evict(session_id)
     conn = get_db()
     cursor = conn.cursor()
 
     try:
-        # Get user ID
-        cursor.execute("SELECT id FROM users WHERE username = ?", (current_user,))
-        user = cursor.fetchone()
-        if not user:
-            raise HTTPException(status_code=404, detail="User not found")
-
         cursor.execute("""
-            UPDATE game_sessions SET game_over = TRUE, updated_at = CURRENT_TIMESTAMP
+            UPDATE game_sessions SET game_over = TRUE, version = version + 1, updated_at = CURRENT_TIMESTAMP
             WHERE id = ? AND user_id = ?
-        """, (session_id, user["id"]))
+        """, (session_id, user.id))
 
         if cursor.rowcount == 0:
             raise HTTPException(status_code=404, detail="Game session not found")
 
+        sync_leaderboard_entry(cursor, user.id)
         conn.commit()
+        forget_session(session_id)
+        invalidate_public_stats()
         return {"message": "Game session ended successfully"}
 
     except Exception as e:
@@ -1,206 +1,182 @@
-from fastapi import APIRouter
-import json
+from fastapi import APIRouter, HTTPException, Header, Response
+from fastapi.encoders import jsonable_encoder
+from typing import List, Optional, Tuple
+import asyncio
 
 from app.models.schemas import LeaderboardEntry
-from app.database.connection import get_db
-from app.game.stages import STAGES
+from app.database.connection import get_db, db_connection
+from app.game.catalog import CatalogEntry, json_entry, etag_matches
+from app.game.leaderboard import encode_leaderboard_cursor, decode_leaderboard_cursor, public_stats_cache
+from app.utils.metrics import registry, render_metrics
+from app.config.settings import PUBLIC_STATS_TTL, LEADERBOARD_CACHE_MAX_LIMIT
 
 router = APIRouter(tags=["stats"])
 
+PUBLIC_CACHE_CONTROL = f"public, max-age={int(PUBLIC_STATS_TTL)}"
 
-@router.get("/leaderboard")
-async def get_leaderboard(limit: int = 15):
+
+def _cached_response(entry: CatalogEntry, if_none_match: Optional[str], headers: Optional[dict] = None) -> Response:
+    """Serve a cached body, or 304 if the client already has it"""
+    headers = {**(headers or {}), "ETag": entry.etag, "Cache-Control": PUBLIC_CACHE_CONTROL}
+    if etag_matches(if_none_match, entry.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry.body, media_type="application/json", headers=headers)
+
+
+def _load_leaderboard(limit: int, after: Optional[str] = None) -> Tuple[List[LeaderboardEntry], Optional[str]]:
+    """One page of the leaderboard and the cursor for the next page, if there may be one"""
     conn = get_db()
     cursor = conn.cursor()
-    
+
     try:
-        # Get latest session for each user with their progress
-        cursor.execute("""
-            SELECT 
-                u.username,
-                u.id as user_id,
-                COALESCE(latest_session.stage, 1) as current_stage,
-                COALESCE(latest_session.score, 0) as score,
-                COALESCE(latest_session.extracted_keys, '[]') as extracted_keys_json,
-                COALESCE(latest_session.game_over, 0) as game_over,
-                COALESCE(latest_session.success, 0) as success,
-                COALESCE(latest_session.updated_at, u.created_at) as last_active
-            FROM users u
-            LEFT JOIN (
-                SELECT 
-                    gs1.user_id,
-                    gs1.stage,
-                    gs1.score,
-                    gs1.extracted_keys,
-                    gs1.game_over,
-                    gs1.success,
-                    gs1.updated_at
-                FROM game_sessions gs1
-                WHERE gs1.updated_at = (
-                    SELECT MAX(gs2.updated_at)
-                    FROM game_sessions gs2
-                    WHERE gs2.user_id = gs1.user_id
-                )
-            ) latest_session ON u.id = latest_session.user_id
-            ORDER BY 
-                -- Prioritize completed players, then by normalized score
-                CASE WHEN latest_session.game_over = 1 AND latest_session.success = 1 THEN 1000000 + latest_session.score
-                     ELSE latest_session.stage * 100000 + latest_session.score END DESC,
-                latest_session.updated_at DESC
-            LIMIT ?
-        """, (limit,))
-        
-        results = cursor.fetchall()
-        
-        leaderboard_entries = []
-        for row in results:
+        if after:
             try:
-                # Parse extracted keys JSON
-                extracted_keys = json.loads(row["extracted_keys_json"])
-            except (json.JSONDecodeError, TypeError):
-                extracted_keys = []
-            
-            current_stage = max(1, row["current_stage"])
-            
-            # Calculate accurate progress based on game state
-            if row["game_over"] and row["success"]:
-                # Game completed successfully
-                completion_status = "completed"
-                stages_completed = len(STAGES)  # Completed all stages
-                
-                # For completed players: show total keys from all stages
-                keys_found = len(extracted_keys)
-                total_keys_possible = sum(len(STAGES[stage]["keys"]) for stage in STAGES)
-                
-                # Completed players get full score
-                display_score = row["score"]
-                
-            elif row["game_over"] and not row["success"]:
-                # Game abandoned or failed
-                completion_status = "abandoned"
-                
-                # Count how many stages were actually completed
-                stages_completed = 0
-                keys_by_stage = {}
-                
-                # Group keys by stage to count completed stages
-                for key in extracted_keys:
-                    for stage_num, stage_data in STAGES.items():
-                        if key in stage_data["keys"]:
-                            if stage_num not in keys_by_stage:
-                                keys_by_stage[stage_num] = []
-                            keys_by_stage[stage_num].append(key)
-                
-                # Count completed stages (all keys found)
-                for stage_num, found_keys in keys_by_stage.items():
-                    if len(found_keys) == len(STAGES[stage_num]["keys"]):
-                        stages_completed += 1
-                
-                # For abandoned games: show progress in current stage
-                current_stage_keys = []
-                if current_stage in STAGES:
-                    for key in extracted_keys:
-                        if key in STAGES[current_stage]["keys"]:
-                            current_stage_keys.append(key)
-                
-                keys_found = len(current_stage_keys)
-                total_keys_possible = len(STAGES.get(current_stage, {}).get("keys", []))
-                
-                # Abandoned players get reduced score based on progress
-                stage_multiplier = sum(0.8 ** (i-1) for i in range(1, current_stage))
-                display_score = int(row["score"] * stage_multiplier)
-                
-            else:
-                # Active game
-                completion_status = "active"
-                
-                # Count completed stages
-                stages_completed = 0
-                keys_by_stage = {}
-                
-                # Group keys by stage
-                for key in extracted_keys:
-                    for stage_num, stage_data in STAGES.items():
-                        if key in stage_data["keys"]:
-                            if stage_num not in keys_by_stage:
-                                keys_by_stage[stage_num] = []
-                            keys_by_stage[stage_num].append(key)
-                
-                # Count completed stages
-                for stage_num, found_keys in keys_by_stage.items():
-                    if len(found_keys) == len(STAGES[stage_num]["keys"]):
-                        stages_completed += 1
-                
-                # For active games: show progress in current stage only
-                current_stage_keys = []
-                if current_stage in STAGES:
-                    for key in extracted_keys:
-                        if key in STAGES[current_stage]["keys"]:
-                            current_stage_keys.append(key)
-                
-                keys_found = len(current_stage_keys)
-                total_keys_possible = len(STAGES.get(current_stage, {}).get("keys", []))
-                
-                # Active players get current score
-                display_score = row["score"]
-            
-            leaderboard_entries.append(LeaderboardEntry(
+                sort_score, last_active, user_id = decode_leaderboard_cursor(after)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+
+            cursor.execute("""
+                SELECT le.*, u.username
+                FROM leaderboard_entries le
+                JOIN users u ON u.id = le.user_id
+                WHERE (le.sort_score, le.last_active, le.user_id) < (?, ?, ?)
+                ORDER BY le.sort_score DESC, le.last_active DESC, le.user_id DESC
+                LIMIT ?
+            """, (sort_score, last_active, user_id, limit))
+        else:
+            cursor.execute("""
+                SELECT le.*, u.username
+                FROM leaderboard_entries le
+                JOIN users u ON u.id = le.user_id
+                ORDER BY le.sort_score DESC, le.last_active DESC, le.user_id DESC
+                LIMIT ?
+            """, (limit,))
+
+        results = cursor.fetchall()
+
+        leaderboard_entries = [
+            LeaderboardEntry(
                 username=row["username"],
-                score=display_score,
-                current_stage=current_stage,
-                stages_completed=stages_completed,
-                keys_found=keys_found,
-                total_keys_possible=total_keys_possible,
-                is_active=(completion_status == "active"),
+                score=row["score"],
+                current_stage=row["current_stage"],
+                stages_completed=row["stages_completed"],
+                keys_found=row["keys_found"],
+                total_keys_possible=row["total_keys_possible"],
+                is_active=(row["completion_status"] == "active"),
                 last_active=row["last_active"],
-                completion_status=completion_status
-            ))
-        
-        return leaderboard_entries
-    
+                completion_status=row["completion_status"]
+            )
+            for row in results
+        ]
+
+        next_cursor = None
+        if results and len(results) == limit:
+            next_cursor = encode_leaderboard_cursor(results[-1])
+
+        return leaderboard_entries, next_cursor
+
     finally:
         conn.close()
 
 
-@router.get("/stats/global")
-async def get_global_stats():
-    """Get global game statistics"""
+def _load_leaderboard_page(limit: int) -> Tuple[CatalogEntry, Optional[str]]:
+    leaderboard_entries, next_cursor = _load_leaderboard(limit)
+    return json_entry(jsonable_encoder(leaderboard_entries)), next_cursor
+
+
+def _load_global_stats() -> CatalogEntry:
     conn = get_db()
     cursor = conn.cursor()
-    
+
     try:
-        # Total users
-        cursor.execute("SELECT COUNT(*) as total_users FROM users")
-        total_users = cursor.fetchone()["total_users"]
-        
-        # Total games
-        cursor.execute("SELECT COUNT(*) as total_games FROM game_sessions WHERE game_over = TRUE")
-        total_games = cursor.fetchone()["total_games"]
-        
-        # Successful completions
-        cursor.execute("SELECT COUNT(*) as successful_games FROM game_sessions WHERE game_over = TRUE AND success = TRUE")
-        successful_games = cursor.fetchone()["successful_games"]
-        
-        # Average score
-        cursor.execute("SELECT AVG(final_score) as avg_score FROM game_results")
-        avg_score_result = cursor.fetchone()
-        avg_score = round(avg_score_result["avg_score"] or 0, 2)
-        
-        # Highest score
-        cursor.execute("SELECT MAX(final_score) as max_score FROM game_results")
-        max_score = cursor.fetchone()["max_score"] or 0
-        
-        # Success rate
-        success_rate = (successful_games / total_games * 100) if total_games > 0 else 0
-        
-        return {
-            "total_users": total_users,
-            "total_games": total_games,
-            "successful_games": successful_games,
-            "success_rate": round(success_rate, 2),
-            "average_score": avg_score,
-            "highest_score": max_score
-        }
-    
+        # All five aggregates in one round trip
+        cursor.execute("""
+            SELECT
+                (SELECT COUNT(*) FROM users) AS total_users,
+                games.total_games, games.successful_games,
+                results.avg_score, results.max_score
+            FROM (
+                SELECT COUNT(*) AS total_games,
+                       COALESCE(SUM(CASE WHEN success = TRUE THEN 1 ELSE 0 END), 0) AS successful_games
+                FROM game_sessions
+                WHERE game_over = TRUE
+            ) games, (
+                SELECT AVG(final_score) AS avg_score, MAX(final_score) AS max_score
+                FROM game_results
+            ) results
+        """)
+        row = cursor.fetchone()
     finally:
         conn.close()
+
+    total_games = int(row["total_games"])
+    successful_games = int(row["successful_games"])
+    success_rate = (successful_games / total_games * 100) if total_games > 0 else 0
+
+    return json_entry({
+        "total_users": int(row["total_users"]),
+        "total_games": total_games,
+        "successful_games": successful_games,
+        "success_rate": round(success_rate, 2),
+        "average_score": round(float(row["avg_score"] or 0), 2),
+        "highest_score": row["max_score"] or 0
+    })
+
+
+@router.get("/leaderboard")
+async def get_leaderboard(
+    response: Response,
+    limit: int = 15,
+    after: Optional[str] = None,
+    if_none_match: Optional[str] = Header(None)
+):
+    """Top players, highest first. Pass the X-Next-Cursor header value as `after` for the next page."""
+    if after or not 0 < limit <= LEADERBOARD_CACHE_MAX_LIMIT:
+        leaderboard_entries, next_cursor = _load_leaderboard(limit, after)
+        if next_cursor:
+            response.headers["X-Next-Cursor"] = next_cursor
+        return leaderboard_entries
+
+    entry, next_cursor = await public_stats_cache.get(("leaderboard", limit), lambda: _load_leaderboard_page(limit))
+    return _cached_response(entry, if_none_match, {"X-Next-Cursor": next_cursor} if next_cursor else None)
+
+
+@router.get("/stats/global")
+async def get_global_stats(if_none_match: Optional[str] = Header(None)):
+    """Get global game statistics"""
+    entry = await public_stats_cache.get("global_stats", _load_global_stats)
+    return _cached_response(entry, if_none_match)
+
+
+def _count_active_sessions() -> dict:
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT COUNT(*) AS active FROM game_sessions WHERE game_over = FALSE")
+        return {(): cursor.fetchone()["active"]}
+
+
+def _count_open_tournaments() -> dict:
+    counts = {("waiting",): 0, ("active",): 0}
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT status, COUNT(*) AS open FROM tournaments
+            WHERE status IN ('waiting', 'active')
+            GROUP BY status
+        """)
+        for row in cursor.fetchall():
+            counts[(row["status"],)] = row["open"]
+    return counts
+
+
+registry.gauge("game_sessions_active", "Game sessions that are not over", collect=_count_active_sessions)
+registry.gauge("tournaments_open", "Tournaments waiting for players or in progress", ["status"],
+               collect=_count_open_tournaments)
+
+
+@router.get("/metrics")
+async def get_metrics():
+    """Prometheus metrics for this worker"""
+    # The session and tournament gauges query the database at scrape time
+    body = await asyncio.to_thread(render_metrics)
+    return Response(content=body, media_type="text/plain; version=0.0.4")
@@ -1,53 +1,42 @@
 from fastapi import APIRouter, HTTPException, Depends, WebSocket, WebSocketDisconnect
+import asyncio
 import json
 import uuid
 import random
 import string
 from datetime import datetime, timedelta
-from typing import Dict, List
+from typing import Optional
 
 from app.models.tournament import (
     TournamentCreate, TournamentJoin, Tournament, TournamentParticipant,
     TournamentStatus, TournamentResults, TournamentEvent, TournamentGameState
 )
 from app.models.game_state import GameState
-from app.database.connection import get_db
-from app.auth.auth import get_current_user
+from app.database.connection import get_db, db_connection
+from app.database.write_behind import enqueue_write
+from app.auth.auth import CurrentUser, get_current_user, get_current_identity
 from app.game.stages import STAGES
-from app.game.workflow import create_game_workflow
+from app.game.keys import stage_keys_found
+from app.game.workflow import create_async_game_workflow, replay_character_turn
+from app.game.session_versions import StaleSessionError, SESSION_SAVE_CONFLICTS, require_swapped
+from app.game.conversation import append_turn, load_conversation_history
+from app.realtime.connections import TournamentConnectionManager
+from app.realtime.bus import create_broadcast_bus
+from app.realtime.events import load_tournament_events
+from app.realtime.scheduler import TournamentScheduler
+from app.utils.metrics import log_sampled
+from app.config.settings import SESSION_SAVE_RETRIES
 
 router = APIRouter(prefix="/tournament", tags=["tournament"])
 
 # Create game workflow instance for tournament
-tournament_game_app = create_game_workflow()
+tournament_game_app = create_async_game_workflow()
 
-# WebSocket connection manager
-class TournamentConnectionManager:
-    def __init__(self):
-        self.active_connections: Dict[str, List[WebSocket]] = {}
+# WebSocket connection manager; broadcasts reach the other workers through the bus
+manager = TournamentConnectionManager(bus=create_broadcast_bus())
 
-    async def connect(self, websocket: WebSocket, tournament_id: str):
-        await websocket.accept()
-        if tournament_id not in self.active_connections:
-            self.active_connections[tournament_id] = []
-        self.active_connections[tournament_id].append(websocket)
-
-    def disconnect(self, websocket: WebSocket, tournament_id: str):
-        if tournament_id in self.active_connections:
-            self.active_connections[tournament_id].remove(websocket)
-            if not self.active_connections[tournament_id]:
-                del self.active_connections[tournament_id]
-
-    async def broadcast_to_tournament(self, tournament_id: str, message: dict):
-        if tournament_id in self.active_connections:
-            for connection in self.active_connections[tournament_id]:
-                try:
-                    await connection.send_text(json.dumps(message))
-                except:
-                    # Connection is broken, remove it
-                    self.active_connections[tournament_id].remove(connection)
-
-manager = TournamentConnectionManager()
+# Ends tournaments when their time runs out and cancels rooms that never start
+scheduler = TournamentScheduler(manager)
 
 
 def generate_room_code() -> str:
@@ -58,19 +47,13 @@ def generate_room_code() -> str:
 @router.post("/create")
 async def create_tournament(
     tournament_data: TournamentCreate,
-    current_user: str = Depends(get_current_user)
+    user: CurrentUser = Depends(get_current_identity)
 ):
     """Create a new tournament"""
     conn = get_db()
     cursor = conn.cursor()
     
     try:
-        # Get user ID
-        cursor.execute("SELECT id FROM users WHERE username = ?", (current_user,))
-        user = cursor.fetchone()
-        if not user:
-            raise HTTPException(status_code=404, detail="User not found")
-        
         # Generate unique tournament ID and room code
         tournament_id = str(uuid.uuid4())
         room_code = generate_room_code()
@@ -87,7 +70,7 @@ async def create_tournament(
             INSERT INTO tournaments (
                 id, room_code, host_user_id, stage, time_limit, tournament_mode, status
             ) VALUES (?, ?, ?, ?, ?, ?, 'waiting')
-        """, (tournament_id, room_code, user["id"], tournament_data.stage, 
+        """, (tournament_id, room_code, user.id, tournament_data.stage, 
               tournament_data.time_limit, tournament_data.tournament_mode))
         
         # Add host as first participant
@@ -95,9 +78,10 @@ async def create_tournament(
             INSERT INTO tournament_participants (
                 tournament_id, user_id, is_ready
             ) VALUES (?, ?, FALSE)
-        """, (tournament_id, user["id"]))
+        """, (tournament_id, user.id))
         
         conn.commit()
+        scheduler.schedule_reap(tournament_id)
         
         return {
             "tournament_id": tournament_id,
@@ -117,7 +101,7 @@ async def create_tournament(
 @router.post("/join")
 async def join_tournament(
     join_data: TournamentJoin,
-    current_user: str = Depends(get_current_user)
+    user: CurrentUser = Depends(get_current_identity)
 ):
     """Join an existing tournament"""
     conn = get_db()
@@ -137,12 +121,6 @@ async def join_tournament(
         if tournament["status"] != "waiting":
             raise HTTPException(status_code=400, detail="Tournament already started or completed")
         
-        # Get user ID
-        cursor.execute("SELECT id FROM users WHERE username = ?", (current_user,))
-        user = cursor.fetchone()
-        if not user:
-            raise HTTPException(status_code=404, detail="User not found")
-        
         # Check if tournament is full
         cursor.execute("""
             SELECT COUNT(DISTINCT CASE WHEN tp.user_id IS NOT NULL THEN tp.user_id ELSE tp.guest_name END) as unique_count
@@ -158,7 +136,7 @@ async def join_tournament(
         cursor.execute("""
             SELECT id FROM tournament_participants 
             WHERE tournament_id = ? AND user_id = ?
-        """, (tournament["id"], user["id"]))
+        """, (tournament["id"], user.id))
         
         if cursor.fetchone():
             raise HTTPException(status_code=400, detail="Already joined this tournament")
@@ -169,9 +147,9 @@ async def join_tournament(
                 INSERT INTO tournament_participants (
                     tournament_id, user_id, is_ready
                 ) VALUES (?, ?, FALSE)
-            """, (tournament["id"], user["id"]))
+            """, (tournament["id"], user.id))
         except Exception as e:
-            if "UNIQUE constraint failed" in str(e):
+            if "UNIQUE constraint failed" in str(e) or "duplicate key value" in str(e):
                 raise HTTPException(status_code=400, detail="You are already in this tournament")
             else:
                 raise HTTPException(status_code=500, detail="Failed to join tournament")
@@ -181,7 +159,7 @@ async def join_tournament(
         # Broadcast join event
         await manager.broadcast_to_tournament(tournament["id"], {
             "type": "participant_joined",
-            "username": current_user,
+            "username": user.username,
             "participant_count": participant_count + 1
         })
         
@@ -317,32 +295,26 @@ async def get_tournament_status(
 async def set_ready_status(
     tournament_id: str,
     ready: bool,
-    current_user: str = Depends(get_current_user)
+    user: CurrentUser = Depends(get_current_identity)
 ):
     """Set player ready status"""
     conn = get_db()
     cursor = conn.cursor()
     
     try:
-        # Get user ID
-        cursor.execute("SELECT id FROM users WHERE username = ?", (current_user,))
-        user = cursor.fetchone()
-        if not user:
-            raise HTTPException(status_code=404, detail="User not found")
-        
         # Update ready status
         cursor.execute("""
             UPDATE tournament_participants 
             SET is_ready = ?
             WHERE tournament_id = ? AND user_id = ?
-        """, (ready, tournament_id, user["id"]))
+        """, (ready, tournament_id, user.id))
         
         if cursor.rowcount == 0:
             raise HTTPException(status_code=404, detail="Not a participant in this tournament")
         
         # Check if all participants are ready
         cursor.execute("""
-            SELECT COUNT(*) as total, SUM(is_ready) as ready_count
+            SELECT COUNT(*) as total, SUM(CASE WHEN is_ready THEN 1 ELSE 0 END) as ready_count
             FROM tournament_participants 
             WHERE tournament_id = ?
         """, (tournament_id,))
@@ -363,7 +335,7 @@ async def set_ready_status(
         # Broadcast ready status change
         await manager.broadcast_to_tournament(tournament_id, {
             "type": "ready_status_changed",
-            "username": current_user,
+            "username": user.username,
             "is_ready": ready,
             "all_ready": all_ready
         })
@@ -380,7 +352,7 @@ async def set_ready_status(
 @router.post("/{tournament_id}/start")
 async def start_tournament(
     tournament_id: str,
-    current_user: str = Depends(get_current_user)
+    user: CurrentUser = Depends(get_current_identity)
 ):
     """Start the tournament (host only)"""
     conn = get_db()
@@ -388,18 +360,13 @@ async def start_tournament(
     
     try:
         # Get tournament and verify host
-        cursor.execute("""
-            SELECT t.*, u.username as host_username
-            FROM tournaments t
-            JOIN users u ON t.host_user_id = u.id
-            WHERE t.id = ?
-        """, (tournament_id,))
+        cursor.execute("SELECT * FROM tournaments WHERE id = ?", (tournament_id,))
         
         tournament = cursor.fetchone()
         if not tournament:
             raise HTTPException(status_code=404, detail="Tournament not found")
         
-        if tournament["host_username"] != current_user:
+        if tournament["host_user_id"] != user.id:
             raise HTTPException(status_code=403, detail="Only host can start tournament")
         
         if tournament["status"] != "ready":
@@ -444,6 +411,7 @@ async def start_tournament(
                   tournament["stage"], started_at, 'active'))
         
         conn.commit()
+        scheduler.schedule_expiry(tournament_id, started_at, tournament["time_limit"])
         
         # Broadcast tournament start
         await manager.broadcast_to_tournament(tournament_id, {
@@ -514,119 +482,204 @@ async def get_tournament_leaderboard(tournament_id: str):
         conn.close()
 
 
-@router.post("/{tournament_id}/submit-answer")
-async def submit_tournament_answer(
-    tournament_id: str,
-    answer: dict,
-    current_user: str = Depends(get_current_user)
-):
-    """Submit answer for tournament game"""
-    conn = get_db()
-    cursor = conn.cursor()
-    
+def _load_tournament_session(cursor, tournament_id: str, user_id: int):
+    """The player's active tournament game session and its AI workflow state, or None"""
+    cursor.execute("""
+        SELECT tgs.*, tp.id as participant_id
+        FROM tournament_game_sessions tgs
+        JOIN tournament_participants tp ON tgs.participant_id = tp.id
+        WHERE tgs.tournament_id = ? AND tp.user_id = ? AND tgs.status = 'active'
+    """, (tournament_id, user_id))
+
+    game_session = cursor.fetchone()
+    if not game_session:
+        return None
+
+    # Get or initialize session data for the AI workflow
+    session_data_raw = game_session["session_data"] if game_session["session_data"] else None
+    session_data = json.loads(session_data_raw) if session_data_raw else {
+        "character_mood": "helpful",
+        "resistance_level": 1,
+        "failed_attempts": 0,
+        "extracted_keys": []
+    }
+    return game_session, session_data
+
+
+def _tournament_game_state(cursor, game_session, session_data: dict, user_input: str) -> GameState:
+    """GameState for a tournament answer, as the main game would build it"""
+    return GameState(
+        stage=game_session["stage"],
+        score=game_session["score"],
+        attempts=0,  # We'll track this separately in tournament
+        extracted_keys=session_data.get("extracted_keys", []),
+        user_input=user_input,
+        bot_response="",
+        game_over=False,
+        success=False,
+        conversation_history=load_conversation_history(cursor, game_session["id"], game_session["stage"]),
+        new_turns=[],
+        character_mood=session_data.get("character_mood", "helpful"),
+        resistance_level=session_data.get("resistance_level", 1),
+        failed_attempts=session_data.get("failed_attempts", 0),
+        session_version=game_session["version"]
+    )
+
+
+def _load_tournament_turn(tournament_id: str, user_id: int, user_input: str):
+    """Load the player's active session for an answer; returns (game_session, session_data, state), or None"""
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        loaded = _load_tournament_session(cursor, tournament_id, user_id)
+        if loaded is None:
+            return None
+        game_session, session_data = loaded
+        return game_session, session_data, _tournament_game_state(cursor, game_session, session_data, user_input)
+
+
+def _win_tournament(cursor, tournament_id: str, game_session, stage_config: dict, stage_keys: list, result) -> dict:
+    """Close the winner's session and the tournament; returns the answer's result"""
     try:
-        # Get user ID
-        cursor.execute("SELECT id FROM users WHERE username = ?", (current_user,))
-        user = cursor.fetchone()
-        if not user:
-            raise HTTPException(status_code=404, detail="User not found")
-        
-        # Get participant game session
+        # In tournament mode, completing any stage ends the tournament
+        # Update this player's status to completed, unless another answer was saved meanwhile
         cursor.execute("""
-            SELECT tgs.*, tp.id as participant_id
-            FROM tournament_game_sessions tgs
-            JOIN tournament_participants tp ON tgs.participant_id = tp.id
-            WHERE tgs.tournament_id = ? AND tp.user_id = ? AND tgs.status = 'active'
-        """, (tournament_id, user["id"]))
-        
-        game_session = cursor.fetchone()
-        if not game_session:
-            raise HTTPException(status_code=404, detail="No active game session found")
-        
-        # Debug: Check what columns exist in game_session
-        print(f"Game session keys: {list(game_session.keys()) if game_session else 'None'}")
-        print(f"Game session data: {dict(game_session) if game_session else 'None'}")
-        
-        # Get or initialize session data for the AI workflow
-        session_data_raw = game_session["session_data"] if game_session["session_data"] else None
-        session_data = json.loads(session_data_raw) if session_data_raw else {
-            "conversation_history": [],
-            "character_mood": "helpful", 
-            "resistance_level": 1,
-            "failed_attempts": 0,
-            "extracted_keys": []
+            UPDATE tournament_game_sessions
+            SET status = 'completed', completed_at = ?, version = version + 1
+            WHERE id = ? AND version = ?
+        """, (datetime.now().isoformat(), game_session["id"], game_session["version"]))
+        require_swapped(cursor, "tournament_game_sessions")
+
+        # Update tournament status to completed
+        cursor.execute("""
+            UPDATE tournaments
+            SET status = 'completed'
+            WHERE id = ?
+        """, (tournament_id,))
+
+        # Calculate final score with stage completion bonus
+        difficulty = stage_config.get("difficulty", "EASY")
+        difficulty_multipliers = {
+            "EASY": 1.0,
+            "MEDIUM": 1.2,
+            "HARD": 1.5,
+            "VERY HARD": 2.0,
+            "MASTER": 3.0
         }
-        
-        # Create GameState object for the AI workflow
-        game_state = GameState(
-            stage=game_session["stage"],
-            score=game_session["score"],
-            attempts=0,  # We'll track this separately in tournament
-            extracted_keys=session_data.get("extracted_keys", []),
-            user_input=answer.get("message", ""),
-            bot_response="",
-            game_over=False,
-            success=False,
-            conversation_history=session_data.get("conversation_history", []),
-            character_mood=session_data.get("character_mood", "helpful"),
-            resistance_level=session_data.get("resistance_level", 1),
-            failed_attempts=session_data.get("failed_attempts", 0)
-        )
-        
-        # Process through the AI workflow (same as main game)
-        print(f"Invoking AI workflow with game_state: {game_state}")
-        result = tournament_game_app.invoke(game_state)
-        print(f"AI workflow result: {result}")
-        
-        # Update session data with new state
-        new_session_data = {
-            "conversation_history": result["conversation_history"],
-            "character_mood": result["character_mood"],
-            "resistance_level": result["resistance_level"],
-            "failed_attempts": result["failed_attempts"],
-            "extracted_keys": result["extracted_keys"]
+        score_multiplier = difficulty_multipliers.get(difficulty, 1.0)
+        stage_completion_bonus = int(200 * score_multiplier)  # Bigger bonus for winning
+
+        final_score = (game_session["score"] or 0) + stage_completion_bonus
+
+        # Update final score
+        cursor.execute("""
+            UPDATE tournament_game_sessions
+            SET score = ?
+            WHERE id = ?
+        """, (final_score, game_session["id"]))
+
+        response_message = f"� TOURNAMENT WINNER! You completed Stage {game_session['stage']} first! Final Score: {final_score}"
+        return {
+            "response": response_message,
+            "stage_completed": True,
+            "tournament_won": True,
+            "score": stage_completion_bonus,
+            "total_score": final_score,
+            "extracted_keys": result["extracted_keys"],
+            "keys_found": len(stage_keys),
+            "total_keys": len(stage_config["keys"])
         }
-        
-        print(f"Processing stage completion for stage {game_session['stage']}")
-        print(f"Session extracted keys: {session_data.get('extracted_keys', [])}")
-        print(f"AI result extracted keys: {result['extracted_keys']}")
-        
-        try:
-            # Check if stage is completed (all keys found for current stage)
-            if game_session["stage"] not in STAGES:
-                raise ValueError(f"Invalid stage: {game_session['stage']}")
-                
-            current_stage_config = STAGES[game_session["stage"]]
-            
-            # Get previous keys to detect NEW keys found in this turn
-            previous_keys = session_data.get("extracted_keys", [])
-            current_stage_keys = []
-            
-            # Find keys that belong to current stage and are in the extracted keys
-            for key in current_stage_config["keys"]:
-                if key in result["extracted_keys"]:
-                    current_stage_keys.append(key)
-            
-            # Find new keys found in this turn
-            new_keys_this_turn = []
-            for key in result["extracted_keys"]:
-                if key not in previous_keys:
-                    new_keys_this_turn.append(key)
-            
-            stage_completed = len(current_stage_keys) >= len(current_stage_config["keys"])
-            
-            print(f"Processing stage completion for stage {game_session['stage']}")
-            print(f"Session extracted keys: {previous_keys}")
-            print(f"AI result extracted keys: {result['extracted_keys']}")
-            print(f"Current stage keys found: {current_stage_keys}")
-            print(f"New keys this turn: {new_keys_this_turn}")
-            print(f"Stage completed: {stage_completed}")
-            
-        except Exception as e:
-            print(f"Error in stage validation: {e}, stage: {game_session['stage']}")
-            print(f"Available stages: {list(STAGES.keys())}")
-            # Fallback to basic response
-            ai_result = {
+    except StaleSessionError:
+        raise
+    except Exception as e:
+        print(f"Error in tournament completion logic: {e}")
+        # Fallback response
+        return {
+            "response": "You completed the stage and won the tournament!",
+            "stage_completed": True,
+            "tournament_won": True,
+            "score": 200,
+            "total_score": (game_session["score"] or 0) + 200,
+            "extracted_keys": result["extracted_keys"],
+            "keys_found": len(stage_keys),
+            "total_keys": len(stage_config["keys"])
+        }
+
+
+def _continue_tournament(cursor, game_session, stage_config: dict, stage_keys: list, result) -> dict:
+    """Save the session's progress on its stage; returns the answer's result"""
+    new_session_data = {
+        "character_mood": result["character_mood"],
+        "resistance_level": result["resistance_level"],
+        "failed_attempts": result["failed_attempts"],
+        "extracted_keys": result["extracted_keys"]
+    }
+    try:
+        # Continue with current stage - update session data and score from AI workflow
+        updated_score = result.get("score", game_session["score"] or 0)  # Fallback to current score
+        cursor.execute("""
+            UPDATE tournament_game_sessions
+            SET session_data = ?, score = ?, version = version + 1
+            WHERE id = ? AND version = ?
+        """, (json.dumps(new_session_data), updated_score, game_session["id"], game_session["version"]))
+        require_swapped(cursor, "tournament_game_sessions")
+
+        # Calculate score gained in this turn
+        score_gained = updated_score - (game_session["score"] or 0)
+
+        return {
+            "response": result.get("bot_response", "No response available."),
+            "stage_completed": False,
+            "score": score_gained,
+            "total_score": updated_score,
+            "extracted_keys": result.get("extracted_keys", []),
+            "keys_found": len(stage_keys),
+            "total_keys": len(stage_config.get("keys", []))
+        }
+    except StaleSessionError:
+        raise
+    except Exception as e:
+        print(f"Error in continue logic: {e}")
+        # Fallback response
+        return {
+            "response": result.get("bot_response", "Error occurred during processing."),
+            "stage_completed": False,
+            "score": 0,
+            "total_score": game_session["score"] or 0,
+            "extracted_keys": result.get("extracted_keys", []),
+            "keys_found": 0,
+            "total_keys": 3
+        }
+
+
+def _save_tournament_answer(tournament_id: str, game_session, session_data: dict, result, answer: dict) -> dict:
+    """Persist an answer's workflow result; returns the response and the progress to broadcast.
+
+    Raises StaleSessionError if another answer saved the session since it was loaded.
+    """
+    stage = game_session["stage"]
+    try:
+        # Check if stage is completed (all keys found for current stage)
+        if stage not in STAGES:
+            raise ValueError(f"Invalid stage: {stage}")
+        stage_config = STAGES[stage]
+
+        # Keys of the current stage found so far, and those new in this turn
+        stage_keys = stage_keys_found(result["extracted_keys"], stage)
+        previous_key_set = set(session_data.get("extracted_keys", []))
+        new_keys = [key for key in result["extracted_keys"] if key not in previous_key_set]
+
+        stage_completed = len(stage_keys) >= len(stage_config["keys"])
+        log_sampled(
+            "tournament_turn", tournament_id=tournament_id, stage=stage, new_keys=len(new_keys),
+            stage_keys_found=len(stage_keys), stage_completed=stage_completed
+        )
+    except Exception as e:
+        print(f"Error in stage validation: {e}, stage: {stage}")
+        print(f"Available stages: {list(STAGES.keys())}")
+        # Fallback to basic response; nothing is saved or broadcast
+        return {
+            "status": "continue",
+            "result": {
                 "response": result.get("bot_response", "System error occurred."),
                 "stage_completed": False,
                 "score": 0,
@@ -634,184 +687,148 @@ async def submit_tournament_answer(
                 "extracted_keys": result.get("extracted_keys", []),
                 "keys_found": 0,
                 "total_keys": 3
-            }
-            
-            conn.commit()
-            return {
-                "status": "continue",
-                "result": ai_result,
-                "current_stage": game_session["stage"]
-            }
-        
-        # Initialize status variable
-        status = "continue"
-        current_stage = game_session["stage"]
-        
-        if stage_completed:
-            try:
-                # In tournament mode, completing any stage ends the tournament
-                # Update this player's status to completed
-                cursor.execute("""
-                    UPDATE tournament_game_sessions 
-                    SET status = 'completed', completed_at = ?
-                    WHERE id = ?
-                """, (datetime.now().isoformat(), game_session["id"]))
-                
-                # Update tournament status to completed
-                cursor.execute("""
-                    UPDATE tournaments 
-                    SET status = 'completed'
-                    WHERE id = ?
-                """, (tournament_id,))
-                
-                # Calculate final score with stage completion bonus
-                difficulty = current_stage_config.get("difficulty", "EASY")
-                difficulty_multipliers = {
-                    "EASY": 1.0,
-                    "MEDIUM": 1.2, 
-                    "HARD": 1.5,
-                    "VERY HARD": 2.0,
-                    "MASTER": 3.0
-                }
-                score_multiplier = difficulty_multipliers.get(difficulty, 1.0)
-                stage_completion_bonus = int(200 * score_multiplier)  # Bigger bonus for winning
-                
-                final_score = (game_session["score"] or 0) + stage_completion_bonus
-                
-                # Update final score
-                cursor.execute("""
-                    UPDATE tournament_game_sessions 
-                    SET score = ?
-                    WHERE id = ?
-                """, (final_score, game_session["id"]))
-                
+            },
+            "current_stage": stage,
+            "progress": None
+        }
+
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        try:
+            if stage_completed:
                 status = "tournament_won"
-                current_stage = game_session["stage"]
-                response_message = f"� TOURNAMENT WINNER! You completed Stage {current_stage} first! Final Score: {final_score}"
-                    
-                ai_result = {
-                    "response": response_message,
-                    "stage_completed": True,
-                    "tournament_won": True,
-                    "score": stage_completion_bonus,
-                    "total_score": final_score,
-                    "extracted_keys": result["extracted_keys"],
-                    "keys_found": len(current_stage_keys),
-                    "total_keys": len(current_stage_config["keys"])
-                }
-            except Exception as e:
-                print(f"Error in tournament completion logic: {e}")
-                # Fallback response
-                ai_result = {
-                    "response": "You completed the stage and won the tournament!",
-                    "stage_completed": True,
-                    "tournament_won": True,
-                    "score": 200,
-                    "total_score": (game_session["score"] or 0) + 200,
-                    "extracted_keys": result["extracted_keys"],
-                    "keys_found": len(current_stage_keys),
-                    "total_keys": len(current_stage_config["keys"])
-                }
-        else:
-            try:
-                # Continue with current stage - update session data and score from AI workflow
-                updated_score = result.get("score", game_session["score"] or 0)  # Fallback to current score
-                cursor.execute("""
-                    UPDATE tournament_game_sessions 
-                    SET session_data = ?, score = ?
-                    WHERE id = ?
-                """, (json.dumps(new_session_data), updated_score, game_session["id"]))
-                
+                ai_result = _win_tournament(cursor, tournament_id, game_session, stage_config, stage_keys, result)
+            else:
                 status = "continue"
-                current_stage = game_session["stage"]
-                
-                # Calculate score gained in this turn
-                score_gained = updated_score - (game_session["score"] or 0)
-                
-                ai_result = {
-                    "response": result.get("bot_response", "No response available."),
-                    "stage_completed": False,
-                    "score": score_gained,
-                    "total_score": updated_score,
-                    "extracted_keys": result.get("extracted_keys", []),
-                    "keys_found": len(current_stage_keys),
-                    "total_keys": len(current_stage_config.get("keys", []))
-                }
-            except Exception as e:
-                print(f"Error in continue logic: {e}")
-                # Fallback response
-                ai_result = {
-                    "response": result.get("bot_response", "Error occurred during processing."),
-                    "stage_completed": False,
-                    "score": 0,
-                    "total_score": game_session["score"] or 0,
-                    "extracted_keys": result.get("extracted_keys", []),
-                    "keys_found": 0,
-                    "total_keys": 3
-                }
-        
-        # Log the event
-        cursor.execute("""
-            INSERT INTO tournament_events (
-                tournament_id, participant_id, event_type, event_data
-            ) VALUES (?, ?, 'answer_submitted', ?)
-        """, (tournament_id, game_session["participant_id"], 
-              json.dumps({"answer": answer, "result": ai_result})))
-        
-        conn.commit()
-        
+                ai_result = _continue_tournament(cursor, game_session, stage_config, stage_keys, result)
+
+            for turn in result.get("new_turns", []):
+                append_turn(cursor, game_session["id"], turn["stage"], turn["user"], turn["assistant"])
+
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    # Log the event once the answer is committed (written in the background; nothing reads it back on this request)
+    enqueue_write("""
+        INSERT INTO tournament_events (
+            tournament_id, participant_id, event_type, event_data
+        ) VALUES (?, ?, 'answer_submitted', ?)
+    """, (tournament_id, game_session["participant_id"],
+          json.dumps({"answer": answer, "result": ai_result})))
+
+    return {
+        "status": status,
+        "result": ai_result,
+        "current_stage": stage,
+        "progress": {
+            "keys_found": len(stage_keys),
+            "total_keys": len(stage_config.get("keys", [])),
+            "new_keys": len(new_keys)
+        }
+    }
+
+
+def _save_tournament_answer_with_retry(tournament_id: str, user_id: int, game_session, session_data: dict,
+                                       result, answer: dict) -> dict:
+    """Save an answer; if the session changed meanwhile, replay the answer on the fresh row and try again"""
+    for retry in range(SESSION_SAVE_RETRIES + 1):
+        try:
+            return _save_tournament_answer(tournament_id, game_session, session_data, result, answer)
+        except StaleSessionError:
+            if retry == SESSION_SAVE_RETRIES:
+                SESSION_SAVE_CONFLICTS.inc(table="tournament_game_sessions", outcome="gave_up")
+                raise
+            SESSION_SAVE_CONFLICTS.inc(table="tournament_game_sessions", outcome="replayed")
+
+            loaded = _load_tournament_turn(tournament_id, user_id, result["user_input"])
+            if loaded is None:
+                # A concurrent answer won the tournament, or it expired
+                raise HTTPException(status_code=409, detail="This tournament game has already finished")
+            game_session, session_data, fresh_state = loaded
+            result = replay_character_turn(fresh_state, result)
+
+
+@router.post("/{tournament_id}/submit-answer")
+async def submit_tournament_answer(
+    tournament_id: str,
+    answer: dict,
+    user: CurrentUser = Depends(get_current_identity)
+):
+    """Submit answer for tournament game"""
+    try:
+        # Database work runs off the event loop, and no connection is held while the LLM answers
+        loaded = await asyncio.to_thread(_load_tournament_turn, tournament_id, user.id, answer.get("message", ""))
+        if loaded is None:
+            raise HTTPException(status_code=404, detail="No active game session found")
+        game_session, session_data, game_state = loaded
+
+        # Process through the AI workflow (same as main game)
+        result = await tournament_game_app.ainvoke(game_state)
+
+        answered = await asyncio.to_thread(
+            _save_tournament_answer_with_retry, tournament_id, user.id, game_session, session_data, result, answer
+        )
+        status, ai_result, current_stage = answered["status"], answered["result"], answered["current_stage"]
+        progress = answered["progress"]
+
         # Broadcast detailed progress update for opponent notifications
         try:
-            if status == "tournament_won":
+            if progress is None:
+                # Nothing was saved for this answer
+                pass
+            elif status == "tournament_won":
                 # Tournament ended - broadcast winner announcement to all players
-                broadcast_data = {
+                await manager.broadcast_to_tournament(tournament_id, {
                     "type": "tournament_ended",
-                    "winner": current_user,
+                    "winner": user.username,
                     "stage": current_stage,
                     "final_score": ai_result.get("total_score", 0),
-                    "message": f"🏆 Tournament Winner: {current_user}!"
-                }
+                    "message": f"🏆 Tournament Winner: {user.username}!"
+                })
+                scheduler.schedule_close(tournament_id)
             else:
                 # Regular progress update
                 broadcast_data = {
-                    "type": "progress_update", 
-                    "username": current_user,
+                    "type": "progress_update",
+                    "username": user.username,
                     "stage": current_stage,
                     "status": status,
-                    "keys_found": len(current_stage_keys),
-                    "total_keys": len(current_stage_config.get("keys", [])),
+                    "keys_found": progress["keys_found"],
+                    "total_keys": progress["total_keys"],
                     "score": ai_result.get("total_score", 0)
                 }
-                
+
                 # Add specific notifications for key extraction (only for NEW keys found this turn)
-                if len(new_keys_this_turn) > 0:
-                    total_keys_found = len(current_stage_keys)
-                    broadcast_data["notification"] = f"{current_user} unlocked Key {total_keys_found}!"
-                    
+                if progress["new_keys"] > 0:
+                    total_keys_found = progress["keys_found"]
+                    broadcast_data["notification"] = f"{user.username} unlocked Key {total_keys_found}!"
+
                     # Check if opponent is close to completing the stage
-                    total_stage_keys = len(current_stage_config.get("keys", []))
-                    if total_keys_found == total_stage_keys - 1:
-                        broadcast_data["warning"] = f"{current_user} is close to winning the tournament!"
-            
-            await manager.broadcast_to_tournament(tournament_id, broadcast_data)
+                    if total_keys_found == progress["total_keys"] - 1:
+                        broadcast_data["warning"] = f"{user.username} is close to winning the tournament!"
+
+                await manager.broadcast_to_tournament(tournament_id, broadcast_data)
         except Exception as e:
             print(f"Error in broadcast: {e}")
             # Continue without broadcasting
-        
+
         return {
             "status": status,
             "result": ai_result,
             "current_stage": current_stage
         }
-    
+
+    except HTTPException:
+        raise
+    except StaleSessionError:
+        raise HTTPException(status_code=409, detail="Your game session was changed by another request, please retry")
     except Exception as e:
-        conn.rollback()
         print(f"Tournament submit-answer error: {e}")
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        conn.close()
 
 
 @router.get("/{tournament_id}/results")
@@ -875,19 +892,40 @@ async def get_tournament_results(tournament_id: str):
         conn.close()
 
 
+@router.get("/{tournament_id}/events")
+async def get_tournament_events(tournament_id: str, since: int = 0, limit: int = 100):
+    """Broadcast messages after sequence number `since`, oldest first (each carries its `seq`)"""
+    if limit < 1 or limit > 500:
+        raise HTTPException(status_code=400, detail="limit must be between 1 and 500")
+
+    events = await asyncio.to_thread(load_tournament_events, tournament_id, since, None, limit)
+    return {
+        "tournament_id": tournament_id,
+        "events": [json.loads(text) for _, text in events],
+        "last_seq": events[-1][0] if events else since
+    }
+
+
 @router.websocket("/{tournament_id}/ws")
-async def tournament_websocket(websocket: WebSocket, tournament_id: str):
-    """WebSocket endpoint for real-time tournament updates"""
-    await manager.connect(websocket, tournament_id)
+async def tournament_websocket(websocket: WebSocket, tournament_id: str, since: Optional[int] = None):
+    """WebSocket endpoint for real-time tournament updates.
+
+    Every broadcast carries a per-tournament `seq`. A client reconnecting with
+    `?since=<last seq seen>` first receives the messages it missed.
+    """
+    await manager.connect(websocket, tournament_id, since)
     try:
         while True:
             # Keep connection alive and handle incoming messages
             data = await websocket.receive_text()
+            manager.touch(websocket, tournament_id)
             message = json.loads(data)
             
-            # Handle different message types
+            # Handle different message types ("pong" answers a heartbeat; touch() above is all it needs)
             if message.get("type") == "ping":
-                await websocket.send_text(json.dumps({"type": "pong"}))
+                await manager.send_personal(websocket, tournament_id, {"type": "pong"})
             
     except WebSocketDisconnect:
+        pass
+    finally:
         manager.disconnect(websocket, tournament_id)
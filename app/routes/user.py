@@ -3,8 +3,9 @@ import json
 
 from app.models.schemas import UserProfile, LeaderboardEntry
 from app.database.connection import get_db
-from app.auth.auth import get_current_user
+from app.auth.auth import CurrentUser, get_current_user, get_current_identity
 from app.game.stages import STAGES
+from app.game.session_store import session_store
 
 router = APIRouter(prefix="/user", tags=["user"])
 
@@ -38,25 +39,20 @@ async def get_profile(current_user: str = Depends(get_current_user)):
 
 
 @router.get("/games")
-async def get_user_games(current_user: str = Depends(get_current_user)):
+async def get_user_games(user: CurrentUser = Depends(get_current_identity)):
     """Get user's game history"""
+    session_store.flush_user(user.id)
     conn = get_db()
     cursor = conn.cursor()
     
     try:
-        # Get user ID
-        cursor.execute("SELECT id FROM users WHERE username = ?", (current_user,))
-        user = cursor.fetchone()
-        if not user:
-            raise HTTPException(status_code=404, detail="User not found")
-        
         cursor.execute("""
             SELECT id, stage, score, attempts, game_over, success, created_at, updated_at
             FROM game_sessions 
             WHERE user_id = ?
             ORDER BY updated_at DESC
             LIMIT 20
-        """, (user["id"],))
+        """, (user.id,))
         
         sessions = cursor.fetchall()
         
@@ -0,0 +1,154 @@
+"""
+Small in-process caches shared across the application.
+"""
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+class LRUCache:
+    """Thread-safe LRU cache with an optional per-entry time-to-live.
+
+    Entries past their TTL are treated as missing and dropped on access. When the
+    cache is full the least recently used entry is evicted.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                return default
+
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key: Hashable):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class StaleWhileRevalidateCache:
+    """Async cache that keeps serving the previous value while one task reloads it.
+
+    A value younger than `ttl` is served as is. An older one, or one marked stale
+    by invalidate(), is still served while a single background task reloads it.
+    Callers only wait when nothing usable is cached (no value yet, or one older
+    than `max_stale`), and then they all wait on the same load. Loaders are plain
+    functions run in a worker thread.
+    """
+
+    def __init__(self, ttl: float, max_stale: float, maxsize: int = 64):
+        self.ttl = ttl
+        self.max_stale = max(max_stale, ttl)
+        self.maxsize = maxsize
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._loads: Dict[Hashable, asyncio.Task] = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+
+        # Metrics
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.loads = 0
+        self.load_failures = 0
+
+    async def get(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                self._data.move_to_end(key)
+        now = time.monotonic()
+
+        if entry is not None:
+            value, loaded_at = entry
+            if now - loaded_at < self.ttl:
+                self.hits += 1
+                return value
+            if now - loaded_at < self.max_stale:
+                self.stale_hits += 1
+                self._load(key, loader)
+                return value
+
+        self.misses += 1
+        # Shielded so a caller that goes away does not cancel the load the others wait on
+        return await asyncio.shield(self._load(key, loader))
+
+    def _load(self, key: Hashable, loader: Callable[[], Any]) -> asyncio.Task:
+        task = self._loads.get(key)
+        if task is None:
+            task = asyncio.create_task(self._reload(key, loader))
+            task.add_done_callback(lambda done: done.cancelled() or done.exception())
+            self._loads[key] = task
+        return task
+
+    async def _reload(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        generation = self._generation
+        self.loads += 1
+        try:
+            value = await asyncio.to_thread(loader)
+        except Exception as e:
+            self.load_failures += 1
+            print(f"Cache reload of {key!r} failed: {e}")
+            raise
+        finally:
+            self._loads.pop(key, None)
+
+        loaded_at = time.monotonic()
+        with self._lock:
+            if generation != self._generation:
+                # Invalidated while loading: the value may predate the change, so keep it stale
+                loaded_at -= self.ttl
+            self._data[key] = (value, loaded_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+        return value
+
+    def invalidate(self):
+        """Mark every entry stale; the next reads serve it once more and trigger a reload"""
+        with self._lock:
+            self._generation += 1
+            stale_at = time.monotonic() - self.ttl
+            for key, (value, loaded_at) in self._data.items():
+                self._data[key] = (value, min(loaded_at, stale_at))
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._data),
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "loads": self.loads,
+            "load_failures": self.load_failures,
+        }
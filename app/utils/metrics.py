@@ -0,0 +1,270 @@
+"""
+In-process metrics in the Prometheus text format.
+
+Counters, gauges and histograms are registered on a module-level registry and
+rendered by GET /metrics. Each worker keeps its own values, so Prometheus
+should scrape every worker (or sum across them). Gauges can take a callback
+that is evaluated at scrape time, for values that are cheaper to read on
+demand than to keep up to date.
+
+log_sampled() replaces the old DEBUG prints: it writes one JSON line per event,
+but only for a LOG_SAMPLE_RATE fraction of calls, so the hot path stays quiet.
+"""
+import json
+import random
+import re
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from app.config.settings import LOG_SAMPLE_RATE
+
+# Seconds; covers a sub-millisecond query up to a slow LLM completion
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)) + "}"
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, object]) -> LabelValues:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self) -> Iterable[Tuple[str, Sequence[str], Sequence[str], float]]:
+        """(name suffix, label names, label values, value) for every series"""
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, names, values, value in self.samples():
+            lines.append(f"{self.name}{suffix}{_format_labels(names, values)} {_format_value(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    """Monotonically increasing count"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [("_total", self.labelnames, key, value) for key, value in sorted(items)]
+
+
+class Gauge(_Metric):
+    """Value that goes up and down; `collect` makes it computed at scrape time instead"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 collect: Optional[Callable[[], Dict[LabelValues, float]]] = None):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        self._collect = collect
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def samples(self):
+        if self._collect is not None:
+            try:
+                items = list(self._collect().items())
+            except Exception as e:
+                print(f"Metric {self.name} could not be collected: {e}")
+                items = []
+        else:
+            with self._lock:
+                items = list(self._values.items())
+        return [("", self.labelnames, key, value) for key, value in sorted(items)]
+
+
+class Histogram(_Metric):
+    """Distribution of observations over fixed buckets, plus their sum and count"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per series: [count in each bucket (non-cumulative) + overflow, sum]
+        self._series: Dict[LabelValues, list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the `with` block"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels) -> int:
+        series = self._series.get(self._key(labels))
+        return sum(series[0]) if series else 0
+
+    def samples(self):
+        with self._lock:
+            items = [(key, list(counts), total) for key, (counts, total) in self._series.items()]
+
+        bucket_names = self.labelnames + ("le",)
+        samples = []
+        for key, counts, total in sorted(items):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                samples.append(("_bucket", bucket_names, key + (_format_value(bound),), cumulative))
+            samples.append(("_sum", self.labelnames, key, total))
+            samples.append(("_count", self.labelnames, key, cumulative))
+        return samples
+
+
+class MetricsRegistry:
+    """Named collection of metrics rendered together"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = (), collect=None) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames, collect))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format (version 0.0.4)"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+GAME_NODE_SECONDS = registry.histogram(
+    "game_node_duration_seconds", "Time spent in each game workflow node", ["node"]
+)
+LLM_REQUEST_SECONDS = registry.histogram(
+    "llm_request_duration_seconds", "LLM round trip, from acquiring a slot to the last token", ["mode", "outcome"]
+)
+DB_QUERY_SECONDS = registry.histogram(
+    "db_query_duration_seconds", "Database statement execution time by statement and table", ["query"]
+)
+BROADCAST_FANOUT_SECONDS = registry.histogram(
+    "tournament_broadcast_fanout_seconds", "Time from queueing a tournament frame to writing it to a socket"
+)
+KEYS_EXTRACTED = registry.counter(
+    "game_keys_extracted", "Stage keys newly extracted by players", ["stage"]
+)
+PROMPT_REFUSALS = registry.counter(
+    "game_prompt_refusals", "Turns refused before reaching the LLM", ["stage", "reason"]
+)
+
+_VERB = re.compile(r"^\s*(\w+)")
+_TABLE = re.compile(r"\b(?:FROM|INTO|UPDATE|TABLE(?:\s+IF\s+NOT\s+EXISTS)?|ON)\s+(\w+)", re.IGNORECASE)
+
+
+@lru_cache(maxsize=1024)
+def query_label(query: str) -> str:
+    """Low-cardinality label for a SQL statement: its verb and first table, e.g. 'select game_sessions'"""
+    verb = _VERB.match(query)
+    table = _TABLE.search(query)
+    parts = [verb.group(1).lower() if verb else "unknown"]
+    if table:
+        parts.append(table.group(1).lower())
+    return " ".join(parts)
+
+
+def observe_query(query: str, started: float):
+    """Record a statement that began at perf_counter() value `started`"""
+    DB_QUERY_SECONDS.observe(time.perf_counter() - started, query=query_label(query))
+
+
+def log_sampled(event: str, sample_rate: Optional[float] = None, **fields):
+    """Write a structured log line for a sample of calls (LOG_SAMPLE_RATE by default)"""
+    rate = LOG_SAMPLE_RATE if sample_rate is None else sample_rate
+    if rate < 1 and random.random() >= rate:
+        return
+    print(json.dumps({"ts": round(time.time(), 3), "event": event, **fields}, default=str))
+
+
+def render_metrics() -> str:
+    """The registry in the Prometheus text format"""
+    return registry.render()
@@ -0,0 +1,95 @@
+"""
+Token-bucket stores for admission control.
+
+A bucket holds up to `burst` tokens and refills at `rate` tokens per second;
+each admitted request takes one. MemoryBucketStore keeps buckets in the worker
+process. DatabaseBucketStore keeps them in the rate_limit_buckets table so
+every worker sharing the database enforces one limit; the refill, the check and
+the decrement happen in a single upsert, so concurrent workers cannot both
+spend the last token.
+"""
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Tuple
+
+from app.database.connection import db_connection
+
+
+def _retry_after(tokens: float, rate: float) -> float:
+    """Seconds until a bucket holding `tokens` has a whole token again"""
+    if rate <= 0:
+        return math.inf
+    return max(0.0, (1 - tokens) / rate)
+
+
+class MemoryBucketStore:
+    """In-process token buckets; the least recently used are dropped beyond `max_buckets`"""
+
+    def __init__(self, max_buckets: int = 100000):
+        self.max_buckets = max_buckets
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key: str, rate: float, burst: float) -> Tuple[bool, float]:
+        """Take a token; returns (admitted, seconds to wait before retrying)"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+
+            admitted = tokens >= 1
+            if admitted:
+                tokens -= 1
+
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_buckets:
+                # A forgotten bucket comes back full, which only ever errs on the side of admitting
+                self._buckets.popitem(last=False)
+
+        return admitted, 0.0 if admitted else _retry_after(tokens, rate)
+
+
+class DatabaseBucketStore:
+    """Token buckets shared by all workers through the rate_limit_buckets table"""
+
+    # `refill` is the bucket level after topping it up for the time since the last request
+    _TAKE_SQL = """
+        INSERT INTO rate_limit_buckets (bucket_key, tokens, updated_at, admitted)
+        VALUES (?, ?, ?, 1)
+        ON CONFLICT (bucket_key) DO UPDATE SET
+            tokens = CASE WHEN {refill} >= 1 THEN {refill} - 1 ELSE {refill} END,
+            admitted = CASE WHEN {refill} >= 1 THEN 1 ELSE 0 END,
+            updated_at = excluded.updated_at
+        RETURNING tokens, admitted
+    """.format(refill="""
+        (CASE WHEN rate_limit_buckets.tokens + (excluded.updated_at - rate_limit_buckets.updated_at) * ? > ?
+              THEN ?
+              ELSE rate_limit_buckets.tokens + (excluded.updated_at - rate_limit_buckets.updated_at) * ? END)
+    """)
+
+    def __init__(self, prune_every: int = 1000, idle_seconds: float = 3600):
+        self.prune_every = prune_every
+        self.idle_seconds = idle_seconds
+        self._calls = 0
+
+    def take(self, key: str, rate: float, burst: float) -> Tuple[bool, float]:
+        """Take a token; returns (admitted, seconds to wait before retrying)"""
+        now = time.time()
+        refill_params = (rate, burst, burst, rate)
+        params = (key, burst - 1, now) + refill_params * 4
+
+        self._calls += 1
+        with db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(self._TAKE_SQL, params)
+            row = cursor.fetchone()
+            if self._calls % self.prune_every == 0:
+                # Buckets idle this long have refilled completely, so dropping them changes nothing
+                cursor.execute("DELETE FROM rate_limit_buckets WHERE updated_at < ?", (now - self.idle_seconds,))
+            conn.commit()
+
+        admitted = bool(row["admitted"])
+        return admitted, 0.0 if admitted else _retry_after(row["tokens"], rate)
@@ -0,0 +1,209 @@
+"""
+End-to-end load generator for the game API.
+
+Each virtual player registers, starts a game and sends a number of messages;
+players are then paired up for a tournament (create, join, ready, start,
+submit answers until someone wins). Requests from all players share one pacer,
+so the server sees at most the target request rate, and latencies are reported
+per endpoint as p50/p95/p99.
+
+Run the server against the offline LLM stand-in so results do not depend on
+the OpenAI API:
+
+    LLM_BACKEND=stub STUB_LLM_LATENCY=lognormal:600:0.5 uvicorn main:app --port 8000
+    python benchmarks/load_test.py --users 50 --messages 10 --rps 40
+
+All players come from one address, so either raise the per-IP limits or start
+the server with RATE_LIMIT_ENABLED=false to measure the game rather than the
+admission control (429s count as errors for their endpoint).
+
+Usage:
+    python benchmarks/load_test.py [--base-url URL] [--users N] [--messages N]
+                                   [--rps R] [--tournament-answers N] [--timeout S]
+"""
+import argparse
+import asyncio
+import math
+import os
+import sys
+import time
+import uuid
+from collections import defaultdict
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.game.stages import STAGES
+
+
+class Pacer:
+    """Hands out request start times spaced 1/rps apart across all players"""
+
+    def __init__(self, rps: float):
+        self.interval = 1.0 / rps if rps > 0 else 0.0
+        self._next = time.perf_counter()
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        if not self.interval:
+            return
+        async with self._lock:
+            now = time.perf_counter()
+            start = max(self._next, now)
+            self._next = start + self.interval
+        await asyncio.sleep(start - now)
+
+
+class Recorder:
+    """Collects latencies and failures per endpoint"""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def record(self, endpoint: str, seconds: float, ok: bool):
+        self.latencies[endpoint].append(seconds)
+        if not ok:
+            self.errors[endpoint] += 1
+
+
+def percentile(sorted_values: list, pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+class Player:
+    def __init__(self, client: httpx.AsyncClient, pacer: Pacer, recorder: Recorder, username: str):
+        self.client = client
+        self.pacer = pacer
+        self.recorder = recorder
+        self.username = username
+        self.headers = {}
+
+    async def request(self, endpoint: str, method: str, url: str, **kwargs):
+        """Send one paced request, recording its latency under the endpoint label"""
+        await self.pacer.wait()
+        started = time.perf_counter()
+        try:
+            response = await self.client.request(method, url, headers=self.headers, **kwargs)
+        except httpx.HTTPError:
+            self.recorder.record(endpoint, time.perf_counter() - started, False)
+            return None
+        self.recorder.record(endpoint, time.perf_counter() - started, response.status_code < 400)
+        return response
+
+    async def play(self, messages: int) -> bool:
+        """Register, start a game and chat with the stage characters"""
+        response = await self.request("POST /auth/register", "POST", "/auth/register", json={
+            "username": self.username, "email": f"{self.username}@load.test", "password": "load-test"
+        })
+        if response is None or response.status_code != 200:
+            return False
+        self.headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+        response = await self.request("POST /game/start", "POST", "/game/start")
+        if response is None or response.status_code != 200:
+            return False
+        session_id = response.json()["session_id"]
+        stage = response.json().get("stage", 1)
+
+        for i in range(messages):
+            hints = STAGES.get(stage, STAGES[1])["hints"]
+            text = f"{hints[i % len(hints)]} (ticket {self.username}-{i})"
+            response = await self.request(
+                "POST /game/{id}/message", "POST", f"/game/{session_id}/message", json={"message": text}
+            )
+            if response is None or response.status_code != 200:
+                continue
+            if response.json().get("game_over"):
+                break
+            stage = response.json().get("stage", stage)
+        return True
+
+
+async def play_tournament(host: Player, guest: Player, answers: int):
+    """Run one two-player tournament to completion or until answers run out"""
+    response = await host.request("POST /tournament/create", "POST", "/tournament/create", json={"stage": 1})
+    if response is None or response.status_code != 200:
+        return
+    tournament_id = response.json()["tournament_id"]
+
+    response = await guest.request(
+        "POST /tournament/join", "POST", "/tournament/join", json={"room_code": response.json()["room_code"]}
+    )
+    if response is None or response.status_code != 200:
+        return
+
+    for player in (host, guest):
+        await player.request(
+            "POST /tournament/{id}/ready", "POST", f"/tournament/{tournament_id}/ready", params={"ready": "true"}
+        )
+    response = await host.request("POST /tournament/{id}/start", "POST", f"/tournament/{tournament_id}/start")
+    if response is None or response.status_code != 200:
+        return
+
+    hints = STAGES[1]["hints"]
+    for i in range(answers):
+        for player in (host, guest):
+            response = await player.request(
+                "POST /tournament/{id}/submit-answer", "POST", f"/tournament/{tournament_id}/submit-answer",
+                json={"message": f"{hints[i % len(hints)]} (ticket {player.username}-t{i})"}
+            )
+            if response is None or response.status_code != 200 or response.json().get("status") != "continue":
+                return
+
+
+async def run(args) -> Recorder:
+    pacer = Pacer(args.rps)
+    recorder = Recorder()
+    run_id = uuid.uuid4().hex[:6]
+    limits = httpx.Limits(max_connections=args.users * 2, max_keepalive_connections=args.users * 2)
+
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout, limits=limits) as client:
+        players = [Player(client, pacer, recorder, f"load_{run_id}_{i}") for i in range(args.users)]
+        registered = await asyncio.gather(*(player.play(args.messages) for player in players))
+
+        ready = [player for player, ok in zip(players, registered) if ok]
+        if args.tournament_answers > 0:
+            await asyncio.gather(*(
+                play_tournament(ready[i], ready[i + 1], args.tournament_answers)
+                for i in range(0, len(ready) - 1, 2)
+            ))
+
+    return recorder
+
+
+def report(recorder: Recorder, elapsed: float):
+    total = sum(len(values) for values in recorder.latencies.values())
+    print(f"{total} requests in {elapsed:.1f}s ({total / elapsed:.1f} req/s achieved)\n")
+    print(f"{'endpoint':<40} {'count':>6} {'errors':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for endpoint in sorted(recorder.latencies):
+        values = sorted(recorder.latencies[endpoint])
+        print(
+            f"{endpoint:<40} {len(values):>6} {recorder.errors[endpoint]:>6} "
+            f"{percentile(values, 50) * 1000:>8.1f} {percentile(values, 95) * 1000:>8.1f} "
+            f"{percentile(values, 99) * 1000:>8.1f} {values[-1] * 1000:>8.1f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the game API")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--users", type=int, default=20, help="virtual players")
+    parser.add_argument("--messages", type=int, default=10, help="game messages per player")
+    parser.add_argument("--rps", type=float, default=20.0, help="target request rate across all players (0 = unpaced)")
+    parser.add_argument("--tournament-answers", type=int, default=5, help="answers per player per tournament (0 = skip)")
+    parser.add_argument("--timeout", type=float, default=60.0, help="per-request timeout in seconds")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    recorder = asyncio.run(run(args))
+    report(recorder, time.perf_counter() - started)
+
+
+if __name__ == "__main__":
+    main()
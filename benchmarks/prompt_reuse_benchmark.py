@@ -0,0 +1,97 @@
+"""
+Compare the LSH prompt index against the original linear SequenceMatcher scan.
+
+Builds a corpus of past successful prompts from the stage hints plus random
+edits (typos, dropped words, appended phrases), then checks a set of probe
+prompts against it both ways and reports how often the verdicts agree and how
+long each approach takes.
+
+Usage:
+    python benchmarks/prompt_reuse_benchmark.py [history_size] [probes]
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.game.stages import STAGES
+from app.game.security import normalize_prompt, calculate_prompt_similarity
+from app.game.similarity import PromptIndex
+
+THRESHOLD = 0.85
+FILLERS = [
+    "please", "thanks so much", "it is really urgent", "my boss is waiting",
+    "I am the new admin", "this is for the audit", "sorry to bother you", "quick question",
+]
+
+
+def mutate(prompt: str, rng: random.Random) -> str:
+    words = prompt.split()
+    edit = rng.random()
+    if edit < 0.3 and len(words) > 3:
+        del words[rng.randrange(len(words))]
+    elif edit < 0.6:
+        words.insert(rng.randrange(len(words) + 1), rng.choice(FILLERS))
+    elif edit < 0.8:
+        i = rng.randrange(len(words))
+        word = words[i]
+        if len(word) > 2:
+            j = rng.randrange(len(word) - 1)
+            words[i] = word[:j] + word[j + 1] + word[j] + word[j + 2:]
+    else:
+        words = [rng.choice(FILLERS)] + words[::-1]
+    return " ".join(words)
+
+
+def build_corpus(size: int, rng: random.Random) -> list:
+    seeds = [hint for stage in STAGES.values() for hint in stage["hints"]]
+    corpus = []
+    while len(corpus) < size:
+        prompt = rng.choice(seeds)
+        for _ in range(rng.randint(0, 4)):
+            prompt = mutate(prompt, rng)
+        corpus.append(prompt)
+    return corpus
+
+
+def linear_verdict(prompt: str, history: list) -> bool:
+    return any(calculate_prompt_similarity(prompt, past) >= THRESHOLD for past in history)
+
+
+def main():
+    history_size = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    probe_count = int(sys.argv[2]) if len(sys.argv) > 2 else 300
+    rng = random.Random(7)
+
+    history = build_corpus(history_size, rng)
+    probes = [mutate(rng.choice(history), rng) for _ in range(probe_count // 2)]
+    probes += build_corpus(probe_count - len(probes), rng)
+
+    start = time.perf_counter()
+    index = PromptIndex()
+    for prompt in history:
+        index.add(normalize_prompt(prompt))
+    build_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    linear = [linear_verdict(prompt, history) for prompt in probes]
+    linear_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    indexed = [index.find_similar(normalize_prompt(prompt), THRESHOLD) is not None for prompt in probes]
+    indexed_time = time.perf_counter() - start
+
+    agree = sum(1 for a, b in zip(linear, indexed) if a == b)
+    missed = sum(1 for a, b in zip(linear, indexed) if a and not b)
+    extra = sum(1 for a, b in zip(linear, indexed) if b and not a)
+
+    print(f"history={history_size} probes={probe_count} reused={sum(linear)}")
+    print(f"verdict agreement: {agree}/{probe_count} (missed={missed}, extra={extra})")
+    print(f"linear scan: {linear_time * 1000 / probe_count:.3f} ms/probe")
+    print(f"lsh index:   {indexed_time * 1000 / probe_count:.3f} ms/probe (build {build_time * 1000:.1f} ms)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Measure tournament broadcast cost with many spectators and one slow client.
+
+Spectators are in-memory sockets whose send_text takes a fixed delay; one of
+them is much slower than the rest. The original manager awaited every socket
+in turn and serialized the message for each, so a broadcast took as long as
+all the sends together and the slow client held up everyone behind it. The
+queued manager serializes once and only appends to per-connection queues.
+
+For each room size the benchmark reports how long the broadcast call takes
+and how long it takes until every fast spectator has the message.
+
+Usage:
+    python benchmarks/ws_fanout_benchmark.py [spectators ...]
+"""
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.realtime.connections import TournamentConnectionManager
+
+FAST_SEND = 0.0002
+SLOW_SEND = 0.25
+BROADCASTS = 20
+
+
+class FakeWebSocket:
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.received = 0
+        self.delivered = asyncio.Event()
+
+    async def accept(self):
+        pass
+
+    async def close(self, code: int = 1000):
+        pass
+
+    async def send_text(self, text: str):
+        await asyncio.sleep(self.delay)
+        self.received += 1
+        self.delivered.set()
+
+
+class SequentialManager:
+    """The original fan-out: one awaited send per socket, json.dumps per socket"""
+
+    def __init__(self):
+        self.active_connections = {}
+
+    async def connect(self, websocket, tournament_id: str):
+        await websocket.accept()
+        self.active_connections.setdefault(tournament_id, []).append(websocket)
+
+    async def broadcast_to_tournament(self, tournament_id: str, message: dict):
+        for connection in self.active_connections.get(tournament_id, []):
+            await connection.send_text(json.dumps(message))
+
+
+def progress(i: int) -> dict:
+    return {"type": "progress_update", "username": "player", "stage": 3, "status": "continue",
+            "keys_found": i % 3, "total_keys": 3, "score": 100 + i, "notification": f"player unlocked Key {i}!"}
+
+
+async def run(manager, spectators: int):
+    sockets = [FakeWebSocket(SLOW_SEND)] + [FakeWebSocket(FAST_SEND) for _ in range(spectators - 1)]
+    for websocket in sockets:
+        await manager.connect(websocket, "t1")
+
+    call_times, delivery_times = [], []
+    for i in range(BROADCASTS):
+        for websocket in sockets:
+            websocket.delivered.clear()
+        started = time.perf_counter()
+        await manager.broadcast_to_tournament("t1", progress(i))
+        call_times.append(time.perf_counter() - started)
+        await asyncio.gather(*(websocket.delivered.wait() for websocket in sockets[1:]))
+        delivery_times.append(time.perf_counter() - started)
+
+    if isinstance(manager, TournamentConnectionManager):
+        stats = manager.stats()
+        await manager.close()
+        return call_times, delivery_times, stats
+    return call_times, delivery_times, None
+
+
+def ms(values) -> str:
+    return f"{sum(values) / len(values) * 1000:8.2f} ms"
+
+
+async def main(sizes):
+    print(f"{BROADCASTS} broadcasts, fast send {FAST_SEND * 1000:.1f} ms, one spectator at {SLOW_SEND * 1000:.0f} ms")
+    print(f"{'spectators':>10} {'manager':>10} {'broadcast call':>16} {'all fast delivered':>20}")
+    for size in sizes:
+        for label, manager in (("sequential", SequentialManager()),
+                               ("queued", TournamentConnectionManager(heartbeat_interval=3600))):
+            call_times, delivery_times, stats = await run(manager, size)
+            print(f"{size:>10} {label:>10} {ms(call_times):>16} {ms(delivery_times):>20}")
+        print(f"{'':>10} queued stats: dropped {stats['frames_dropped_total']}, "
+              f"fan-out p50 {stats['fanout_latency_p50_seconds'] * 1000:.2f} ms, "
+              f"p99 {stats['fanout_latency_p99_seconds'] * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10, 100, 500]
+    asyncio.run(main(sizes))
@@ -10,8 +10,14 @@ sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 # Import your route modules
 from app.routes import auth, game, tournament, user, stats
-from app.database.connection import init_db
-from app.config.settings import API_TITLE, API_DESCRIPTION, API_VERSION
+from app.database.connection import init_db, close_db_pool
+from app.database.write_behind import start_write_behind, stop_write_behind, write_behind_stats
+from app.game.llm import aclose_llm
+from app.game.leaderboard import public_stats_cache
+from app.game.completion_cache import completion_cache_stats
+from app.game.session_store import start_session_store, stop_session_store, session_store_stats
+from app.middleware.admission import AdmissionControlMiddleware
+from app.config.settings import API_TITLE, API_DESCRIPTION, API_VERSION, RATE_LIMIT_ENABLED
 
 # Create FastAPI app instance
 app = FastAPI(
@@ -20,6 +26,10 @@ app = FastAPI(
     version=API_VERSION
 )
 
+# Token-bucket admission control; added before CORS so 429 responses still carry CORS headers
+if RATE_LIMIT_ENABLED:
+    app.add_middleware(AdmissionControlMiddleware)
+
 # Configure CORS for frontend integration
 app.add_middleware(
     CORSMiddleware,
@@ -33,7 +43,16 @@ app.add_middleware(
 @app.get("/health")
 async def health_check():
     """Health check endpoint for load balancers and monitoring"""
-    return {"status": "healthy", "service": "ai-escape-room-api"}
+    return {
+        "status": "healthy",
+        "service": "ai-escape-room-api",
+        "write_queue": write_behind_stats(),
+        "tournament_websockets": tournament.manager.stats(),
+        "tournament_scheduler": tournament.scheduler.stats(),
+        "public_stats_cache": public_stats_cache.stats(),
+        "completion_cache": completion_cache_stats(),
+        "session_store": session_store_stats()
+    }
 
 # Include API routers
 app.include_router(auth.router)
@@ -139,6 +158,10 @@ async def health_check():
 async def startup_event():
     """Initialize database on startup"""
     init_db()
+    start_write_behind()
+    start_session_store()
+    await tournament.manager.start()
+    await tournament.scheduler.start()
     print("🚀 AI Escape Room Game API is starting up...")
     print("📊 Database initialized")
     print("🌐 Server is ready to accept connections")
@@ -147,6 +170,12 @@ async def startup_event():
 async def shutdown_event():
     """Cleanup on shutdown"""
     print("🛑 AI Escape Room Game API is shutting down...")
+    await aclose_llm()
+    await tournament.scheduler.stop()
+    await tournament.manager.close()
+    stop_session_store()
+    stop_write_behind()
+    close_db_pool()
 
 if __name__ == "__main__":
     import uvicorn
@@ -53,21 +53,44 @@ def migrate_data():
 
         # Migrate game_sessions table
         print("🎮 Migrating game sessions...")
-        sqlite_cursor.execute("SELECT * FROM game_sessions")
+        sqlite_cursor.execute("""
+            SELECT id, user_id, stage, score, attempts, extracted_keys,
+                   character_mood, resistance_level, failed_attempts, game_over, success,
+                   new_stage_start, created_at, updated_at
+            FROM game_sessions
+        """)
         sessions = sqlite_cursor.fetchall()
 
         for session in sessions:
             postgres_cursor.execute("""
                 INSERT INTO game_sessions
-                (id, user_id, stage, score, attempts, extracted_keys, conversation_history,
+                (id, user_id, stage, score, attempts, extracted_keys,
                  character_mood, resistance_level, failed_attempts, game_over, success,
                  new_stage_start, created_at, updated_at)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
                 ON CONFLICT (id) DO NOTHING
             """, tuple(session))
 
         print(f"✅ Migrated {len(sessions)} game sessions")
 
+        # Migrate conversation_turns table
+        print("💬 Migrating conversation turns...")
+        sqlite_cursor.execute("""
+            SELECT session_id, seq, stage, user_message, assistant_message, created_at
+            FROM conversation_turns
+        """)
+        turns = sqlite_cursor.fetchall()
+
+        for turn in turns:
+            postgres_cursor.execute("""
+                INSERT INTO conversation_turns
+                (session_id, seq, stage, user_message, assistant_message, created_at)
+                VALUES (%s, %s, %s, %s, %s, %s)
+                ON CONFLICT (session_id, seq) DO NOTHING
+            """, tuple(turn))
+
+        print(f"✅ Migrated {len(turns)} conversation turns")
+
         # Migrate prompt_exploitation_history table
         print("🛡️ Migrating security logs...")
         sqlite_cursor.execute("SELECT * FROM prompt_exploitation_history")
@@ -107,6 +130,7 @@ def migrate_data():
         print(f"📊 Summary:")
         print(f"   - Users: {len(users)}")
         print(f"   - Game Sessions: {len(sessions)}")
+        print(f"   - Conversation Turns: {len(turns)}")
         print(f"   - Security Logs: {len(exploits)}")
         print(f"   - Game Results: {len(results)}")
 
@@ -0,0 +1,166 @@
+"""
+Route parity between the SQLite and PostgreSQL backends.
+
+The same scenario drives every HTTP route once per backend, each in its own
+interpreter so no process-level cache leaks from one backend into the other,
+and the normalized responses must match. The PostgreSQL half needs a server:
+point DATABASE_URL at a scratch database to run it, otherwise the test is skipped.
+
+Run as a script, this module plays the scenario against the backend selected by
+USE_POSTGRESQL and prints the responses as JSON.
+"""
+import json
+import os
+import re
+import subprocess
+import sys
+import uuid
+
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Values that legitimately differ between runs: ids, tokens, room codes, clock readings
+# and the character mood, which get_character_mood() picks at random
+_VOLATILE_KEYS = {
+    "access_token", "session_id", "tournament_id", "room_code", "participant_id", "user_id", "id",
+    "host_user_id", "winner_user_id", "character_mood",
+    "time_taken", "completion_time", "time_remaining", "elapsed_time", "seq", "last_seq",
+}
+_TIMESTAMP_RE = re.compile(r"^\d{4}-\d{2}-\d{2}[ T]\d{2}:\d{2}:\d{2}")
+
+
+def normalize(value):
+    """Blank out run-specific values so responses from the two backends can be compared"""
+    if isinstance(value, dict):
+        return {
+            key: "<volatile>" if key in _VOLATILE_KEYS else normalize(item)
+            for key, item in value.items()
+        }
+    if isinstance(value, list):
+        return [normalize(item) for item in value]
+    if isinstance(value, bool):
+        # psycopg2 returns BOOLEAN columns as bools where sqlite3 returns 0/1
+        return int(value)
+    if isinstance(value, str) and _TIMESTAMP_RE.match(value):
+        return "<timestamp>"
+    return value
+
+
+def run_scenario(suffix: str):
+    """Call every HTTP route once and return (route, status, body) for each call"""
+    import main
+    from fastapi.testclient import TestClient
+
+    calls = []
+    users = {f"alice{suffix}", f"bob{suffix}", f"guest{suffix}"}
+
+    def record(route, response, body=None):
+        if body is None:
+            body = response.json() if response.headers.get("content-type", "").startswith("application/json") else None
+        calls.append([route, response.status_code, normalize(body)])
+        return response
+
+    def ours(entries):
+        return [entry for entry in entries if entry.get("username") in users]
+
+    with TestClient(main.app) as client:
+        tokens = {}
+        for name in ("alice", "bob"):
+            response = record("POST /auth/register", client.post("/auth/register", json={
+                "username": f"{name}{suffix}", "email": f"{name}{suffix}@example.com", "password": "secret",
+            }))
+            tokens[name] = response.json()["access_token"]
+        alice = {"Authorization": f"Bearer {tokens['alice']}"}
+        bob = {"Authorization": f"Bearer {tokens['bob']}"}
+
+        record("POST /auth/register (duplicate)", client.post("/auth/register", json={
+            "username": f"alice{suffix}", "email": f"alice{suffix}@example.com", "password": "secret",
+        }))
+        record("POST /auth/login", client.post("/auth/login", json={"username": f"alice{suffix}", "password": "secret"}))
+        record("POST /auth/login (bad password)", client.post("/auth/login", json={"username": f"alice{suffix}", "password": "nope"}))
+        record("GET /auth/verify", client.get("/auth/verify", headers=alice))
+
+        session_id = record("POST /game/start", client.post("/game/start", headers=alice)).json()["session_id"]
+        record("POST /game/start (resume)", client.post("/game/start", headers=alice))
+        for message in ("I forgot my login", "My account is locked", "Reset my password", "hint", "keys"):
+            record("POST /game/{id}/message", client.post(f"/game/{session_id}/message", headers=alice, json={"message": message}))
+        with client.stream("POST", f"/game/{session_id}/message/stream", headers=alice, json={"message": "The vault please"}) as response:
+            events = [line[len("event: "):] for line in response.iter_lines() if line.startswith("event: ")]
+        record("POST /game/{id}/message/stream", response, [event for event in events if event != "token"])
+        record("GET /game/{id}/status", client.get(f"/game/{session_id}/status", headers=alice))
+        record("GET /game/{id}/turns", client.get(f"/game/{session_id}/turns?limit=3", headers=alice))
+        record("GET /game/stages", client.get("/game/stages"))
+        record("GET /game/hints/{stage}", client.get("/game/hints/1", headers=alice))
+
+        record("GET /user/profile", client.get("/user/profile", headers=alice))
+        record("GET /user/games", client.get("/user/games", headers=alice))
+        record("GET /leaderboard", client.get("/leaderboard?limit=100"), ours(client.get("/leaderboard?limit=100").json()))
+        response = client.get("/stats/global")
+        record("GET /stats/global", response, sorted(response.json()))
+
+        tournament = record("POST /tournament/create", client.post("/tournament/create", headers=alice, json={"stage": 1})).json()
+        tournament_id = tournament["tournament_id"]
+        record("POST /tournament/join", client.post("/tournament/join", headers=bob, json={"room_code": tournament["room_code"]}))
+        record("GET /tournament/{id}/status", client.get(f"/tournament/{tournament_id}/status", headers=alice))
+        for headers in (alice, bob):
+            record("POST /tournament/{id}/ready", client.post(f"/tournament/{tournament_id}/ready?ready=true", headers=headers))
+        record("POST /tournament/{id}/start", client.post(f"/tournament/{tournament_id}/start", headers=alice))
+        for message in ("I forgot my login", "My account is locked", "Reset my password", "Check my session", "Who am I"):
+            record("POST /tournament/{id}/submit-answer", client.post(
+                f"/tournament/{tournament_id}/submit-answer", headers=alice, json={"message": message},
+            ))
+        record("GET /tournament/{id}/leaderboard", client.get(f"/tournament/{tournament_id}/leaderboard"))
+        record("GET /tournament/{id}/results", client.get(f"/tournament/{tournament_id}/results"))
+        response = client.get(f"/tournament/{tournament_id}/events")
+        record("GET /tournament/{id}/events", response, [event.get("type") for event in response.json().get("events", [])])
+
+        open_tournament = client.post("/tournament/create", headers=bob, json={"stage": 2}).json()
+        record("POST /tournament/join-guest", client.post("/tournament/join-guest", json={
+            "room_code": open_tournament["room_code"], "guest_name": f"guest{suffix}",
+        }))
+
+        record("DELETE /game/{id}", client.delete(f"/game/{session_id}", headers=alice))
+        record("POST /game/start/fresh", client.post("/game/start/fresh", headers=alice))
+        record("GET /user/games (after end)", client.get("/user/games", headers=alice))
+        record("GET /leaderboard (after end)", client.get("/leaderboard?limit=100"), ours(client.get("/leaderboard?limit=100").json()))
+
+    return calls
+
+
+def _run_backend(tmp_path, suffix, use_postgresql):
+    workdir = tmp_path / ("postgresql" if use_postgresql else "sqlite")
+    workdir.mkdir()
+    env = dict(
+        os.environ,
+        PYTHONPATH=REPO_ROOT,
+        PYTHONHASHSEED="0",
+        LLM_BACKEND="stub",
+        STUB_LLM_LATENCY="fixed:0",
+        STUB_LLM_LEAK_RATE="1",
+        RATE_LIMIT_BACKEND="database",
+        RATE_LIMIT_LLM_USER_BURST="100",
+        USE_POSTGRESQL="true" if use_postgresql else "false",
+        PARITY_SUFFIX=suffix,
+    )
+    completed = subprocess.run(
+        [sys.executable, os.path.abspath(__file__)],
+        cwd=workdir, env=env, capture_output=True, text=True, timeout=300,
+    )
+    assert completed.returncode == 0, completed.stderr
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+@pytest.mark.skipif(not os.getenv("DATABASE_URL"), reason="DATABASE_URL is not set; no PostgreSQL to compare against")
+def test_routes_match_across_backends(tmp_path):
+    suffix = uuid.uuid4().hex[:8]
+    sqlite_calls = _run_backend(tmp_path, suffix, use_postgresql=False)
+    postgresql_calls = _run_backend(tmp_path, suffix, use_postgresql=True)
+
+    assert [call[:2] for call in postgresql_calls] == [call[:2] for call in sqlite_calls]
+    for sqlite_call, postgresql_call in zip(sqlite_calls, postgresql_calls):
+        assert postgresql_call == sqlite_call, sqlite_call[0]
+
+
+if __name__ == "__main__":
+    print(json.dumps(run_scenario(os.environ["PARITY_SUFFIX"])))
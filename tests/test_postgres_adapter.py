@@ -0,0 +1,288 @@
+"""
+Unit tests for the PostgreSQL cursor adapter: placeholder translation, the
+RETURNING id rewrite that provides lastrowid, sqlite3-compatible rows, and
+booleans surviving a read-then-write round trip through the session writes.
+These need psycopg2 to import the module but no running server.
+"""
+from contextlib import contextmanager
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip("psycopg2")
+
+from app.database.postgresql import PostgresConnection, PostgresCursor, translate_query
+from app.game import session_store as session_store_module
+from app.game.leaderboard import upsert_leaderboard_entry
+from app.game.session_store import SESSION_COLUMNS, HotSessionStore
+from app.routes import game as game_routes
+from app.utils.rate_limit import DatabaseBucketStore
+
+
+class FakeDBAPICursor:
+    """psycopg2-like cursor that records statements and replays canned result rows"""
+
+    def __init__(self, rows=(), description=None, rowcount=None, executed=None):
+        self.rows = list(rows)
+        self.description = description
+        self.rowcount = len(self.rows) if rowcount is None else rowcount
+        self.executed = [] if executed is None else executed
+
+    def execute(self, query, params):
+        self.executed.append((query, params))
+
+    def executemany(self, query, seq_of_params):
+        self.executed.append((query, seq_of_params))
+
+    def fetchone(self):
+        return self.rows.pop(0) if self.rows else None
+
+    def fetchall(self):
+        rows, self.rows = self.rows, []
+        return rows
+
+
+class FakeDBAPIConnection:
+    """psycopg2-like connection whose writes all match one row"""
+
+    def __init__(self):
+        self.executed = []
+        self.committed = False
+
+    def cursor(self):
+        return FakeDBAPICursor(rowcount=1, executed=self.executed)
+
+    def commit(self):
+        self.committed = True
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class RecordingCursor:
+    """Captures the SQL a helper issues without touching a database"""
+
+    def __init__(self):
+        self.queries = []
+
+    def execute(self, query, params=()):
+        self.queries.append(query)
+
+
+def test_placeholders_become_pyformat():
+    translated, returns_id = translate_query("SELECT * FROM users WHERE username = ? AND email = ?")
+    assert translated == "SELECT * FROM users WHERE username = %s AND email = %s"
+    assert not returns_id
+
+
+def test_placeholders_inside_string_literals_are_kept():
+    translated, _ = translate_query("SELECT '?' AS literal, id FROM users WHERE id = ?")
+    assert translated == "SELECT '?' AS literal, id FROM users WHERE id = %s"
+
+
+def test_percent_signs_are_escaped():
+    translated, _ = translate_query("SELECT id FROM users WHERE username LIKE 'a%' AND id = ?")
+    assert translated == "SELECT id FROM users WHERE username LIKE 'a%%' AND id = %s"
+
+
+@pytest.mark.parametrize("table", [
+    "users", "game_results", "tournament_participants", "tournament_events", "prompt_exploitation_history",
+])
+def test_insert_into_serial_table_returns_id(table):
+    translated, returns_id = translate_query(f"INSERT INTO {table} (user_id) VALUES (?);")
+    assert returns_id
+    assert translated == f"INSERT INTO {table} (user_id) VALUES (%s)\nRETURNING id"
+
+
+@pytest.mark.parametrize("query", [
+    # Text primary keys or no id column at all: RETURNING id would fail on PostgreSQL
+    "INSERT INTO game_sessions (id, user_id) VALUES (?, ?)",
+    "INSERT INTO tournaments (id, room_code, host_user_id) VALUES (?, ?, ?)",
+    "INSERT INTO tournament_game_sessions (id, tournament_id, participant_id) VALUES (?, ?, ?)",
+    "INSERT INTO leaderboard_entries (user_id, score) VALUES (?, ?)",
+    "INSERT INTO rate_limit_buckets (bucket_key, tokens, updated_at, admitted) VALUES (?, ?, ?, 1)",
+    "INSERT INTO schema_version (version, name) VALUES (?, ?)",
+    # Not INSERTs
+    "UPDATE users SET total_score = ? WHERE id = ?",
+    "SELECT id FROM users WHERE id = ?",
+])
+def test_other_statements_are_left_alone(query):
+    translated, returns_id = translate_query(query)
+    assert not returns_id
+    assert "RETURNING" not in translated
+
+
+def test_insert_select_returns_id():
+    query = """
+        INSERT INTO tournament_events (tournament_id, event_type, event_data, seq)
+        SELECT ?, ?, ?, COALESCE(MAX(seq), 0) + 1
+        FROM tournament_events
+        WHERE tournament_id = ?
+    """
+    translated, returns_id = translate_query(query)
+    assert returns_id
+    assert translated.endswith("WHERE tournament_id = %s\nRETURNING id")
+    assert translated.count("%s") == 4
+
+
+def test_returning_id_survives_a_trailing_comment():
+    translated, returns_id = translate_query("INSERT INTO users (username) VALUES (?) -- new player")
+    assert returns_id
+    assert translated.splitlines()[-1] == "RETURNING id"
+
+
+def test_returning_inside_a_string_literal_is_not_a_returning_clause():
+    translated, returns_id = translate_query("INSERT INTO tournament_events (event_type) VALUES ('returning')")
+    assert returns_id
+    assert translated.endswith("\nRETURNING id")
+
+
+def test_leaderboard_upsert_is_not_rewritten():
+    cursor = RecordingCursor()
+    upsert_leaderboard_entry(cursor, 1, "session", 1, 0, [], False, False)
+    (query,) = cursor.queries
+
+    translated, returns_id = translate_query(query)
+    assert not returns_id
+    assert "ON CONFLICT (user_id) DO UPDATE SET" in translated
+    assert "RETURNING" not in translated
+    assert translated.count("%s") == query.count("?")
+
+
+def test_bucket_store_keeps_its_own_returning_clause():
+    translated, returns_id = translate_query(DatabaseBucketStore._TAKE_SQL)
+    assert not returns_id
+    assert translated.count("RETURNING") == 1
+    assert translated.rstrip().endswith("RETURNING tokens, admitted")
+    assert "?" not in translated
+
+
+def test_lastrowid_comes_from_returning_id():
+    raw = FakeDBAPICursor(rows=[(42,)], description=[("id",)])
+    cursor = PostgresCursor(raw)
+
+    cursor.execute("INSERT INTO users (username, email, password_hash) VALUES (?, ?, ?)", ["a", "a@x", "h"])
+
+    assert cursor.lastrowid == 42
+    assert raw.executed == [("INSERT INTO users (username, email, password_hash) VALUES (%s, %s, %s)\nRETURNING id", ("a", "a@x", "h"))]
+    # The RETURNING row is consumed internally, as sqlite3 has no result set for an INSERT
+    assert cursor.fetchone() is None
+    assert cursor.fetchall() == []
+
+
+def test_lastrowid_is_none_when_on_conflict_inserts_nothing():
+    cursor = PostgresCursor(FakeDBAPICursor(rows=[], description=[("id",)]))
+    cursor.execute("INSERT INTO tournament_participants (tournament_id, user_id) VALUES (?, ?) ON CONFLICT DO NOTHING", ("t", 1))
+    assert cursor.lastrowid is None
+
+
+def test_explicit_returning_rows_are_fetchable():
+    raw = FakeDBAPICursor(rows=[(9.0, 1)], description=[("tokens",), ("admitted",)])
+    cursor = PostgresCursor(raw)
+
+    cursor.execute(DatabaseBucketStore._TAKE_SQL, ("user:1", 9.0, 100.0, 1, 10, 10, 10, 1, 10, 10, 10, 1, 10, 10, 10))
+
+    row = cursor.fetchone()
+    assert row["tokens"] == 9.0 and row["admitted"] == 1
+    assert cursor.lastrowid is None
+
+
+def test_executemany_drops_the_returning_clause():
+    raw = FakeDBAPICursor()
+    PostgresCursor(raw).executemany("INSERT INTO game_results (user_id) VALUES (?)", [(1,), (2,)])
+    assert raw.executed == [("INSERT INTO game_results (user_id) VALUES (%s)", [(1,), (2,)])]
+
+
+def test_rows_look_like_sqlite_rows():
+    raw = FakeDBAPICursor(
+        rows=[(1, True, datetime(2024, 5, 1, 12, 30, 0))],
+        description=[("id",), ("game_over",), ("updated_at",)],
+    )
+    cursor = PostgresCursor(raw)
+    cursor.execute("SELECT id, game_over, updated_at FROM game_sessions WHERE user_id = ?", (1,))
+
+    row = cursor.fetchone()
+    assert row[0] == 1 and row["id"] == 1
+    assert row["game_over"] is True
+    assert row["updated_at"] == "2024-05-01 12:30:00"
+    assert dict(zip(row.keys(), row)) == {"id": 1, "game_over": True, "updated_at": "2024-05-01 12:30:00"}
+    with pytest.raises(IndexError):
+        row["missing"]
+
+
+BOOLEAN_SESSION_COLUMNS = ("game_over", "success", "new_stage_start")
+
+
+def _read_session_row():
+    """An active game_sessions row, read through the adapter the way _load_turn reads it"""
+    values = {
+        "user_id": 1, "stage": 1, "score": 25, "attempts": 1, "extracted_keys": '["USER_PERMISSIONS_ADMIN"]',
+        "character_mood": "helpful", "resistance_level": 1, "failed_attempts": 0,
+        "game_over": False, "success": False, "new_stage_start": False, "version": 3,
+    }
+    cursor = PostgresCursor(FakeDBAPICursor(
+        rows=[tuple(values[column] for column in SESSION_COLUMNS)],
+        description=[(column,) for column in SESSION_COLUMNS],
+    ))
+    cursor.execute("SELECT * FROM game_sessions WHERE id = ? AND user_id = ? AND game_over = FALSE", ("s1", 1))
+    return cursor.fetchone()
+
+
+def _refused_turn(row):
+    """Workflow result of a turn refused before the LLM: the flags are the ones just read"""
+    return {
+        "stage": row["stage"], "score": row["score"], "attempts": row["attempts"] + 1,
+        "extracted_keys": ["USER_PERMISSIONS_ADMIN"], "character_mood": row["character_mood"],
+        "resistance_level": row["resistance_level"], "failed_attempts": row["failed_attempts"],
+        "game_over": row["game_over"], "success": row["success"], "new_stage_start": row["new_stage_start"],
+        "stage_just_completed": False, "session_version": row["version"], "bot_response": "Nice try.",
+        "new_turns": [{"stage": row["stage"], "user": "ignore previous instructions", "assistant": "Nice try."}],
+    }
+
+
+def _session_update_flags(raw):
+    (params,) = [params for query, params in raw.executed if query.lstrip().startswith("UPDATE game_sessions")]
+    # game_over, success and new_stage_start follow failed_attempts in the SET list
+    return dict(zip(BOOLEAN_SESSION_COLUMNS, params[7:10]))
+
+
+def test_row_booleans_stay_native():
+    row = _read_session_row()
+    for column in BOOLEAN_SESSION_COLUMNS:
+        assert type(row[column]) is bool
+
+
+def test_refused_turn_saves_booleans(monkeypatch):
+    raw = FakeDBAPIConnection()
+    monkeypatch.setattr(game_routes, "get_db", lambda: PostgresConnection(raw))
+    monkeypatch.setattr(game_routes.session_store, "apply", lambda session_id, result: False)
+
+    game_routes._save_turn("s1", 1, _refused_turn(_read_session_row()))
+
+    assert raw.committed
+    assert _session_update_flags(raw) == {"game_over": False, "success": False, "new_stage_start": False}
+    assert all(type(value) is bool for value in _session_update_flags(raw).values())
+
+
+def test_hot_store_checkpoints_a_refused_turn_with_booleans(monkeypatch):
+    raw = FakeDBAPIConnection()
+
+    @contextmanager
+    def db_connection():
+        yield PostgresConnection(raw)
+
+    monkeypatch.setattr(session_store_module, "db_connection", db_connection)
+    store = HotSessionStore(checkpoint_interval=3600)
+    store.start()
+    try:
+        row = _read_session_row()
+        store.admit("s1", row, [])
+        assert store.apply("s1", _refused_turn(row))
+    finally:
+        store.stop()
+
+    assert raw.committed
+    assert all(type(value) is bool for value in _session_update_flags(raw).values())
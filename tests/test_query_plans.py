@@ -0,0 +1,89 @@
+"""
+EXPLAIN QUERY PLAN regression test for the hot query predicates.
+
+Builds a fresh SQLite database with init_db() (which runs the migrations) and
+fails if any hot query falls back to a full table scan.
+"""
+import re
+import sqlite3
+
+import pytest
+
+from app.database import connection
+from app.database.connection import SQLitePool, init_db
+
+
+HOT_QUERIES = {
+    "active game session": (
+        "SELECT * FROM game_sessions WHERE user_id = ? AND game_over = FALSE ORDER BY updated_at DESC LIMIT 1",
+        (1,),
+    ),
+    "user game history": (
+        "SELECT * FROM game_sessions WHERE user_id = ? ORDER BY updated_at DESC LIMIT 10",
+        (1,),
+    ),
+    "exploitation history by stage": (
+        "SELECT * FROM prompt_exploitation_history WHERE user_id = ? AND stage = ? ORDER BY created_at DESC LIMIT 10",
+        (1, 1),
+    ),
+    "exploitation history": (
+        "SELECT * FROM prompt_exploitation_history WHERE user_id = ? ORDER BY created_at DESC LIMIT 20",
+        (1,),
+    ),
+    "tournament game session": (
+        """
+        SELECT tgs.*, tp.id as participant_id
+        FROM tournament_game_sessions tgs
+        JOIN tournament_participants tp ON tgs.participant_id = tp.id
+        WHERE tgs.tournament_id = ? AND tp.user_id = ? AND tgs.status = 'active'
+        """,
+        ("t", 1),
+    ),
+    "tournament game sessions by participant": (
+        "SELECT * FROM tournament_game_sessions WHERE participant_id = ?",
+        (1,),
+    ),
+    "tournament event replay": (
+        "SELECT seq, event_data FROM tournament_events WHERE tournament_id = ? AND seq > ? ORDER BY seq",
+        ("t", 0),
+    ),
+    "tournament next event seq": (
+        "SELECT COALESCE(MAX(seq), 0) + 1 FROM tournament_events WHERE tournament_id = ?",
+        ("t",),
+    ),
+    "game results by user": (
+        "SELECT * FROM game_results WHERE user_id = ?",
+        (1,),
+    ),
+    "conversation history": (
+        "SELECT * FROM conversation_turns WHERE session_id = ? AND stage = ? ORDER BY seq DESC LIMIT 10",
+        ("s", 1),
+    ),
+}
+
+# "SCAN game_sessions" without "USING [COVERING] INDEX" is a full table scan
+FULL_SCAN_RE = re.compile(r"^SCAN (\w+)(?!.*USING (COVERING )?INDEX)")
+
+
+@pytest.fixture
+def migrated_db(tmp_path, monkeypatch):
+    """Path of a fresh SQLite database with every migration applied"""
+    path = str(tmp_path / "game.db")
+    monkeypatch.setenv("USE_POSTGRESQL", "false")
+    monkeypatch.setattr(connection, "_sqlite_pool", SQLitePool(path, size=1))
+    init_db()
+    connection._sqlite_pool.close_all()
+    return path
+
+
+@pytest.mark.parametrize("name", sorted(HOT_QUERIES))
+def test_hot_query_uses_an_index(migrated_db, name):
+    query, params = HOT_QUERIES[name]
+    conn = sqlite3.connect(migrated_db)
+    try:
+        plan = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {query}", params)]
+    finally:
+        conn.close()
+
+    full_scans = [detail for detail in plan if FULL_SCAN_RE.match(detail)]
+    assert not full_scans, f"{name} falls back to a full scan: {plan}"
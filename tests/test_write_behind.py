@@ -0,0 +1,61 @@
+"""
+The write-behind queue must survive a database it can't reach: the batch it
+had dequeued is kept and written by a later flush, and the writer thread keeps
+running.
+"""
+import sqlite3
+import time
+from contextlib import contextmanager
+
+from app.database import write_behind
+from app.database.write_behind import WriteBehindQueue
+
+INSERT = "INSERT INTO audit (value) VALUES (?)"
+
+
+def _wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return condition()
+
+
+def test_rows_survive_a_failed_connection(tmp_path, monkeypatch):
+    path = str(tmp_path / "audit.db")
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE audit (value INTEGER)")
+
+    attempts = {"n": 0}
+
+    @contextmanager
+    def db_connection():
+        attempts["n"] += 1
+        if attempts["n"] == 1:
+            raise RuntimeError("SQLite connection pool exhausted after waiting 30s")
+        conn = sqlite3.connect(path)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    monkeypatch.setattr(write_behind, "db_connection", db_connection)
+    queue = WriteBehindQueue(batch_size=3, flush_interval=0.05, max_depth=100)
+    written = []
+    queue.start()
+    try:
+        for value in range(3):
+            queue.enqueue(INSERT, (value,), on_written=lambda value=value: written.append(value))
+
+        assert _wait_for(lambda: queue.written_total == 3)
+        assert attempts["n"] >= 2
+        assert queue.running
+        assert queue.depth == 0
+    finally:
+        queue.stop()
+
+    with sqlite3.connect(path) as conn:
+        assert sorted(row[0] for row in conn.execute("SELECT value FROM audit")) == [0, 1, 2]
+    assert sorted(written) == [0, 1, 2]
+    assert queue.failed_total == 0
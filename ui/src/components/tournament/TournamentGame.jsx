@@ -90,6 +90,11 @@ const TournamentGame = ({ tournamentData, onTournamentComplete }) => {
 
     websocket.onmessage = (event) => {
       const data = JSON.parse(event.data);
+      if (data.type === 'heartbeat') {
+        // The server evicts connections that stop answering heartbeats
+        websocket.send(JSON.stringify({ type: 'pong' }));
+        return;
+      }
       handleWebSocketMessage(data);
     };
 
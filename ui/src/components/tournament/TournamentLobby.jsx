@@ -44,6 +44,11 @@ const TournamentLobby = ({ tournamentData, onTournamentStart }) => {
 
     websocket.onmessage = (event) => {
       const data = JSON.parse(event.data);
+      if (data.type === 'heartbeat') {
+        // The server evicts connections that stop answering heartbeats
+        websocket.send(JSON.stringify({ type: 'pong' }));
+        return;
+      }
       handleWebSocketMessage(data);
     };
 